@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK DE CONSULTAS - DATAMARTS EMPRESA MOLINERA
+Mide el lado de lectura de los esquemas estrella con las consultas BI del
+catálogo de datamart_queries.py (ventas por mes/producto/geografía, margen por
+canal, cobertura de stock, envíos a tiempo, rendimiento por línea/turno...).
+
+Para cada factor de escala se preparan copias de los datamarts con las tablas
+de hechos replicadas N veces (claves desplazadas, mismas dimensiones y mismo
+perfil de servicio) y se informa, por consulta:
+
+- latencia p50/p95/p99 y media sobre varias repeticiones (tras calentamiento)
+- filas escaneadas según EXPLAIN QUERY PLAN (tablas recorridas con SCAN) y
+  búsquedas por índice
+- el plan de ejecución, para ver qué cambió cuando cambian los números
+
+El JSON de salida incluye el commit, versión de SQLite y máquina, y `--compare`
+lo contrasta con un resultado anterior, de modo que los cambios de índices o de
+layout se evalúan entre commits con el mismo procedimiento.
+
+Uso:
+    python3 scripts/benchmark_datamarts.py --escalas 1 5 10 --salida bench.json
+    python3 scripts/benchmark_datamarts.py --escalas 1 5 10 --compare bench_base.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+from build_profiler import git_commit
+from datamart_pool import apply_serving_profile
+from datamart_queries import CONSULTAS, DATAMARTS, DBS_DIR, SQLiteBackend, run_query
+from fact_partitions import list_partitions
+
+logger = logging.getLogger(__name__)
+
+# Alias de tabla en FROM/JOIN (el plan muestra el alias, no la tabla)
+_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)', re.IGNORECASE)
+_PASO_PLAN = re.compile(r'^(SCAN|SEARCH)\s+(\w+)')
+_PALABRAS_RESERVADAS = {'ON', 'WHERE', 'GROUP', 'ORDER', 'JOIN', 'LEFT', 'INNER', 'USING'}
+
+
+def scale_datamart(origen: str, destino: str, factor: int) -> Dict[str, int]:
+    """Copiar un datamart replicando `factor` veces las filas de sus tablas de hechos
+
+    Sólo se replican las tablas FACT_* con clave primaria entera simple (los
+    snapshots agregados se dejan igual). Las particiones de una misma tabla
+    lógica se desplazan por el máximo global de la tabla, para que las claves
+    sigan siendo únicas entre particiones. Los triggers de sólo lectura de las
+    particiones se eliminan en la copia.
+    """
+    shutil.copyfile(origen, destino)
+    conn = sqlite3.connect(destino, isolation_level=None)
+    filas = {}
+    try:
+        conn.execute("PRAGMA journal_mode = DELETE")
+        for (trigger,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%solo_lectura'"
+        ).fetchall():
+            conn.execute(f'DROP TRIGGER "{trigger}"')
+
+        tablas = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'FACT\\_%' ESCAPE '\\'"
+        ).fetchall()]
+        logica = {p['particion']: p['tabla'] for p in list_partitions(conn)}
+        replicables = {}
+        maximos: Dict[str, int] = {}
+        for tabla in tablas:
+            info = list(conn.execute(f'PRAGMA table_info("{tabla}")'))
+            claves = [c for c in info if c[5]]
+            if len(claves) != 1 or (claves[0][2] or '').upper() != 'INTEGER':
+                continue
+            replicables[tabla] = (claves[0][1], info)
+            maximo = conn.execute(f'SELECT MAX("{claves[0][1]}") FROM "{tabla}"').fetchone()[0] or 0
+            grupo = logica.get(tabla, tabla)
+            maximos[grupo] = max(maximos.get(grupo, 0), maximo)
+
+        conn.execute("BEGIN")
+        for tabla, (clave, info) in replicables.items():
+            resto = [c[1] for c in info if c[1] != clave]
+            maximo = maximos[logica.get(tabla, tabla)]
+            lista = ', '.join(f'"{c}"' for c in resto)
+            for k in range(1, factor):
+                conn.execute(
+                    f'INSERT INTO "{tabla}" ("{clave}", {lista}) '
+                    f'SELECT "{clave}" + ?, {lista} FROM "{tabla}" WHERE "{clave}" <= ?',
+                    (k * maximo, maximo)
+                )
+            filas[tabla] = conn.execute(f'SELECT COUNT(*) FROM "{tabla}"').fetchone()[0]
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    apply_serving_profile(destino)
+    return filas
+
+
+def prepare_scales(dbs_dir: str, escalas: Sequence[int], trabajo: str) -> Dict[int, str]:
+    """Directorio de datamarts por factor de escala (1 usa los originales)"""
+    directorios = {}
+    for factor in escalas:
+        if factor == 1:
+            directorios[factor] = dbs_dir
+            continue
+        destino = os.path.join(trabajo, f'escala_{factor}')
+        os.makedirs(destino, exist_ok=True)
+        for archivo in DATAMARTS.values():
+            inicio = time.perf_counter()
+            scale_datamart(os.path.join(dbs_dir, archivo), os.path.join(destino, archivo), factor)
+            logger.info(f"📈 {archivo} x{factor} preparado en {time.perf_counter() - inicio:.1f} s")
+        directorios[factor] = destino
+    return directorios
+
+
+class PlanInspector:
+    """Filas escaneadas estimadas a partir de EXPLAIN QUERY PLAN"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.objetos = {r[0]: r[1] for r in conn.execute("SELECT name, type FROM sqlite_master")}
+        self._conteos: Dict[str, int] = {}
+
+    def _filas(self, tabla: str) -> int:
+        if tabla not in self._conteos:
+            self._conteos[tabla] = self.conn.execute(f'SELECT COUNT(*) FROM "{tabla}"').fetchone()[0]
+        return self._conteos[tabla]
+
+    def inspect(self, sql: str, params: Sequence = ()) -> Dict:
+        alias = {
+            a: t for t, a in _ALIAS.findall(sql) if a.upper() not in _PALABRAS_RESERVADAS
+        }
+        plan = [fila[3] for fila in self.conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        escaneadas = 0
+        busquedas = []
+        for paso in plan:
+            coincidencia = _PASO_PLAN.match(paso)
+            if not coincidencia:
+                continue
+            nombre = coincidencia.group(2)
+            tabla = nombre if nombre in self.objetos else alias.get(nombre, nombre)
+            if self.objetos.get(tabla) != 'table':
+                # Subconsultas materializadas o vistas: sus tablas aparecen en otros pasos
+                continue
+            if coincidencia.group(1) == 'SCAN':
+                escaneadas += self._filas(tabla)
+            else:
+                busquedas.append(tabla)
+        return {'filas_escaneadas': escaneadas, 'busquedas_indice': busquedas, 'plan': plan}
+
+
+def percentiles(tiempos: List[float]) -> Dict[str, float]:
+    if len(tiempos) == 1:
+        p50 = p95 = p99 = tiempos[0]
+    else:
+        cortes = statistics.quantiles(tiempos, n=100, method='inclusive')
+        p50, p95, p99 = cortes[49], cortes[94], cortes[98]
+    return {
+        'p50_ms': round(p50 * 1000, 4),
+        'p95_ms': round(p95 * 1000, 4),
+        'p99_ms': round(p99 * 1000, 4),
+        'media_ms': round(statistics.fmean(tiempos) * 1000, 4),
+    }
+
+
+def run_benchmark(directorios: Dict[int, str], nombres: Sequence[str], repeticiones: int,
+                  calentamiento: int = 2) -> Dict:
+    """Medir cada consulta en cada factor de escala"""
+    escalas = {}
+    for factor, dbs_dir in sorted(directorios.items()):
+        backend = SQLiteBackend(dbs_dir)
+        inspectores = {}
+        consultas = {}
+        try:
+            for nombre in nombres:
+                datamart = CONSULTAS[nombre]['datamart']
+                if datamart not in inspectores:
+                    inspectores[datamart] = PlanInspector(backend._conn(datamart))
+                for _ in range(calentamiento):
+                    run_query(backend, nombre)
+                tiempos = []
+                for _ in range(repeticiones):
+                    inicio = time.perf_counter()
+                    _, filas = run_query(backend, nombre)
+                    tiempos.append(time.perf_counter() - inicio)
+                consultas[nombre] = {
+                    'datamart': datamart,
+                    'filas_resultado': len(filas),
+                    **percentiles(tiempos),
+                    **inspectores[datamart].inspect(CONSULTAS[nombre]['sql']),
+                }
+        finally:
+            backend.close()
+        filas_hechos = {}
+        for datamart, archivo in DATAMARTS.items():
+            conn = sqlite3.connect(os.path.join(dbs_dir, archivo))
+            try:
+                for (tabla,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+                    "AND name LIKE 'FACT\\_%' ESCAPE '\\' AND name NOT GLOB '*_[0-9]*'"
+                ).fetchall():
+                    filas_hechos[tabla] = conn.execute(f'SELECT COUNT(*) FROM "{tabla}"').fetchone()[0]
+            finally:
+                conn.close()
+        escalas[str(factor)] = {'filas_hechos': filas_hechos, 'consultas': consultas}
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'maquina': f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPU)",
+        'repeticiones': repeticiones,
+        'escalas': escalas,
+    }
+
+
+def compare(actual: Dict, base: Dict) -> List[Dict]:
+    """Cambios de latencia y filas escaneadas respecto a un resultado anterior"""
+    filas = []
+    for factor, datos in actual['escalas'].items():
+        previas = base.get('escalas', {}).get(factor, {}).get('consultas', {})
+        for nombre, medida in datos['consultas'].items():
+            previa = previas.get(nombre)
+            if previa is None:
+                continue
+            filas.append({
+                'escala': factor,
+                'consulta': nombre,
+                'p50_base_ms': previa['p50_ms'],
+                'p50_ms': medida['p50_ms'],
+                'p95_base_ms': previa['p95_ms'],
+                'p95_ms': medida['p95_ms'],
+                'razon_p50': medida['p50_ms'] / previa['p50_ms'] if previa['p50_ms'] else float('inf'),
+                'filas_escaneadas_base': previa['filas_escaneadas'],
+                'filas_escaneadas': medida['filas_escaneadas'],
+                'plan_cambio': previa.get('plan') != medida.get('plan'),
+            })
+    return filas
+
+
+def _imprimir(resultado: Dict):
+    print(f"📊 commit {resultado['commit'] or '?'} · SQLite {resultado['sqlite']} · {resultado['maquina']} · "
+          f"{resultado['repeticiones']} repeticiones")
+    print(f"{'escala':>6} {'consulta':32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'escaneadas':>11}")
+    for factor, datos in resultado['escalas'].items():
+        for nombre, m in datos['consultas'].items():
+            print(f"{factor:>6} {nombre:32} {m['p50_ms']:9.3f} {m['p95_ms']:9.3f} {m['p99_ms']:9.3f} "
+                  f"{m['filas_escaneadas']:11d}")
+
+
+def _imprimir_comparacion(filas: List[Dict], base: Dict):
+    print(f"\n🔍 Comparación con commit {base.get('commit') or '?'} ({base.get('fecha', '?')})")
+    print(f"{'escala':>6} {'consulta':32} {'p50 base':>9} {'p50':>9} {'razón':>7} {'escaneadas':>21}  plan")
+    for f in filas:
+        escaneadas = f"{f['filas_escaneadas_base']} → {f['filas_escaneadas']}"
+        print(f"{f['escala']:>6} {f['consulta']:32} {f['p50_base_ms']:9.3f} {f['p50_ms']:9.3f} "
+              f"{f['razon_p50']:6.2f}x {escaneadas:>21}  {'CAMBIÓ' if f['plan_cambio'] else 'igual'}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Benchmark de consultas BI sobre los datamarts')
+    parser.add_argument('--dbs', default=DBS_DIR, help='Directorio con los archivos datamart_*.db')
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 5, 10],
+                        help='Factores de escala de las tablas de hechos')
+    parser.add_argument('--repeticiones', type=int, default=30)
+    parser.add_argument('--consultas', nargs='*', help='Consultas del catálogo (por defecto todas)')
+    parser.add_argument('--salida', default='benchmark_datamarts.json', help='Archivo JSON de resultados')
+    parser.add_argument('--compare', metavar='JSON', help='Resultado anterior con el que comparar')
+    parser.add_argument('--trabajo', help='Directorio para las copias escaladas (por defecto temporal)')
+    args = parser.parse_args()
+
+    nombres = args.consultas or list(CONSULTAS)
+    trabajo = args.trabajo or tempfile.mkdtemp(prefix='bench_datamarts_')
+    try:
+        directorios = prepare_scales(args.dbs, args.escalas, trabajo)
+        resultado = run_benchmark(directorios, nombres, args.repeticiones)
+    finally:
+        if not args.trabajo:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    _imprimir(resultado)
+    logger.info(f"💾 Resultados guardados en {args.salida}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        _imprimir_comparacion(compare(resultado, base), base)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+ÍNDICES BITMAP - DATAMARTS EMPRESA MOLINERA
+Índices bitmap comprimidos para atributos de baja cardinalidad de las tablas de
+hechos (canal, moneda, estado de venta, estado de envío, turno, calidad...).
+
+Cada valor distinto de una columna indexada tiene un bitmap donde el bit N está
+encendido si la fila con clave primaria N tiene ese valor. Los bitmaps se
+guardan comprimidos (zlib) en un archivo junto al datamart
+(`datamart_ventas.db` -> `datamart_ventas.db.bitmaps`) y en memoria se operan
+como enteros de Python, de modo que un filtro con varios predicados se resuelve
+con AND/OR de bits antes de leer ninguna fila.
+
+Uso:
+    python3 scripts/bitmap_index.py build dbs/datamart_ventas.db
+    python3 scripts/bitmap_index.py query dbs/datamart_ventas.db \\
+        --filtro id_canal=1,2 --filtro moneda=USD
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import struct
+import sys
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columnas indexadas por tabla de hechos (todas con muy pocos valores distintos)
+COLUMNAS_BITMAP = {
+    'FACT_VENTAS': ['id_canal', 'moneda', 'estado_venta'],
+    'FACT_INVENTARIO': ['estado_stock'],
+    'FACT_DISTRIBUCION': ['id_estado_envio', 'entrega_completa', 'entrega_a_tiempo'],
+    'FACT_PRODUCCION': ['cumple_estandares_calidad', 'id_turno'],
+}
+
+SUFIJO_ARCHIVO = '.bitmaps'
+MAGIC = b'BMIX1\n'
+
+
+def bitmap_path(db_path: str) -> str:
+    """Ruta del archivo de bitmaps asociado a un datamart"""
+    return db_path + SUFIJO_ARCHIVO
+
+
+def _clave_primaria(conn, tabla: str) -> str:
+    columnas = list(conn.execute(f'PRAGMA table_info("{tabla}")'))
+    for col in columnas:
+        if col[5] == 1:
+            return col[1]
+    # Vistas y tablas sin PK declarada: se usa la primera columna
+    return columnas[0][1]
+
+
+def _bits_a_entero(posiciones: np.ndarray, tamaño: int) -> int:
+    bits = np.zeros(tamaño, dtype=bool)
+    bits[posiciones] = True
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+def _valor_nativo(valor):
+    """Convertir escalares NumPy/NaN a tipos nativos (serializables en JSON)"""
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    return valor.item() if hasattr(valor, 'item') else valor
+
+
+class BitmapIndex:
+    """Bitmaps por valor para las columnas indexadas de una tabla de hechos"""
+
+    def __init__(self, tabla: str, clave: str, num_filas: int,
+                 bitmaps: Optional[Dict[str, Dict[object, int]]] = None):
+        self.tabla = tabla
+        self.clave = clave
+        self.num_filas = num_filas
+        self.bitmaps = bitmaps or {}
+
+    @classmethod
+    def build(cls, conn, tabla: str, columnas: Sequence[str]) -> 'BitmapIndex':
+        """Construir los bitmaps con un solo recorrido de la tabla de hechos"""
+        clave = _clave_primaria(conn, tabla)
+        lista = ', '.join(f'"{c}"' for c in [clave, *columnas])
+        df = pd.read_sql_query(f'SELECT {lista} FROM "{tabla}"', conn)
+
+        indice = cls(tabla, clave, len(df))
+        if df.empty:
+            indice.bitmaps = {col: {} for col in columnas}
+            return indice
+
+        claves = df[clave].to_numpy(dtype=np.int64)
+        tamaño = int(claves.max()) + 1
+        for col in columnas:
+            codigos, valores = pd.factorize(df[col], use_na_sentinel=False)
+            indice.bitmaps[col] = {
+                _valor_nativo(valor): _bits_a_entero(claves[codigos == k], tamaño)
+                for k, valor in enumerate(valores)
+            }
+        return indice
+
+    def columnas(self) -> List[str]:
+        return list(self.bitmaps)
+
+    def bitmap(self, columna: str, valores) -> int:
+        """OR de los bitmaps de uno o varios valores de una columna"""
+        if columna not in self.bitmaps:
+            raise KeyError(f"{self.tabla}.{columna} no tiene índice bitmap")
+        if not isinstance(valores, (list, tuple, set, frozenset)):
+            valores = [valores]
+        resultado = 0
+        for valor in valores:
+            resultado |= self.bitmaps[columna].get(valor, 0)
+        return resultado
+
+    def filter(self, predicados: Dict[str, object]) -> int:
+        """AND entre columnas, OR entre valores de una misma columna"""
+        resultado = None
+        for columna, valores in predicados.items():
+            bits = self.bitmap(columna, valores)
+            resultado = bits if resultado is None else resultado & bits
+            if not resultado:
+                break
+        if resultado is None:
+            # Sin predicados: todas las filas indexadas
+            resultado = 0
+            for bits in next(iter(self.bitmaps.values()), {}).values():
+                resultado |= bits
+        return resultado
+
+    @staticmethod
+    def count(bitmap: int) -> int:
+        return bin(bitmap).count('1')
+
+    @staticmethod
+    def ids(bitmap: int) -> np.ndarray:
+        """Claves primarias de las filas seleccionadas por el bitmap"""
+        if not bitmap:
+            return np.empty(0, dtype=np.int64)
+        datos = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+        return np.nonzero(np.unpackbits(datos, bitorder='little'))[0].astype(np.int64)
+
+    def fetch(self, conn, bitmap: int, columnas: Sequence[str] = ('*',), lote: int = 900) -> Iterable[tuple]:
+        """Leer sólo las filas seleccionadas, por lotes de claves primarias"""
+        lista = ', '.join(columnas)
+        ids = self.ids(bitmap).tolist()
+        for inicio in range(0, len(ids), lote):
+            trozo = ids[inicio:inicio + lote]
+            marcas = ', '.join('?' * len(trozo))
+            yield from conn.execute(
+                f'SELECT {lista} FROM "{self.tabla}" WHERE "{self.clave}" IN ({marcas})', trozo
+            )
+
+
+class DatamartBitmaps:
+    """Conjunto de índices bitmap de un datamart, persistido junto al archivo .db"""
+
+    def __init__(self, indices: Optional[Dict[str, BitmapIndex]] = None):
+        self.indices = indices or {}
+
+    def __getitem__(self, tabla: str) -> BitmapIndex:
+        return self.indices[tabla]
+
+    @classmethod
+    def build(cls, db_path: str, columnas_por_tabla: Dict[str, List[str]] = None,
+              conectar: Callable[..., sqlite3.Connection] = sqlite3.connect) -> 'DatamartBitmaps':
+        columnas_por_tabla = columnas_por_tabla or COLUMNAS_BITMAP
+        conn = conectar(db_path)
+        try:
+            existentes = {r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+            )}
+            indices = {}
+            for tabla, columnas in columnas_por_tabla.items():
+                if tabla in existentes:
+                    indices[tabla] = BitmapIndex.build(conn, tabla, columnas)
+        finally:
+            conn.close()
+        return cls(indices)
+
+    def save(self, path: str):
+        """Escribir cabecera JSON + bitmaps comprimidos con zlib"""
+        directorio = []
+        bloques = []
+        desplazamiento = 0
+        for tabla, indice in self.indices.items():
+            entradas = []
+            for columna, por_valor in indice.bitmaps.items():
+                for valor, bits in por_valor.items():
+                    bloque = zlib.compress(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))
+                    entradas.append([columna, valor, desplazamiento, len(bloque)])
+                    bloques.append(bloque)
+                    desplazamiento += len(bloque)
+            directorio.append({
+                'tabla': tabla, 'clave': indice.clave, 'num_filas': indice.num_filas,
+                'columnas': indice.columnas(), 'bitmaps': entradas,
+            })
+
+        cabecera = json.dumps(directorio, ensure_ascii=False).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(cabecera)))
+            f.write(cabecera)
+            for bloque in bloques:
+                f.write(bloque)
+
+    @classmethod
+    def load(cls, path: str) -> 'DatamartBitmaps':
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Archivo de bitmaps inválido: {path}")
+            (largo,) = struct.unpack('<I', f.read(4))
+            directorio = json.loads(f.read(largo).decode('utf-8'))
+            datos = f.read()
+
+        indices = {}
+        for entrada in directorio:
+            bitmaps = {col: {} for col in entrada['columnas']}
+            for columna, valor, inicio, largo_bloque in entrada['bitmaps']:
+                crudo = zlib.decompress(datos[inicio:inicio + largo_bloque])
+                bitmaps[columna][valor] = int.from_bytes(crudo, 'little')
+            indices[entrada['tabla']] = BitmapIndex(
+                entrada['tabla'], entrada['clave'], entrada['num_filas'], bitmaps
+            )
+        return cls(indices)
+
+
+def build_datamart_bitmaps(db_path: str,
+                           conectar: Callable[..., sqlite3.Connection] = sqlite3.connect) -> Optional[str]:
+    """Construir y guardar los bitmaps de un datamart; devuelve la ruta escrita"""
+    bitmaps = DatamartBitmaps.build(db_path, conectar=conectar)
+    if not bitmaps.indices:
+        return None
+    destino = bitmap_path(db_path)
+    bitmaps.save(destino)
+    return destino
+
+
+def _parse_filtro(texto: str):
+    columna, _, valor = texto.partition('=')
+    valores = []
+    for v in valor.split(','):
+        try:
+            valores.append(int(v))
+        except ValueError:
+            valores.append(v)
+    return columna, valores
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Índices bitmap de los datamarts')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_build = sub.add_parser('build', help='Construir el archivo .bitmaps de un datamart')
+    p_build.add_argument('db_path')
+
+    p_query = sub.add_parser('query', help='Contar/listar filas que cumplen filtros')
+    p_query.add_argument('db_path')
+    p_query.add_argument('--tabla', help='Tabla de hechos (por defecto la única indexada)')
+    p_query.add_argument('--filtro', action='append', default=[], help='col=valor[,valor...]')
+    p_query.add_argument('--mostrar', type=int, default=0, help='Filas a mostrar')
+    args = parser.parse_args()
+
+    if args.comando == 'build':
+        destino = build_datamart_bitmaps(args.db_path)
+        if destino:
+            logger.info(f"🧷 Índices bitmap escritos en {destino}")
+        else:
+            logger.info("ℹ️  El datamart no tiene tablas de hechos con columnas indexables")
+        return 0
+
+    bitmaps = DatamartBitmaps.load(bitmap_path(args.db_path))
+    tabla = args.tabla or next(iter(bitmaps.indices))
+    indice = bitmaps[tabla]
+    seleccion = indice.filter(dict(_parse_filtro(f) for f in args.filtro))
+    print(f"{tabla}: {indice.count(seleccion)} de {indice.num_filas} filas cumplen el filtro")
+    if args.mostrar:
+        conn = sqlite3.connect(args.db_path)
+        try:
+            for i, fila in enumerate(indice.fetch(conn, seleccion)):
+                if i >= args.mostrar:
+                    break
+                print(fila)
+        finally:
+            conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
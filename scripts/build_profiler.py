@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+PERFILADO DE CONSTRUCCIÓN - EMPRESA MOLINERA
+Modo de perfilado para create_db_molinera.py y crear_datamarts.py (opción
+--profile). Por cada etapa de la construcción registra:
+
+- tiempo de reloj y de CPU
+- sentencias SQLite ejecutadas (todas, vía set_trace_callback) y tiempo pasado
+  en las llamadas execute/executemany/executescript de la conexión
+- filas escritas (total_changes de las conexiones registradas)
+- pico de memoria Python (tracemalloc)
+- las sentencias más repetidas, normalizadas sin literales, para detectar
+  consultas por fila (p.ej. un SELECT a DIM_TIEMPO por cada hecho)
+
+El resultado es un informe JSON y, opcionalmente, un volcado cProfile de la
+etapa más lenta (se abre con `python -m pstats archivo.prof` o snakeviz).
+
+Uso:
+    python3 scripts/crear_datamarts.py --profile datamarts_profile.json --cprofile etapa.prof
+    python3 scripts/build_profiler.py datamarts_profile.json
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Literales de texto, números y NULL/TRUE/FALSE (las sentencias trazadas llegan
+# con los parámetros ya sustituidos); IS [NOT] NULL se conserva
+_LITERALES = re.compile(
+    r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b|(?<!IS )(?<!NOT )\b(?:NULL|TRUE|FALSE)\b",
+    re.IGNORECASE
+)
+_ESPACIOS = re.compile(r'\s+')
+_LISTAS = re.compile(r'\?(?:\s*,\s*\?)+')
+
+TOP_SENTENCIAS = 10
+
+
+def normalize_sql(sql: str) -> str:
+    """Forma canónica de una sentencia: sin literales ni espacios repetidos"""
+    texto = _LITERALES.sub('?', sql)
+    texto = _LISTAS.sub('?, ...', texto)
+    return _ESPACIOS.sub(' ', texto).strip()[:300]
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor de una ProfiledConnection: mide también conn.cursor().execute(...)"""
+
+    def execute(self, sql, *args):
+        return self.connection._medir(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.connection._medir(super().executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self.connection._medir(super().executescript, sql)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Conexión sqlite3 que informa sentencias y tiempos a un BuildProfiler
+
+    Se crea con sqlite3.connect(..., factory=ProfiledConnection). Sus cursores
+    son ProfiledCursor, así que se mide tanto conn.execute como cursor.execute.
+    """
+
+    profiler: Optional['BuildProfiler'] = None
+
+    def attach(self, profiler: 'BuildProfiler'):
+        self.profiler = profiler
+        self.set_trace_callback(profiler._trazar)
+
+    def _medir(self, metodo, sql: str, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, *args)
+        finally:
+            if self.profiler is not None:
+                self.profiler._tiempo_sql(sql, time.perf_counter() - inicio)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self._medir(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._medir(super().executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._medir(super().executescript, sql)
+
+    def close(self):
+        # Las filas escritas siguen contando aunque la conexión se cierre dentro de
+        # una etapa (p.ej. la del SQLiteWriter, que vive sólo durante la carga)
+        if self.profiler is not None:
+            self.profiler._cerrar(self)
+        super().close()
+
+
+class _Etapa:
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.sentencias = 0
+        self.sqlite_s = 0.0
+        self.filas = 0
+        self.memoria_pico_mb = 0.0
+        self.ejecuciones = Counter()
+        self.tiempos = defaultdict(float)
+
+    def to_dict(self) -> Dict:
+        top = [
+            {'sql': sql, 'ejecuciones': n, 'tiempo_s': round(self.tiempos.get(sql, 0.0), 6)}
+            for sql, n in self.ejecuciones.most_common(TOP_SENTENCIAS)
+        ]
+        return {
+            'nombre': self.nombre,
+            'wall_s': round(self.wall_s, 6),
+            'cpu_s': round(self.cpu_s, 6),
+            'sentencias': self.sentencias,
+            'sqlite_s': round(self.sqlite_s, 6),
+            'filas': self.filas,
+            'memoria_pico_mb': round(self.memoria_pico_mb, 3),
+            'top_sentencias': top,
+        }
+
+
+class BuildProfiler:
+    """Acumula métricas por etapa de una construcción"""
+
+    def __init__(self, script: str, cprofile_path: Optional[str] = None):
+        self.script = script
+        self.cprofile_path = cprofile_path
+        self.inicio = datetime.now()
+        self.etapas: List[_Etapa] = []
+        self.actual: Optional[_Etapa] = None
+        self.conexiones: List[sqlite3.Connection] = []
+        self._cambios_cerradas = 0
+        self._mejor_cprofile = None
+        self._wall_inicio = time.perf_counter()
+        self._cpu_inicio = time.process_time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def connect(self, *args, **kwargs) -> sqlite3.Connection:
+        """sqlite3.connect con una ProfiledConnection registrada"""
+        conn = sqlite3.connect(*args, factory=ProfiledConnection, **kwargs)
+        conn.attach(self)
+        self.conexiones.append(conn)
+        return conn
+
+    def _cerrar(self, conn: sqlite3.Connection):
+        if conn in self.conexiones:
+            self._cambios_cerradas += conn.total_changes
+            self.conexiones.remove(conn)
+
+    def _cambios(self) -> int:
+        total = self._cambios_cerradas
+        for conn in self.conexiones:
+            try:
+                total += conn.total_changes
+            except sqlite3.ProgrammingError:  # conexión ya cerrada
+                pass
+        return total
+
+    def _trazar(self, sql: str):
+        if self.actual is not None:
+            self.actual.sentencias += 1
+            self.actual.ejecuciones[normalize_sql(sql)] += 1
+
+    def _tiempo_sql(self, sql: str, segundos: float):
+        if self.actual is not None:
+            self.actual.sqlite_s += segundos
+            self.actual.tiempos[normalize_sql(sql)] += segundos
+
+    @contextmanager
+    def stage(self, nombre: str):
+        """Medir una etapa; las etapas no se anidan"""
+        etapa = _Etapa(nombre)
+        self.etapas.append(etapa)
+        anterior, self.actual = self.actual, etapa
+        cambios = self._cambios()
+        tracemalloc.reset_peak()
+        perfil = cProfile.Profile() if self.cprofile_path else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        if perfil:
+            perfil.enable()
+        try:
+            yield etapa
+        finally:
+            if perfil:
+                perfil.disable()
+            etapa.wall_s = time.perf_counter() - wall
+            etapa.cpu_s = time.process_time() - cpu
+            etapa.memoria_pico_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            etapa.filas = self._cambios() - cambios
+            self.actual = anterior
+            if perfil and (self._mejor_cprofile is None or etapa.wall_s > self._mejor_cprofile[0]):
+                self._mejor_cprofile = (etapa.wall_s, etapa.nombre, perfil)
+
+    def report(self) -> Dict:
+        etapas = [e.to_dict() for e in self.etapas]
+        mas_lenta = max(self.etapas, key=lambda e: e.wall_s).nombre if self.etapas else None
+        return {
+            'script': self.script,
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'total': {
+                'wall_s': round(time.perf_counter() - self._wall_inicio, 6),
+                'cpu_s': round(time.process_time() - self._cpu_inicio, 6),
+                'sentencias': sum(e['sentencias'] for e in etapas),
+                'sqlite_s': round(sum(e['sqlite_s'] for e in etapas), 6),
+                'filas': sum(e['filas'] for e in etapas),
+                'memoria_pico_mb': max((e['memoria_pico_mb'] for e in etapas), default=0.0),
+            },
+            'etapa_mas_lenta': mas_lenta,
+            'cprofile': (
+                {'archivo': self.cprofile_path, 'etapa': self._mejor_cprofile[1]}
+                if self._mejor_cprofile else None
+            ),
+            'etapas': etapas,
+        }
+
+    def write(self, path: str) -> Dict:
+        """Escribir el informe JSON (y el volcado cProfile si se pidió)"""
+        informe = self.report()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+        if self._mejor_cprofile:
+            self._mejor_cprofile[2].dump_stats(self.cprofile_path)
+        return informe
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(informe: Dict):
+    """Resumen legible de un informe"""
+    total = informe['total']
+    print(f"⏱️  {informe['script']} ({informe['inicio']}, commit {informe.get('commit') or '?'}): "
+          f"{total['wall_s']:.2f} s reloj, {total['cpu_s']:.2f} s CPU, "
+          f"{total['sentencias']} sentencias, pico {total['memoria_pico_mb']:.1f} MB")
+    print(f"{'etapa':28} {'reloj s':>9} {'cpu s':>9} {'sqlite s':>9} {'sentencias':>11} {'filas':>9} {'MB':>7}")
+    for e in informe['etapas']:
+        print(f"{e['nombre']:28} {e['wall_s']:9.3f} {e['cpu_s']:9.3f} {e['sqlite_s']:9.3f} "
+              f"{e['sentencias']:11d} {e['filas']:9d} {e['memoria_pico_mb']:7.1f}")
+    lenta = next((e for e in informe['etapas'] if e['nombre'] == informe['etapa_mas_lenta']), None)
+    if lenta and lenta['top_sentencias']:
+        print(f"\n🔥 Sentencias más repetidas en '{lenta['nombre']}':")
+        for s in lenta['top_sentencias'][:5]:
+            print(f"   {s['ejecuciones']:8d}x {s['tiempo_s']:8.3f} s  {s['sql'][:100]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mostrar un informe de perfilado de construcción')
+    parser.add_argument('informe', help='Archivo JSON generado con --profile')
+    args = parser.parse_args()
+    with open(args.informe, 'r', encoding='utf-8') as f:
+        print_report(json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+LAYOUT COMPACTO - DATAMARTS EMPRESA MOLINERA
+Reescribe una copia de un datamart con un almacenamiento más compacto, sin
+cambiar lo que ven las consultas:
+
+- fechas 'AAAA-MM-DD' guardadas como INTEGER AAAAMMDD
+- cadenas repetidas (nombre_mes, periodo_fiscal, moneda, estado_venta,
+  estado_stock...) sustituidas por un código entero de una tabla COD_<COLUMNA>
+- series con prefijo y ancho fijo (GR000001, LOTE00001) guardadas como entero
+- WITHOUT ROWID en las tablas con clave primaria compuesta o no entera
+- page_size ajustado y VACUUM/ANALYZE al final (perfil de servicio)
+
+Cada tabla física pasa a llamarse <TABLA>_COMPACTA y una vista con el nombre
+original decodifica las columnas, de modo que el catálogo de consultas, la
+poda de particiones y las vistas FACT_* siguen funcionando. La copia es de
+sólo lectura: no conserva claves foráneas ni los triggers de las particiones.
+Los textos sin patrón ni repetición (p.ej. nro_pedido) se dejan como están.
+
+El informe compara tamaño de archivo, recorrido completo de cada tabla y las
+consultas del catálogo entre el layout actual y el compacto.
+
+Uso:
+    python3 scripts/compact_layout.py --dbs dbs --destino dbs_compacto
+    python3 scripts/compact_layout.py --dbs dbs --destino dbs_compacto --verificar
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from datamart_pool import apply_serving_profile
+from fact_partitions import partition_names
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE_COMPACTO = 4096
+SUFIJO_COMPACTA = '_COMPACTA'
+PREFIJO_CODIGOS = 'COD_'
+
+# Una columna de texto se codifica si tiene pocos valores distintos y cada uno
+# se repite en promedio al menos REPETICION_MINIMA veces
+MAX_CODIGOS = 255
+REPETICION_MINIMA = 2
+
+_SERIE = re.compile(r'^(\D*)(\d+)$')
+
+
+def _q(nombre: str) -> str:
+    return '"' + nombre.replace('"', '""') + '"'
+
+
+def _literal(texto: str) -> str:
+    return "'" + texto.replace("'", "''") + "'"
+
+
+def _tablas(conn) -> List[str]:
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name"
+    )]
+
+
+def _es_fecha(conn, tabla: str, columna: str) -> bool:
+    no_nulas, invalidas = conn.execute(f"""
+        SELECT COUNT({_q(columna)}),
+               SUM({_q(columna)} IS NOT NULL AND (typeof({_q(columna)}) != 'text'
+                   OR {_q(columna)} NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'))
+        FROM {_q(tabla)}
+    """).fetchone()
+    return bool(no_nulas) and not invalidas
+
+
+def _serie(conn, tabla: str, columna: str) -> Optional[tuple]:
+    """(prefijo, ancho) si todos los valores son prefijo fijo + dígitos de ancho fijo"""
+    muestra = conn.execute(
+        f"SELECT {_q(columna)} FROM {_q(tabla)} WHERE {_q(columna)} IS NOT NULL LIMIT 1"
+    ).fetchone()
+    if muestra is None or not isinstance(muestra[0], str):
+        return None
+    coincidencia = _SERIE.match(muestra[0])
+    if not coincidencia:
+        return None
+    prefijo, ancho = coincidencia.group(1), len(muestra[0])
+    largo = len(prefijo)
+    invalidas = conn.execute(f"""
+        SELECT COUNT(*) FROM {_q(tabla)}
+        WHERE {_q(columna)} IS NOT NULL AND (typeof({_q(columna)}) != 'text'
+              OR length({_q(columna)}) != ? OR substr({_q(columna)}, 1, ?) != ?
+              OR substr({_q(columna)}, ? + 1) GLOB '*[^0-9]*')
+    """, (ancho, largo, prefijo, largo)).fetchone()[0]
+    return None if invalidas else (prefijo, ancho - largo)
+
+
+def _es_repetida(conn, tabla: str, columna: str) -> bool:
+    filas, distintas, no_texto = conn.execute(f"""
+        SELECT COUNT({_q(columna)}), COUNT(DISTINCT {_q(columna)}),
+               SUM({_q(columna)} IS NOT NULL AND typeof({_q(columna)}) != 'text')
+        FROM {_q(tabla)}
+    """).fetchone()
+    return (bool(filas) and not no_texto and distintas <= MAX_CODIGOS
+            and distintas * REPETICION_MINIMA <= filas)
+
+
+def plan_table(conn, tabla: str) -> List[Dict]:
+    """Codificación elegida para cada columna de una tabla"""
+    plan = []
+    for _, nombre, tipo, notnull, _, pk in conn.execute(f"PRAGMA table_info({_q(tabla)})"):
+        columna = {'nombre': nombre, 'tipo': tipo, 'notnull': bool(notnull), 'pk': pk,
+                   'codificacion': None}
+        if _es_fecha(conn, tabla, nombre):
+            columna['codificacion'] = 'fecha'
+        elif (tipo or '').upper() not in ('INTEGER', 'REAL', 'BOOLEAN'):
+            serie = _serie(conn, tabla, nombre)
+            if serie:
+                columna.update(codificacion='serie', prefijo=serie[0], ancho=serie[1])
+            elif not pk and _es_repetida(conn, tabla, nombre):
+                columna.update(codificacion='codigo', tabla_codigos=f"{PREFIJO_CODIGOS}{nombre.upper()}")
+        plan.append(columna)
+    return plan
+
+
+def _codificar(columna: Dict) -> str:
+    c = f"t.{_q(columna['nombre'])}"
+    if columna['codificacion'] == 'fecha':
+        return f"CAST(replace({c}, '-', '') AS INTEGER)"
+    if columna['codificacion'] == 'serie':
+        return f"CAST(substr({c}, {len(columna['prefijo']) + 1}) AS INTEGER)"
+    if columna['codificacion'] == 'codigo':
+        return f"(SELECT codigo FROM {_q(columna['tabla_codigos'])} WHERE valor = {c})"
+    return c
+
+
+def _decodificar(columna: Dict, alias: str) -> str:
+    c = f"t.{_q(columna['nombre'])}"
+    if columna['codificacion'] == 'fecha':
+        return f"CASE WHEN {c} IS NOT NULL THEN printf('%04d-%02d-%02d', {c} / 10000, {c} / 100 % 100, {c} % 100) END"
+    if columna['codificacion'] == 'serie':
+        return (f"CASE WHEN {c} IS NOT NULL THEN "
+                f"{_literal(columna['prefijo'])} || printf('%0{columna['ancho']}d', {c}) END")
+    if columna['codificacion'] == 'codigo':
+        return f"{alias}.valor"
+    return c
+
+
+def _claves(plan: List[Dict]) -> List[Dict]:
+    return sorted((c for c in plan if c['pk']), key=lambda c: c['pk'])
+
+
+def _clave_rowid(claves: List[Dict]) -> bool:
+    """La clave es un INTEGER PRIMARY KEY (alias del rowid)"""
+    return len(claves) == 1 and (claves[0]['tipo'] or '').upper() == 'INTEGER'
+
+
+def _ddl(tabla: str, plan: List[Dict]) -> str:
+    claves = _claves(plan)
+    clave_rowid = _clave_rowid(claves)
+    definiciones = []
+    for c in plan:
+        tipo = 'INTEGER' if c['codificacion'] else (c['tipo'] or '')
+        definicion = f"{_q(c['nombre'])} {tipo}".rstrip()
+        if clave_rowid and c['pk']:
+            definicion += ' PRIMARY KEY'
+        elif c['notnull']:
+            definicion += ' NOT NULL'
+        definiciones.append(definicion)
+    sin_rowid = ''
+    if claves and not clave_rowid:
+        definiciones.append(f"PRIMARY KEY ({', '.join(_q(c['nombre']) for c in claves)})")
+        sin_rowid = ' WITHOUT ROWID'
+    cuerpo = ',\n    '.join(definiciones)
+    return f"CREATE TABLE {_q(tabla + SUFIJO_COMPACTA)} (\n    {cuerpo}\n){sin_rowid}"
+
+
+def _indices(conn, tabla: str) -> List[tuple]:
+    """(nombre, único, columnas) de los índices declarados fuera de la clave primaria"""
+    indices = []
+    for _, nombre, unico, origen, parcial in conn.execute(f"PRAGMA index_list({_q(tabla)})"):
+        if origen == 'pk' or parcial:
+            continue
+        columnas = [r[2] for r in conn.execute(f"PRAGMA index_info({_q(nombre)})")]
+        if None in columnas:  # índices sobre expresiones
+            continue
+        if origen == 'u':
+            nombre = f"uq_{tabla.lower()}_{'_'.join(columnas)}"
+        indices.append((nombre, unico, columnas))
+    return indices
+
+
+def compact_table(conn, tabla: str, plan: List[Dict]) -> bool:
+    """Sustituir una tabla por su versión compacta y una vista decodificadora"""
+    claves = _claves(plan)
+    sin_rowid = bool(claves) and not _clave_rowid(claves)
+    if not sin_rowid and not any(c['codificacion'] for c in plan):
+        return False
+
+    compacta = tabla + SUFIJO_COMPACTA
+    indices = _indices(conn, tabla)
+    conn.execute(_ddl(tabla, plan))
+    conn.execute(f"""
+        INSERT INTO {_q(compacta)} ({', '.join(_q(c['nombre']) for c in plan)})
+        SELECT {', '.join(_codificar(c) for c in plan)} FROM {_q(tabla)} t
+    """)
+    conn.execute(f"DROP TABLE {_q(tabla)}")
+    for nombre, unico, columnas in indices:
+        conn.execute(
+            f"CREATE {'UNIQUE ' if unico else ''}INDEX {_q(nombre)} "
+            f"ON {_q(compacta)} ({', '.join(_q(c) for c in columnas)})"
+        )
+
+    uniones = []
+    expresiones = []
+    for i, c in enumerate(plan):
+        alias = f"k{i}"
+        if c['codificacion'] == 'codigo':
+            uniones.append(f"LEFT JOIN {_q(c['tabla_codigos'])} {alias} ON {alias}.codigo = t.{_q(c['nombre'])}")
+        expresiones.append(f"{_decodificar(c, alias)} AS {_q(c['nombre'])}")
+    conn.execute(
+        f"CREATE VIEW {_q(tabla)} AS SELECT {', '.join(expresiones)} "
+        f"FROM {_q(compacta)} t {' '.join(uniones)}"
+    )
+    return True
+
+
+def compact_datamart(origen: str, destino: str, page_size: int = PAGE_SIZE_COMPACTO,
+                     conectar: Callable[..., sqlite3.Connection] = sqlite3.connect) -> Dict:
+    """Escribir en `destino` la versión compacta del datamart `origen`"""
+    if os.path.abspath(origen) == os.path.abspath(destino):
+        raise ValueError("El layout compacto se escribe en una copia, no sobre el datamart original")
+    for sufijo in ('', '-wal', '-shm'):
+        if os.path.exists(destino + sufijo):
+            os.remove(destino + sufijo)
+    shutil.copyfile(origen, destino)
+
+    conn = conectar(destino, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("BEGIN")
+        planes = {tabla: plan_table(conn, tabla) for tabla in _tablas(conn)}
+
+        # Tablas de códigos compartidas por las columnas del mismo nombre
+        codigos = {}
+        for tabla, plan in planes.items():
+            for c in plan:
+                if c['codificacion'] == 'codigo':
+                    codigos.setdefault(c['tabla_codigos'], []).append((tabla, c['nombre']))
+        for tabla_codigos, origenes in sorted(codigos.items()):
+            conn.execute(f"""
+                CREATE TABLE {_q(tabla_codigos)} (
+                    codigo INTEGER PRIMARY KEY,
+                    valor TEXT NOT NULL UNIQUE
+                )
+            """)
+            valores = ' UNION '.join(
+                f"SELECT {_q(columna)} FROM {_q(tabla)} WHERE {_q(columna)} IS NOT NULL"
+                for tabla, columna in origenes
+            )
+            conn.execute(f"INSERT OR IGNORE INTO {_q(tabla_codigos)} (valor) SELECT * FROM ({valores}) ORDER BY 1")
+
+        compactadas = [tabla for tabla, plan in planes.items() if compact_table(conn, tabla, plan)]
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    estado = apply_serving_profile(destino, page_size=page_size, conectar=conectar)
+    return {
+        'tablas_compactadas': len(compactadas),
+        'tablas_codigos': len(codigos),
+        'columnas': {
+            tabla: {c['nombre']: c['codificacion'] for c in plan if c['codificacion']}
+            for tabla, plan in planes.items() if tabla in compactadas
+        },
+        **estado,
+    }
+
+
+def _tablas_consultables(conn) -> List[str]:
+    """Tablas y vistas que leen las consultas (las particiones van por su vista)"""
+    particiones = set(partition_names(conn))
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+        "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name"
+    ) if r[0] not in particiones and not r[0].endswith(SUFIJO_COMPACTA)
+        and not r[0].startswith(PREFIJO_CODIGOS)]
+
+
+def _scan(conn, tabla: str, repeticiones: int) -> tuple:
+    mejor, filas = None, 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = sum(1 for _ in conn.execute(f"SELECT * FROM {_q(tabla)}"))
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return filas, mejor
+
+
+def compare_layouts(original_dir: str, compacto_dir: str, archivos: Sequence[str],
+                    repeticiones: int = 5, consultas: bool = True,
+                    conectar: Callable[..., sqlite3.Connection] = sqlite3.connect) -> Dict:
+    """Tamaño de archivo y velocidad de recorrido: layout actual frente a compacto
+
+    `conectar` abre las conexiones de los recorridos; las consultas de
+    referencia usan las conexiones propias de run_benchmark.
+    """
+    datamarts = {}
+    for archivo in archivos:
+        rutas = {'original': os.path.join(original_dir, archivo), 'compacto': os.path.join(compacto_dir, archivo)}
+        conexiones = {
+            k: conectar(f"file:{os.path.abspath(r)}?mode=ro", uri=True) for k, r in rutas.items()
+        }
+        try:
+            tablas = {}
+            for tabla in _tablas_consultables(conexiones['original']):
+                medidas = {}
+                for k, conn in conexiones.items():
+                    filas, segundos = _scan(conn, tabla, repeticiones)
+                    medidas[f'filas_{k}'] = filas
+                    medidas[f'scan_{k}_ms'] = round(segundos * 1000, 3)
+                tablas[tabla] = medidas
+        finally:
+            for conn in conexiones.values():
+                conn.close()
+        bytes_original = os.path.getsize(rutas['original'])
+        bytes_compacto = os.path.getsize(rutas['compacto'])
+        datamarts[archivo] = {
+            'bytes_original': bytes_original,
+            'bytes_compacto': bytes_compacto,
+            'razon_tamaño': round(bytes_compacto / bytes_original, 4) if bytes_original else None,
+            'tablas': tablas,
+        }
+
+    informe = {'datamarts': datamarts, 'consultas': {}}
+    if consultas:
+        from benchmark_datamarts import run_benchmark
+        from datamart_queries import CONSULTAS
+
+        medidas = {
+            k: run_benchmark({1: d}, list(CONSULTAS), repeticiones)['escalas']['1']['consultas']
+            for k, d in (('original', original_dir), ('compacto', compacto_dir))
+        }
+        informe['consultas'] = {
+            nombre: {
+                'p50_original_ms': medidas['original'][nombre]['p50_ms'],
+                'p50_compacto_ms': medidas['compacto'][nombre]['p50_ms'],
+                'mismas_filas': medidas['original'][nombre]['filas_resultado']
+                == medidas['compacto'][nombre]['filas_resultado'],
+            }
+            for nombre in CONSULTAS
+        }
+    return informe
+
+
+def verify_layout(original: str, compacto: str) -> Dict[str, int]:
+    """Filas que difieren entre cada tabla original y su vista compacta"""
+    conn = sqlite3.connect(f"file:{os.path.abspath(compacto)}?mode=ro", uri=True)
+    try:
+        conn.execute("ATTACH DATABASE ? AS original", (f"file:{os.path.abspath(original)}?mode=ro",))
+        diferencias = {}
+        for (tabla,) in conn.execute(
+            "SELECT name FROM original.sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'"
+        ).fetchall():
+            diferencias[tabla] = conn.execute(f"""
+                SELECT COUNT(*) FROM (
+                    SELECT * FROM (SELECT * FROM original.{_q(tabla)} EXCEPT SELECT * FROM main.{_q(tabla)})
+                    UNION ALL
+                    SELECT * FROM (SELECT * FROM main.{_q(tabla)} EXCEPT SELECT * FROM original.{_q(tabla)})
+                )
+            """).fetchone()[0]
+        return diferencias
+    finally:
+        conn.close()
+
+
+def print_comparison(informe: Dict):
+    print(f"{'datamart':28} {'original KB':>12} {'compacto KB':>12} {'razón':>7}")
+    for archivo, d in informe['datamarts'].items():
+        print(f"{archivo:28} {d['bytes_original'] / 1024:12.1f} {d['bytes_compacto'] / 1024:12.1f} "
+              f"{d['razon_tamaño']:7.3f}")
+    print(f"\n{'tabla':28} {'filas':>8} {'scan orig ms':>13} {'scan comp ms':>13}")
+    for d in informe['datamarts'].values():
+        for tabla, m in d['tablas'].items():
+            print(f"{tabla:28} {m['filas_original']:8d} {m['scan_original_ms']:13.3f} {m['scan_compacto_ms']:13.3f}")
+    if informe['consultas']:
+        print(f"\n{'consulta':32} {'p50 orig ms':>12} {'p50 comp ms':>12}")
+        for nombre, m in informe['consultas'].items():
+            aviso = '' if m['mismas_filas'] else '  ⚠️ filas distintas'
+            print(f"{nombre:32} {m['p50_original_ms']:12.3f} {m['p50_compacto_ms']:12.3f}{aviso}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from datamart_queries import DATAMARTS, DBS_DIR
+
+    parser = argparse.ArgumentParser(description='Escribir y evaluar el layout compacto de los datamarts')
+    parser.add_argument('--dbs', default=DBS_DIR, help='Directorio con los archivos datamart_*.db')
+    parser.add_argument('--destino', required=True, help='Directorio de las copias compactas')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE_COMPACTO)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--informe', help='Guardar el informe comparativo en este JSON')
+    parser.add_argument('--verificar', action='store_true',
+                        help='Comprobar fila a fila que las vistas compactas devuelven lo mismo')
+    args = parser.parse_args()
+
+    os.makedirs(args.destino, exist_ok=True)
+    archivos = list(DATAMARTS.values())
+    for archivo in archivos:
+        resumen = compact_datamart(os.path.join(args.dbs, archivo), os.path.join(args.destino, archivo),
+                                   page_size=args.page_size)
+        logger.info(f"🗜️  {archivo}: {resumen['tablas_compactadas']} tablas compactadas, "
+                    f"{resumen['tablas_codigos']} tablas de códigos, page_size={resumen['page_size']}")
+
+    correcto = True
+    if args.verificar:
+        for archivo in archivos:
+            diferencias = verify_layout(os.path.join(args.dbs, archivo), os.path.join(args.destino, archivo))
+            for tabla, n in diferencias.items():
+                if n:
+                    correcto = False
+                    logger.error(f"❌ {archivo}:{tabla} difiere en {n} filas")
+            if not any(diferencias.values()):
+                logger.info(f"✅ {archivo}: las vistas compactas reproducen todas las tablas")
+
+    informe = compare_layouts(args.dbs, args.destino, archivos, repeticiones=args.repeticiones)
+    informe['page_size'] = args.page_size
+    if args.informe:
+        with open(args.informe, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+    print_comparison(informe)
+    return 0 if correcto else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,11 +8,27 @@ Cada datamart tiene su propia base de datos SQLite
 import sqlite3
 import pandas as pd
 import logging
+import bisect
+import hashlib
 from datetime import datetime, timedelta, date
 import random
 from typing import Dict, List, Optional
 import sys
 import os
+import argparse
+import json
+from contextlib import nullcontext
+
+from bitmap_index import build_datamart_bitmaps
+from build_profiler import BuildProfiler, print_report
+from compact_layout import compact_datamart, compare_layouts
+from parquet_export import ParquetExporter
+from pg_dump_export import export_pg_dump
+from datamart_pool import apply_serving_profile
+from fact_partitions import PartitionedFact
+from inventory_snapshot import refresh_inventory_snapshot
+from reconciliation import fecha_valida_sql, log_reconciliation, reconcile
+from sqlite_writer import transform_in_processes
 
 # Configurar logging
 logging.basicConfig(
@@ -25,13 +41,67 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Filas por lote en las cargas de hechos (memoria acotada sin importar el histórico)
+BATCH_SIZE = 5000
+
+# Datamarts que conservan su archivo entre ejecuciones (dimensiones SCD tipo 2)
+DATAMARTS_CON_HISTORIAL = ('ventas',)
+
+# Vigencia de las versiones SCD2: [valid_from, valid_to) en texto ISO
+INICIO_VIGENCIA = '1900-01-01'
+FIN_VIGENCIA = '9999-12-31'
+
+# id_tiempo es el número de día desde la fecha base (2023-01-01 -> 1), de modo
+# que cualquier fecha se convierte en clave sin consultar DIM_TIEMPO
+FECHA_BASE_TIEMPO = date(2023, 1, 1)
+
+# Lista de feriados peruanos (básicos)
+FERIADOS_PERU = [
+    (1, 1),   # Año Nuevo
+    (7, 28),  # Fiestas Patrias
+    (7, 29),  # Fiestas Patrias
+    (12, 25), # Navidad
+    (5, 1),   # Día del Trabajador
+]
+
+SQL_INSERT_TIEMPO = """
+INSERT INTO DIM_TIEMPO (
+    id_tiempo, fecha_completa, año, mes, dia, trimestre, nombre_mes,
+    nombre_dia_semana, numero_semana, periodo_fiscal, es_fin_semana,
+    es_feriado, turno_trabajo, periodo_estacional
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def tiempo_id(fecha: date) -> int:
+    """Clave de DIM_TIEMPO de una fecha"""
+    return (fecha - FECHA_BASE_TIEMPO).days + 1
+
 class DatamartCreator:
     """Clase principal para crear los datamarts dimensionales separados"""
 
-    def __init__(self, source_db_path: str = "empresa_molinera.db"):
+    def __init__(self, source_db_path: str = "empresa_molinera.db",
+                 parquet_dir: Optional[str] = None, parquet_incremental: bool = True,
+                 batch_size: int = BATCH_SIZE, full_refresh: bool = False,
+                 fecha_carga: Optional[date] = None, profiler: Optional[BuildProfiler] = None,
+                 datos_ejemplo: bool = False, compacto_dir: Optional[str] = None,
+                 dumps_dir: Optional[str] = None, dumps_formato: str = 'insert', procesos: int = 1):
         self.source_db_path = source_db_path
+        self.procesos = procesos
+        self.compacto_dir = compacto_dir
+        self.dumps_dir = dumps_dir
+        self.dumps_formato = dumps_formato
+        self.datos_ejemplo = datos_ejemplo
+        self.hechos_ejemplo = set()
+        self.profiler = profiler
+        self.batch_size = batch_size
+        self.full_refresh = full_refresh
+        self.fecha_carga = fecha_carga or date.today()
+        self.parquet_dir = parquet_dir
+        self.parquet_incremental = parquet_incremental
         self.source_conn = None
         self.datamart_connections = {}
+        self.datamarts_conservados = set()
         self.datamart_paths = {
             'ventas': 'datamart_ventas.db',
             'inventarios': 'datamart_inventarios.db',
@@ -39,21 +109,44 @@ class DatamartCreator:
             'produccion': 'datamart_produccion.db'
         }
 
+    def connect(self, db_path: str, **kwargs):
+        """Abrir una conexión (instrumentada si hay perfilado activo)"""
+        if self.profiler:
+            return self.profiler.connect(db_path, **kwargs)
+        return sqlite3.connect(db_path, **kwargs)
+
+    def stage(self, nombre: str):
+        """Etapa de la construcción para el informe de perfilado"""
+        return self.profiler.stage(nombre) if self.profiler else nullcontext()
+
     def connect_databases(self):
         """Conectar a la base de datos origen y crear conexiones para cada datamart"""
         try:
             # Conectar a BD origen
-            self.source_conn = sqlite3.connect(self.source_db_path)
+            self.source_conn = self.connect(self.source_db_path)
             logger.info(f"✅ Conectado a BD origen: {self.source_db_path}")
 
             # Crear conexiones para cada datamart
             for datamart_name, db_path in self.datamart_paths.items():
-                # Eliminar archivo existente
-                if os.path.exists(db_path):
-                    os.remove(db_path)
-                    logger.info(f"🗑️  Eliminado archivo previo: {db_path}")
-
-                self.datamart_connections[datamart_name] = sqlite3.connect(db_path)
+                conservar = datamart_name in DATAMARTS_CON_HISTORIAL and not self.full_refresh
+                if conservar and os.path.exists(db_path):
+                    # Se reconstruye todo salvo el historial de las dimensiones SCD2
+                    logger.info(f"♻️  Conservando historial de dimensiones en: {db_path}")
+                    self.datamarts_conservados.add(datamart_name)
+                else:
+                    # Eliminar archivo existente
+                    if os.path.exists(db_path):
+                        os.remove(db_path)
+                        logger.info(f"🗑️  Eliminado archivo previo: {db_path}")
+                    # Restos del modo WAL del perfil de servicio
+                    for sufijo in ("-wal", "-shm"):
+                        if os.path.exists(db_path + sufijo):
+                            os.remove(db_path + sufijo)
+
+                self.datamart_connections[datamart_name] = self.connect(db_path)
+                if conservar:
+                    # Salir de WAL: el perfil de servicio se vuelve a aplicar al final
+                    self.datamart_connections[datamart_name].execute("PRAGMA journal_mode = DELETE")
                 logger.info(f"✅ Creado datamart {datamart_name}: {db_path}")
 
             return True
@@ -73,6 +166,279 @@ class DatamartCreator:
 
         logger.info("🔒 Todas las conexiones cerradas")
 
+    def iter_source_batches(self, sql: str, params: tuple = ()):
+        """Recorrer una consulta de la BD origen en lotes de `batch_size` filas
+
+        Cada fila se entrega como dict para conservar el acceso por nombre de
+        columna (y `.get`) que usaban los cargadores con pandas.
+        """
+        cursor = self.source_conn.execute(sql, params)
+        columnas = [d[0] for d in cursor.description]
+        while True:
+            filas = cursor.fetchmany(self.batch_size)
+            if not filas:
+                break
+            yield [dict(zip(columnas, fila)) for fila in filas]
+
+    def run_fact_pipeline(self, conn, sql_origen: str, transformar, sql_insert: str,
+                          params: tuple = (), particiones: Optional[PartitionedFact] = None,
+                          en_procesos: bool = False) -> int:
+        """Extraer por lotes -> transformar (claves y medidas) -> executemany
+
+        Con `particiones`, cada lote se reparte entre las tablas por periodo
+        (`sql_insert` usa `{tabla}`). Con `en_procesos` los lotes se transforman
+        en `self.procesos` procesos (la transformación no debe escribir en la BD);
+        la conexión del datamart sigue siendo el único escritor. Devuelve el
+        número de filas insertadas.
+        """
+        total = 0
+        lotes = self.iter_source_batches(sql_origen, params)
+        procesos = self.procesos if en_procesos else 1
+        for filas in transform_in_processes(lotes, transformar, procesos):
+            if particiones is not None:
+                total += particiones.insert(sql_insert, filas)
+            else:
+                conn.executemany(sql_insert, filas)
+                total += len(filas)
+        return total
+
+    def source_has_rows(self, tabla: str) -> bool:
+        """Comprobar si una tabla origen tiene datos sin leerla completa"""
+        return self.source_conn.execute(f"SELECT EXISTS (SELECT 1 FROM {tabla})").fetchone()[0] == 1
+
+    def use_example_data(self, tabla_origen: str, tabla_hechos: str) -> bool:
+        """Decidir si un hecho se puebla con registros de ejemplo
+
+        Sólo ocurre si la tabla origen está vacía y se pidió con --datos-ejemplo;
+        en otro caso el hecho queda con las filas reales (ninguna si está vacía).
+        """
+        if self.source_has_rows(tabla_origen):
+            return False
+        if not self.datos_ejemplo:
+            logger.warning(f"⚠️  {tabla_origen} está vacía: {tabla_hechos} queda sin filas "
+                           f"(use --datos-ejemplo para generar registros de ejemplo)")
+            return False
+        self.hechos_ejemplo.add(tabla_hechos)
+        return True
+
+    def cover_source_dates(self, conn, tabla: str, columna: str, desde: str = '') -> int:
+        """Extender DIM_TIEMPO a todas las fechas de `tabla`.`columna` posteriores a `desde`
+
+        Se hace antes de transformar los hechos: las transformaciones (que pueden
+        correr en otros procesos) calculan la clave con tiempo_id() sin escribir
+        en la BD, y ninguna fecha cae en una clave ajena por faltar en la dimensión.
+        """
+        fechas = {self.parse_fecha(v) for (v,) in self.source_conn.execute(
+            f"SELECT DISTINCT substr({columna}, 1, 10) FROM {tabla} "
+            f"WHERE {fecha_valida_sql(columna)} AND {columna} > ?",
+            (desde,)
+        )}
+        return self.ensure_tiempo(conn, fechas)
+
+    @staticmethod
+    def parse_fecha(valor) -> date:
+        """Convertir una fecha de la BD origen
+
+        Las consultas de hechos filtran con fecha_valida_sql(): las filas sin fecha
+        válida se rechazan (la conciliación las cuenta) en lugar de inventarles una.
+        """
+        return date.fromisoformat(str(valor)[:10])
+
+    @staticmethod
+    def log_partitions(tabla: str, resumen: Dict[str, int]):
+        logger.info(
+            f"🗂️  {tabla}: {resumen['particiones']} particiones "
+            f"({resumen['solo_lectura']} de sólo lectura, {resumen['cerradas_ahora']} cerradas en esta carga)"
+        )
+        if resumen['omitidas']:
+            logger.warning(f"⚠️  {tabla}: {resumen['omitidas']} filas de periodos de sólo lectura no se cargaron "
+                           f"(use --full-refresh para reconstruir esas particiones)")
+
+    @staticmethod
+    def scd2_hash(valores) -> str:
+        """Huella de los atributos de un miembro para detectar cambios"""
+        texto = '\x1f'.join('' if v is None else str(v) for v in valores)
+        return hashlib.md5(texto.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def ensure_scd2_table(conn, tabla: str, ddl: str, clave_natural: str):
+        """Crear una dimensión SCD2 si no existe, migrando el esquema anterior
+
+        La versión previa de la tabla (sin clave natural ni vigencias) no tenía
+        historial, así que se descarta y se vuelve a cargar desde el origen.
+        """
+        columnas = [r[1] for r in conn.execute(f"PRAGMA table_info({tabla})")]
+        if columnas and clave_natural not in columnas:
+            logger.info(f"🔁 Migrando {tabla} al esquema SCD tipo 2")
+            conn.execute(f"DROP TABLE {tabla}")
+        conn.execute(ddl)
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{tabla.lower()}_vigencia
+            ON {tabla} ({clave_natural}, valid_from)
+        """)
+
+    def apply_scd2(self, conn, tabla: str, clave: str, clave_natural: str,
+                   columnas: List[str], registros) -> Dict[str, int]:
+        """Cargar una dimensión SCD tipo 2 comparando huellas en bloque
+
+        `registros` son tuplas (clave_natural, *columnas) leídas del origen. Sólo
+        los miembros nuevos o con huella distinta generan una versión; la
+        versión vigente anterior se cierra con valid_to = fecha de carga.
+        """
+        actuales = {
+            origen: (clave_sustituta, hash_diff)
+            for clave_sustituta, origen, hash_diff in conn.execute(
+                f"SELECT {clave}, {clave_natural}, hash_diff FROM {tabla} WHERE is_current = 1"
+            )
+        }
+
+        fecha_carga = self.fecha_carga.isoformat()
+        nuevas_versiones = []
+        cerradas = []
+        sin_cambios = 0
+        for registro in registros:
+            hash_diff = self.scd2_hash(registro[1:])
+            actual = actuales.get(registro[0])
+            if actual is None:
+                valid_from = INICIO_VIGENCIA
+            elif actual[1] == hash_diff:
+                sin_cambios += 1
+                continue
+            else:
+                cerradas.append((fecha_carga, actual[0]))
+                valid_from = fecha_carga
+            nuevas_versiones.append((*registro, hash_diff, valid_from, FIN_VIGENCIA, True))
+
+        conn.executemany(
+            f"UPDATE {tabla} SET valid_to = ?, is_current = 0 WHERE {clave} = ?", cerradas
+        )
+        lista = ', '.join([clave_natural, *columnas, 'hash_diff', 'valid_from', 'valid_to', 'is_current'])
+        marcas = ', '.join('?' * (len(columnas) + 5))
+        conn.executemany(f"INSERT INTO {tabla} ({lista}) VALUES ({marcas})", nuevas_versiones)
+
+        return {
+            'nuevos': len(nuevas_versiones) - len(cerradas),
+            'versionados': len(cerradas),
+            'sin_cambios': sin_cambios,
+        }
+
+    @staticmethod
+    def load_scd2_versions(conn, tabla: str, clave: str, clave_natural: str) -> Dict:
+        """Versiones por clave natural: (lista de valid_from, lista de claves sustitutas)"""
+        versiones = {}
+        for clave_sustituta, origen, valid_from in conn.execute(f"""
+            SELECT {clave}, {clave_natural}, valid_from FROM {tabla}
+            ORDER BY {clave_natural}, valid_from, {clave}
+        """):
+            inicios, claves = versiones.setdefault(origen, ([], []))
+            inicios.append(valid_from)
+            claves.append(clave_sustituta)
+        return versiones
+
+    @staticmethod
+    def resolve_scd2(versiones: Dict, origen, fecha_iso: str):
+        """Clave sustituta de la versión vigente en `fecha_iso` (None si no existe el miembro)"""
+        entrada = versiones.get(origen)
+        if entrada is None:
+            return None
+        inicios, claves = entrada
+        posicion = bisect.bisect_right(inicios, fecha_iso) - 1
+        return claves[max(posicion, 0)]
+
+    @staticmethod
+    def build_tiempo_row(fecha: date) -> tuple:
+        """Fila de DIM_TIEMPO para una fecha (id_tiempo determinista)"""
+        # Calcular trimestre
+        trimestre = ((fecha.month - 1) // 3) + 1
+
+        # Nombres de meses
+        nombres_meses = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
+                       'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+
+        # Nombres de días
+        nombres_dias = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+        # Verificar si es feriado
+        es_feriado = (fecha.month, fecha.day) in FERIADOS_PERU
+
+        # Verificar si es fin de semana (sábado=5, domingo=6)
+        es_fin_semana = fecha.weekday() >= 5
+
+        # Determinar período estacional (para producción agrícola)
+        if fecha.month in [12, 1, 2]:
+            periodo_estacional = "Verano"
+        elif fecha.month in [3, 4, 5]:
+            periodo_estacional = "Otoño"
+        elif fecha.month in [6, 7, 8]:
+            periodo_estacional = "Invierno"
+        else:
+            periodo_estacional = "Primavera"
+
+        # Turno de trabajo (1=Mañana, 2=Tarde, 3=Noche)
+        turno = random.choice([1, 2, 3])
+
+        return (
+            tiempo_id(fecha),
+            fecha,
+            fecha.year,
+            fecha.month,
+            fecha.day,
+            trimestre,
+            nombres_meses[fecha.month - 1],
+            nombres_dias[fecha.weekday()],
+            fecha.isocalendar()[1],  # Número de semana
+            f"FY{fecha.year}",  # Período fiscal
+            es_fin_semana,
+            es_feriado,
+            turno,
+            periodo_estacional
+        )
+
+    def ensure_tiempo(self, conn, fechas) -> int:
+        """Extender DIM_TIEMPO para cubrir `fechas`; devuelve cuántos días agregó
+
+        La dimensión se mantiene contigua: se agregan todos los días entre el
+        rango actual y las fechas nuevas, no sólo las fechas faltantes.
+        """
+        ids = [tiempo_id(f) for f in fechas]
+        if not ids:
+            return 0
+        minimo, maximo = conn.execute("SELECT MIN(id_tiempo), MAX(id_tiempo) FROM DIM_TIEMPO").fetchone()
+        if minimo is None:
+            minimo, maximo = min(ids), min(ids) - 1
+        faltantes = list(range(min(ids), minimo)) + list(range(maximo + 1, max(ids) + 1))
+        conn.executemany(SQL_INSERT_TIEMPO, [
+            self.build_tiempo_row(FECHA_BASE_TIEMPO + timedelta(days=i - 1)) for i in faltantes
+        ])
+        if faltantes:
+            logger.info(f"📅 DIM_TIEMPO extendida con {len(faltantes)} días fuera de rango")
+        return len(faltantes)
+
+    @staticmethod
+    def load_dias_habiles(conn) -> Dict[int, int]:
+        """Días hábiles acumulados por id_tiempo (sin fines de semana ni feriados)
+
+        La diferencia entre dos claves da los días hábiles del intervalo.
+        """
+        acumulado = 0
+        habiles = {}
+        for id_tiempo, es_fin_semana, es_feriado in conn.execute(
+            "SELECT id_tiempo, es_fin_semana, es_feriado FROM DIM_TIEMPO ORDER BY id_tiempo"
+        ):
+            if not es_fin_semana and not es_feriado:
+                acumulado += 1
+            habiles[id_tiempo] = acumulado
+        return habiles
+
+    def resolve_date_keys(self, conn, roles: Dict[str, List[date]]) -> Dict[str, List[int]]:
+        """Resolver columnas completas de fechas a id_tiempo (dimensión de rol)
+
+        Todas las fechas de todos los roles se aseguran en DIM_TIEMPO en una sola
+        pasada; la clave es aritmética sobre la fecha base, sin búsquedas por fila.
+        """
+        self.ensure_tiempo(conn, {f for fechas in roles.values() for f in fechas})
+        return {rol: [tiempo_id(f) for f in fechas] for rol, fechas in roles.items()}
+
     def create_dimension_tiempo(self):
         """Crear dimensión tiempo común para todos los datamarts"""
         logger.info("🕒 Creando dimensión TIEMPO en todos los datamarts...")
@@ -96,90 +462,32 @@ class DatamartCreator:
         )
         """
 
-        # Crear tabla en cada datamart
+        # Crear tabla en cada datamart. Los que conservan historial mantienen la
+        # suya: sus particiones cerradas pueden usar claves fuera del rango base
         for datamart_name, conn in self.datamart_connections.items():
-            conn.execute("DROP TABLE IF EXISTS DIM_TIEMPO")
+            if datamart_name not in self.datamarts_conservados:
+                conn.execute("DROP TABLE IF EXISTS DIM_TIEMPO")
             conn.execute(sql_dim_tiempo)
             logger.info(f"📅 Tabla DIM_TIEMPO creada en {datamart_name}")
 
         # Generar datos para la dimensión tiempo (últimos 2 años + próximo año)
-        start_date = date(2023, 1, 1)
+        start_date = FECHA_BASE_TIEMPO
         end_date = date(2026, 12, 31)
 
         tiempo_data = []
         current_date = start_date
-        id_tiempo = 1
-
-        # Lista de feriados peruanos (básicos)
-        feriados_peru = [
-            (1, 1),   # Año Nuevo
-            (7, 28),  # Fiestas Patrias
-            (7, 29),  # Fiestas Patrias
-            (12, 25), # Navidad
-            (5, 1),   # Día del Trabajador
-        ]
-
         while current_date <= end_date:
-            # Calcular trimestre
-            trimestre = ((current_date.month - 1) // 3) + 1
-
-            # Nombres de meses
-            nombres_meses = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
-                           'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-
-            # Nombres de días
-            nombres_dias = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-
-            # Verificar si es feriado
-            es_feriado = (current_date.month, current_date.day) in feriados_peru
-
-            # Verificar si es fin de semana (sábado=5, domingo=6)
-            es_fin_semana = current_date.weekday() >= 5
-
-            # Determinar período estacional (para producción agrícola)
-            if current_date.month in [12, 1, 2]:
-                periodo_estacional = "Verano"
-            elif current_date.month in [3, 4, 5]:
-                periodo_estacional = "Otoño"
-            elif current_date.month in [6, 7, 8]:
-                periodo_estacional = "Invierno"
-            else:
-                periodo_estacional = "Primavera"
-
-            # Turno de trabajo (1=Mañana, 2=Tarde, 3=Noche)
-            turno = random.choice([1, 2, 3])
-
-            tiempo_data.append((
-                id_tiempo,
-                current_date,
-                current_date.year,
-                current_date.month,
-                current_date.day,
-                trimestre,
-                nombres_meses[current_date.month - 1],
-                nombres_dias[current_date.weekday()],
-                current_date.isocalendar()[1],  # Número de semana
-                f"FY{current_date.year}",  # Período fiscal
-                es_fin_semana,
-                es_feriado,
-                turno,
-                periodo_estacional
-            ))
-
+            tiempo_data.append(self.build_tiempo_row(current_date))
             current_date += timedelta(days=1)
-            id_tiempo += 1
-
-        # Insertar datos en cada datamart
-        insert_sql = """
-        INSERT INTO DIM_TIEMPO (
-            id_tiempo, fecha_completa, año, mes, dia, trimestre, nombre_mes,
-            nombre_dia_semana, numero_semana, periodo_fiscal, es_fin_semana,
-            es_feriado, turno_trabajo, periodo_estacional
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
 
+        # Insertar datos en cada datamart (en los conservados, sólo los días que falten)
         for datamart_name, conn in self.datamart_connections.items():
-            conn.executemany(insert_sql, tiempo_data)
+            if datamart_name in self.datamarts_conservados:
+                agregados = self.ensure_tiempo(conn, [start_date, end_date])
+                conn.commit()
+                logger.info(f"📊 Dimensión TIEMPO conservada en {datamart_name} ({agregados} días agregados)")
+                continue
+            conn.executemany(SQL_INSERT_TIEMPO, tiempo_data)
             conn.commit()
             logger.info(f"📊 Dimensión TIEMPO poblada en {datamart_name} con {len(tiempo_data)} registros")
 
@@ -192,11 +500,11 @@ class DatamartCreator:
         # Crear dimensiones específicas
         logger.info("📋 Creando dimensiones para Ventas...")
 
-        # Dimensión Producto
-        conn_ventas.execute("DROP TABLE IF EXISTS DIM_PRODUCTO")
-        conn_ventas.execute("""
-        CREATE TABLE DIM_PRODUCTO (
+        # Dimensión Producto (SCD tipo 2: id_producto es la clave sustituta)
+        self.ensure_scd2_table(conn_ventas, "DIM_PRODUCTO", """
+        CREATE TABLE IF NOT EXISTS DIM_PRODUCTO (
             id_producto INTEGER PRIMARY KEY,
+            id_producto_origen INTEGER NOT NULL,
             nombre_producto TEXT NOT NULL,
             tipo_harina TEXT,
             peso_kg REAL,
@@ -204,15 +512,19 @@ class DatamartCreator:
             subcategoria TEXT,
             marca TEXT,
             es_premium BOOLEAN,
-            unidad_medida TEXT
+            unidad_medida TEXT,
+            hash_diff TEXT NOT NULL,
+            valid_from DATE NOT NULL,
+            valid_to DATE NOT NULL,
+            is_current BOOLEAN NOT NULL
         )
-        """)
+        """, "id_producto_origen")
 
-        # Dimensión Cliente
-        conn_ventas.execute("DROP TABLE IF EXISTS DIM_CLIENTE")
-        conn_ventas.execute("""
-        CREATE TABLE DIM_CLIENTE (
+        # Dimensión Cliente (SCD tipo 2: id_cliente es la clave sustituta)
+        self.ensure_scd2_table(conn_ventas, "DIM_CLIENTE", """
+        CREATE TABLE IF NOT EXISTS DIM_CLIENTE (
             id_cliente INTEGER PRIMARY KEY,
+            id_cliente_origen INTEGER NOT NULL,
             nombre_cliente TEXT NOT NULL,
             tipo_cliente TEXT,
             segmento TEXT,
@@ -221,9 +533,13 @@ class DatamartCreator:
             nombre_pais TEXT,
             region TEXT,
             fecha_registro DATE,
-            estado_cliente TEXT
+            estado_cliente TEXT,
+            hash_diff TEXT NOT NULL,
+            valid_from DATE NOT NULL,
+            valid_to DATE NOT NULL,
+            is_current BOOLEAN NOT NULL
         )
-        """)
+        """, "id_cliente_origen")
 
         # Dimensión Geografía
         conn_ventas.execute("DROP TABLE IF EXISTS DIM_GEOGRAFIA")
@@ -265,10 +581,9 @@ class DatamartCreator:
         )
         """)
 
-        # Tabla de Hechos Ventas
-        conn_ventas.execute("DROP TABLE IF EXISTS FACT_VENTAS")
-        conn_ventas.execute("""
-        CREATE TABLE FACT_VENTAS (
+        # Tabla de Hechos Ventas (una tabla por año + vista FACT_VENTAS)
+        particiones = PartitionedFact(conn_ventas, "FACT_VENTAS", """
+        CREATE TABLE IF NOT EXISTS {tabla} (
             id_venta INTEGER PRIMARY KEY,
             id_tiempo INTEGER,
             id_producto INTEGER,
@@ -297,13 +612,15 @@ class DatamartCreator:
             FOREIGN KEY (id_canal) REFERENCES DIM_CANAL(id_canal),
             FOREIGN KEY (id_transporte) REFERENCES DIM_TRANSPORTE(id_transporte)
         )
-        """)
+        """, granularidad='año')
+        particiones.prepare()
 
         # Popular dimensiones
         self.populate_ventas_dimensions(conn_ventas)
 
         # Popular tabla de hechos
-        self.populate_ventas_facts(conn_ventas)
+        self.populate_ventas_facts(conn_ventas, particiones)
+        self.log_partitions("FACT_VENTAS", particiones.finalize(self.fecha_carga))
 
         conn_ventas.commit()
         logger.info("✅ Datamart de VENTAS creado exitosamente")
@@ -312,16 +629,14 @@ class DatamartCreator:
         """Popular las dimensiones del datamart de ventas"""
         logger.info("📊 Poblando dimensiones de Ventas...")
 
-        # Popular DIM_PRODUCTO desde la BD origen
-        productos_df = pd.read_sql_query("""
+        # Popular DIM_PRODUCTO desde la BD origen (SCD tipo 2)
+        productos = []
+        for id_producto, nombre, peso_kg in self.source_conn.execute("""
             SELECT id_producto, nombre_producto, peso_kg
             FROM PRODUCTOS
-        """, self.source_conn)
-
-        for _, row in productos_df.iterrows():
+            ORDER BY id_producto
+        """):
             # Extraer información del nombre del producto
-            nombre = row['nombre_producto']
-
             if "panadera" in nombre.lower():
                 tipo_harina = "Panadera"
                 categoria = "Panadería"
@@ -336,29 +651,31 @@ class DatamartCreator:
                 categoria = "Especial"
 
             es_premium = "premium" in nombre.lower()
-            peso_kg = row['peso_kg']
 
-            conn_ventas.execute("""
-                INSERT INTO DIM_PRODUCTO (
-                    id_producto, nombre_producto, tipo_harina, peso_kg,
-                    categoria, subcategoria, marca, es_premium, unidad_medida
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                row['id_producto'], nombre, tipo_harina, peso_kg,
+            productos.append((
+                id_producto, nombre, tipo_harina, peso_kg,
                 categoria, "Estándar", "Doña Angélica", es_premium, "Sacos"
             ))
 
-        # Popular DIM_CLIENTE desde la BD origen
-        clientes_df = pd.read_sql_query("""
+        resumen = self.apply_scd2(conn_ventas, "DIM_PRODUCTO", "id_producto", "id_producto_origen", [
+            "nombre_producto", "tipo_harina", "peso_kg", "categoria",
+            "subcategoria", "marca", "es_premium", "unidad_medida"
+        ], productos)
+        logger.info(
+            f"📦 DIM_PRODUCTO: {resumen['nuevos']} nuevos, {resumen['versionados']} versionados, "
+            f"{resumen['sin_cambios']} sin cambios"
+        )
+
+        # Popular DIM_CLIENTE desde la BD origen (SCD tipo 2)
+        clientes = []
+        for id_cliente, nombre_cliente, tipo, id_pais, nombre_pais in self.source_conn.execute("""
             SELECT c.id_cliente, c.nombre_cliente, c.tipo_cliente,
                    c.id_pais, p.nombre_pais
             FROM CLIENTES c
             JOIN PAISES p ON c.id_pais = p.id_pais
-        """, self.source_conn)
-
-        for _, row in clientes_df.iterrows():
+            ORDER BY c.id_cliente
+        """):
             # Determinar segmento basado en tipo de cliente
-            tipo = row['tipo_cliente']
             if tipo == "Distribuidor Mayorista":
                 segmento = "Mayorista"
                 tamaño = "Grande"
@@ -372,18 +689,21 @@ class DatamartCreator:
                 segmento = "Otros"
                 tamaño = "Mediano"
 
-            conn_ventas.execute("""
-                INSERT INTO DIM_CLIENTE (
-                    id_cliente, nombre_cliente, tipo_cliente, segmento,
-                    tamaño_empresa, id_pais, nombre_pais, region,
-                    fecha_registro, estado_cliente
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                row['id_cliente'], row['nombre_cliente'], tipo, segmento,
-                tamaño, row['id_pais'], row['nombre_pais'], "América",
-                date(2023, 1, 1), "Activo"
+            clientes.append((
+                id_cliente, nombre_cliente, tipo, segmento,
+                tamaño, id_pais, nombre_pais, "América",
+                date(2023, 1, 1).isoformat(), "Activo"
             ))
 
+        resumen = self.apply_scd2(conn_ventas, "DIM_CLIENTE", "id_cliente", "id_cliente_origen", [
+            "nombre_cliente", "tipo_cliente", "segmento", "tamaño_empresa",
+            "id_pais", "nombre_pais", "region", "fecha_registro", "estado_cliente"
+        ], clientes)
+        logger.info(
+            f"👥 DIM_CLIENTE: {resumen['nuevos']} nuevos, {resumen['versionados']} versionados, "
+            f"{resumen['sin_cambios']} sin cambios"
+        )
+
         # Popular DIM_GEOGRAFIA desde la BD origen
         paises_df = pd.read_sql_query("""
             SELECT id_pais, nombre_pais FROM PAISES
@@ -481,61 +801,69 @@ class DatamartCreator:
 
         logger.info("✅ Dimensiones de Ventas pobladas exitosamente")
 
-    def populate_ventas_facts(self, conn_ventas):
-        """Popular la tabla de hechos de ventas"""
+    def populate_ventas_facts(self, conn_ventas, particiones: PartitionedFact):
+        """Popular la tabla de hechos de ventas (por lotes, sólo particiones abiertas)"""
         logger.info("🎯 Poblando tabla de hechos VENTAS...")
 
-        ventas_df = pd.read_sql_query("""
+        desde = particiones.corte or ''
+        if self.cover_source_dates(conn_ventas, "VENTAS", "fecha_venta", desde):
+            particiones.load_periods()
+        productos = self.load_scd2_versions(conn_ventas, "DIM_PRODUCTO", "id_producto", "id_producto_origen")
+        clientes = self.load_scd2_versions(conn_ventas, "DIM_CLIENTE", "id_cliente", "id_cliente_origen")
+
+        def transformar(lote):
+            filas = []
+            for row in lote:
+                # Resolución de claves (versión de producto/cliente vigente en la fecha)
+                fecha_venta = self.parse_fecha(row['fecha_venta'])
+                fecha_iso = fecha_venta.isoformat()
+                id_tiempo = tiempo_id(fecha_venta)
+                id_producto = self.resolve_scd2(productos, row['id_producto'], fecha_iso)
+                id_cliente = self.resolve_scd2(clientes, row['id_cliente'], fecha_iso)
+
+                # Usar id_pais como id_geografia
+                id_geografia = row['id_pais']
+
+                # Asignar canal aleatorio (1-3)
+                id_canal = random.randint(1, 3)
+
+                # Calcular métricas adicionales
+                costo_producto = row['precio_por_saco'] * 0.65  # 65% del precio es costo
+                margen_bruto = row['total_venta'] - (costo_producto * row['cantidad_sacos'])
+                descuento_aplicado = row['total_venta'] * random.uniform(0, 0.1)  # 0-10% descuento
+                comision_venta = row['total_venta'] * 0.03  # 3% comisión
+
+                filas.append((
+                    row['id_venta'], id_tiempo, id_producto, id_cliente,
+                    id_geografia, id_canal, row['id_medio_transporte'], row['nro_pedido'],
+                    row['cantidad_sacos'], row['cantidad_toneladas'], row['precio_por_saco'],
+                    row['total_venta'], costo_producto, margen_bruto, descuento_aplicado,
+                    row['moneda'], row['tipo_cambio'], row['estado_venta'],
+                    fecha_venta + timedelta(days=random.randint(1, 7)),  # Entrega en 1-7 días
+                    random.choice([0, 30, 60, 90]),  # Días de crédito
+                    comision_venta
+                ))
+            return filas
+
+        total = self.run_fact_pipeline(conn_ventas, f"""
             SELECT v.*, p.peso_kg, c.id_pais
             FROM VENTAS v
             JOIN PRODUCTOS p ON v.id_producto = p.id_producto
             JOIN CLIENTES c ON v.id_cliente = c.id_cliente
-        """, self.source_conn)
-
-        for index, row in ventas_df.iterrows():
-            # Obtener id_tiempo basado en fecha_venta
-            fecha_venta = pd.to_datetime(row['fecha_venta']).date()
-
-            cursor = conn_ventas.execute("""
-                SELECT id_tiempo FROM DIM_TIEMPO WHERE fecha_completa = ?
-            """, (fecha_venta,))
-
-            tiempo_result = cursor.fetchone()
-            id_tiempo = tiempo_result[0] if tiempo_result else 1
-
-            # Usar id_pais como id_geografia
-            id_geografia = row['id_pais']
-
-            # Asignar canal aleatorio (1-3)
-            id_canal = random.randint(1, 3)
-
-            # Calcular métricas adicionales
-            costo_producto = row['precio_por_saco'] * 0.65  # 65% del precio es costo
-            margen_bruto = row['total_venta'] - (costo_producto * row['cantidad_sacos'])
-            descuento_aplicado = row['total_venta'] * random.uniform(0, 0.1)  # 0-10% descuento
-            comision_venta = row['total_venta'] * 0.03  # 3% comisión
-
-            conn_ventas.execute("""
-                INSERT INTO FACT_VENTAS (
-                    id_venta, id_tiempo, id_producto, id_cliente, id_geografia,
-                    id_canal, id_transporte, nro_pedido, cantidad_sacos,
-                    cantidad_toneladas, precio_por_saco, total_venta,
-                    costo_producto, margen_bruto, descuento_aplicado,
-                    moneda, tipo_cambio, estado_venta, fecha_entrega,
-                    dias_credito, comision_venta
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                index + 1, id_tiempo, row['id_producto'], row['id_cliente'],
-                id_geografia, id_canal, row['id_medio_transporte'], row['nro_pedido'],
-                row['cantidad_sacos'], row['cantidad_toneladas'], row['precio_por_saco'],
-                row['total_venta'], costo_producto, margen_bruto, descuento_aplicado,
-                row['moneda'], row['tipo_cambio'], row['estado_venta'],
-                fecha_venta + timedelta(days=random.randint(1, 7)),  # Entrega en 1-7 días
-                random.choice([0, 30, 60, 90]),  # Días de crédito
-                comision_venta
-            ))
-
-        logger.info(f"✅ Tabla de hechos VENTAS poblada con {len(ventas_df)} registros")
+            WHERE v.fecha_venta > ? AND {fecha_valida_sql('v.fecha_venta')}
+            ORDER BY v.id_venta
+        """, transformar, """
+            INSERT INTO {tabla} (
+                id_venta, id_tiempo, id_producto, id_cliente, id_geografia,
+                id_canal, id_transporte, nro_pedido, cantidad_sacos,
+                cantidad_toneladas, precio_por_saco, total_venta,
+                costo_producto, margen_bruto, descuento_aplicado,
+                moneda, tipo_cambio, estado_venta, fecha_entrega,
+                dias_credito, comision_venta
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, params=(desde,), particiones=particiones, en_procesos=True)
+
+        logger.info(f"✅ Tabla de hechos VENTAS poblada con {total} registros")
 
     def create_datamart_inventarios(self):
         """Crear datamart de inventarios completo"""
@@ -574,10 +902,9 @@ class DatamartCreator:
         )
         """)
 
-        # Tabla de hechos de inventario
-        conn_inventarios.execute("DROP TABLE IF EXISTS FACT_INVENTARIO")
-        conn_inventarios.execute("""
-        CREATE TABLE FACT_INVENTARIO (
+        # Tabla de hechos de inventario (una tabla por año-mes + vista FACT_INVENTARIO)
+        particiones = PartitionedFact(conn_inventarios, "FACT_INVENTARIO", """
+        CREATE TABLE IF NOT EXISTS {tabla} (
             id_inventario INTEGER PRIMARY KEY,
             id_tiempo INTEGER,
             id_producto INTEGER,
@@ -595,7 +922,8 @@ class DatamartCreator:
             FOREIGN KEY (id_producto) REFERENCES DIM_PRODUCTO(id_producto),
             FOREIGN KEY (id_almacen) REFERENCES DIM_ALMACEN(id_almacen)
         )
-        """)
+        """, granularidad='mes')
+        particiones.prepare()
 
         # Popular desde BD origen
         almacenes_df = pd.read_sql_query("SELECT * FROM ALMACENES", self.source_conn)
@@ -619,14 +947,20 @@ class DatamartCreator:
             ))
 
         # Poblar tabla de hechos INVENTARIO desde datos origen
-        inventarios_df = pd.read_sql_query("SELECT * FROM INVENTARIOS", self.source_conn)
-
-        if len(inventarios_df) == 0:
+        sql_insert_inventario = """
+            INSERT INTO {tabla} (
+                id_inventario, id_tiempo, id_producto, id_almacen,
+                stock_inicial_ton, entradas_ton, salidas_ton, stock_final_ton,
+                stock_minimo_ton, stock_maximo_ton, valor_unitario, valor_total, estado_stock
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        if self.use_example_data("INVENTARIOS", "FACT_INVENTARIO"):
             logger.info("📊 No hay datos en INVENTARIOS, creando registros de ejemplo...")
             # Generar algunos registros de ejemplo
             productos_df = pd.read_sql_query("SELECT id_producto FROM PRODUCTOS LIMIT 5", self.source_conn)
             almacenes_df = pd.read_sql_query("SELECT id_almacen FROM ALMACENES LIMIT 3", self.source_conn)
 
+            filas_ejemplo = []
             for i in range(20):  # 20 registros de ejemplo
                 fecha_ejemplo = date(2024, 1, 1) + timedelta(days=i*15)
                 cursor = conn_inventarios.execute("SELECT id_tiempo FROM DIM_TIEMPO WHERE fecha_completa = ?", (fecha_ejemplo,))
@@ -636,60 +970,48 @@ class DatamartCreator:
                 id_producto = productos_df.iloc[i % len(productos_df)]['id_producto']
                 id_almacen = almacenes_df.iloc[i % len(almacenes_df)]['id_almacen']
 
-                conn_inventarios.execute("""
-                    INSERT INTO FACT_INVENTARIO (
-                        id_inventario, id_tiempo, id_producto, id_almacen,
-                        stock_inicial_ton, entradas_ton, salidas_ton, stock_final_ton,
-                        stock_minimo_ton, stock_maximo_ton, valor_unitario, valor_total, estado_stock
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    i + 1, id_tiempo, id_producto, id_almacen,
+                filas_ejemplo.append((
+                    i + 1, id_tiempo, int(id_producto), int(id_almacen),
                     random.uniform(100, 500), random.uniform(20, 100), random.uniform(10, 80),
                     random.uniform(200, 600), 50.0, 800.0, 1500.0, random.uniform(300000, 900000), "Óptimo"
                 ))
+            particiones.insert(sql_insert_inventario, filas_ejemplo)
             logger.info(f"✅ Tabla de hechos INVENTARIO poblada con 20 registros de ejemplo")
         else:
-            for index, row in inventarios_df.iterrows():
-                # Obtener fecha del inventario
-                try:
-                    fecha_inventario = pd.to_datetime(row['fecha_registro'], errors='coerce').date()
-                    if fecha_inventario is None:
-                        fecha_inventario = date(2024, 1, 1)  # Fecha por defecto
-                except:
-                    fecha_inventario = date(2024, 1, 1)  # Fecha por defecto en caso de error
-
-                # Buscar ID de tiempo correspondiente
-                cursor = conn_inventarios.execute("""
-                    SELECT id_tiempo FROM DIM_TIEMPO WHERE fecha_completa = ?
-                """, (fecha_inventario,))
-                tiempo_result = cursor.fetchone()
-                id_tiempo = tiempo_result[0] if tiempo_result else 1
-
-                # Usar datos reales de la BD
-                stock_inicial = row['stock_inicial_ton']
-                entradas = row['entradas_ton']
-                salidas = row['salidas_ton']
-                stock_final = row['stock_final_ton']
-                stock_minimo = row['stock_minimo_ton']
-                stock_maximo = row['stock_maximo_ton']
-                valor_unitario = row['costo_unitario']
-                valor_total = row['valor_total']
-                # Usar estado del stock de la BD origen
-                estado_stock = row['estado_stock']
-
-                conn_inventarios.execute("""
-                    INSERT INTO FACT_INVENTARIO (
-                        id_inventario, id_tiempo, id_producto, id_almacen,
-                        stock_inicial_ton, entradas_ton, salidas_ton, stock_final_ton,
-                        stock_minimo_ton, stock_maximo_ton, valor_unitario, valor_total, estado_stock
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    index + 1, id_tiempo, row['id_producto'], row['id_almacen'],
-                    stock_inicial, entradas, salidas, stock_final,
-                    stock_minimo, stock_maximo, valor_unitario, valor_total, estado_stock
-                ))
-
-            logger.info(f"✅ Tabla de hechos INVENTARIO poblada con {len(inventarios_df)} registros")
+            if self.cover_source_dates(conn_inventarios, "INVENTARIOS", "fecha_registro", particiones.corte or ''):
+                particiones.load_periods()
+
+            def transformar(lote):
+                filas = []
+                for row in lote:
+                    # Fecha del inventario y su id de tiempo
+                    fecha_inventario = self.parse_fecha(row['fecha_registro'])
+                    id_tiempo = tiempo_id(fecha_inventario)
+
+                    # Usar datos reales de la BD, incluido el estado del stock
+                    filas.append((
+                        row['id_inventario'], id_tiempo, row['id_producto'], row['id_almacen'],
+                        row['stock_inicial_ton'], row['entradas_ton'], row['salidas_ton'],
+                        row['stock_final_ton'], row['stock_minimo_ton'], row['stock_maximo_ton'],
+                        row['costo_unitario'], row['valor_total'], row['estado_stock']
+                    ))
+                return filas
+
+            total = self.run_fact_pipeline(
+                conn_inventarios,
+                f"SELECT * FROM INVENTARIOS WHERE fecha_registro > ? AND {fecha_valida_sql('fecha_registro')} "
+                "ORDER BY id_inventario",
+                transformar, sql_insert_inventario,
+                params=(particiones.corte or '',), particiones=particiones, en_procesos=True
+            )
+
+            logger.info(f"✅ Tabla de hechos INVENTARIO poblada con {total} registros")
+
+        self.log_partitions("FACT_INVENTARIO", particiones.finalize(self.fecha_carga))
+
+        # Snapshot mensual derivado de las fotos diarias
+        resumen = refresh_inventory_snapshot(conn_inventarios)
+        logger.info(f"✅ Snapshot mensual de INVENTARIO actualizado con {resumen['filas_diarias']} filas diarias")
 
         conn_inventarios.commit()
         logger.info("✅ Datamart de INVENTARIOS creado exitosamente")
@@ -743,7 +1065,9 @@ class DatamartCreator:
             costo_transporte REAL,
             costo_total_distribucion REAL,
             dias_transito INTEGER,
+            dias_habiles_transito INTEGER,
             retraso_dias INTEGER,
+            entrega_a_tiempo BOOLEAN,
             entrega_completa BOOLEAN,
             FOREIGN KEY (id_tiempo_salida) REFERENCES DIM_TIEMPO(id_tiempo),
             FOREIGN KEY (id_tiempo_llegada) REFERENCES DIM_TIEMPO(id_tiempo),
@@ -776,89 +1100,96 @@ class DatamartCreator:
         """, estados_ejemplo)
 
         # Poblar tabla de hechos DISTRIBUCION desde datos origen
-        distribucion_df = pd.read_sql_query("SELECT * FROM DISTRIBUCION", self.source_conn)
-
-        if len(distribucion_df) == 0:
+        sql_insert_distribucion = """
+            INSERT INTO FACT_DISTRIBUCION (
+                id_distribucion, id_tiempo_salida, id_tiempo_llegada, id_ruta, id_estado_envio,
+                nro_guia_remision, cantidad_sacos, cantidad_toneladas, costo_transporte,
+                costo_total_distribucion, dias_transito, dias_habiles_transito, retraso_dias,
+                entrega_a_tiempo, entrega_completa
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        habiles = {}
+
+        def resolver_fechas(salidas: List[date], llegadas: List[date]):
+            """Claves de salida/llegada por columna y días hábiles de tránsito"""
+            claves = self.resolve_date_keys(conn_distribucion, {
+                'id_tiempo_salida': salidas,
+                'id_tiempo_llegada': llegadas,
+            })
+            if any(i not in habiles for i in claves['id_tiempo_salida'] + claves['id_tiempo_llegada']):
+                habiles.update(self.load_dias_habiles(conn_distribucion))
+            dias_habiles = [
+                habiles[llegada] - habiles[salida]
+                for salida, llegada in zip(claves['id_tiempo_salida'], claves['id_tiempo_llegada'])
+            ]
+            return claves['id_tiempo_salida'], claves['id_tiempo_llegada'], dias_habiles
+
+        if self.use_example_data("DISTRIBUCION", "FACT_DISTRIBUCION"):
             logger.info("📊 No hay datos en DISTRIBUCION, creando registros de ejemplo...")
             # Generar algunos registros de ejemplo
-            for i in range(15):  # 15 registros de ejemplo
-                fecha_ejemplo = date(2024, 1, 1) + timedelta(days=i*20)
-                cursor = conn_distribucion.execute("SELECT id_tiempo FROM DIM_TIEMPO WHERE fecha_completa = ?", (fecha_ejemplo,))
-                tiempo_result = cursor.fetchone()
-                id_tiempo_salida = tiempo_result[0] if tiempo_result else 1
-                id_tiempo_llegada = id_tiempo_salida + random.randint(1, 10)
-
-                conn_distribucion.execute("""
-                    INSERT INTO FACT_DISTRIBUCION (
-                        id_distribucion, id_tiempo_salida, id_tiempo_llegada, id_ruta, id_estado_envio,
-                        nro_guia_remision, cantidad_sacos, cantidad_toneladas, costo_transporte,
-                        costo_total_distribucion, dias_transito, retraso_dias, entrega_completa
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    i + 1, id_tiempo_salida, id_tiempo_llegada, random.choice([1, 2, 3]), random.choice([1, 2, 3, 4]),
+            salidas = [date(2024, 1, 1) + timedelta(days=i*20) for i in range(15)]  # 15 registros de ejemplo
+            transitos = [random.randint(1, 10) for _ in salidas]
+            llegadas = [f + timedelta(days=d) for f, d in zip(salidas, transitos)]
+            ids_salida, ids_llegada, dias_habiles = resolver_fechas(salidas, llegadas)
+
+            filas = []
+            for i in range(len(salidas)):
+                retraso_dias = random.randint(0, 3)
+                filas.append((
+                    i + 1, ids_salida[i], ids_llegada[i], random.choice([1, 2, 3]), random.choice([1, 2, 3, 4]),
                     f"GR{i+1:06d}", random.randint(50, 500), random.uniform(2.5, 25.0), random.uniform(500, 5000),
-                    random.uniform(600, 6000), random.randint(1, 15), random.randint(0, 3), random.choice([True, False])
+                    random.uniform(600, 6000), transitos[i], dias_habiles[i], retraso_dias,
+                    retraso_dias == 0, random.choice([True, False])
                 ))
+            conn_distribucion.executemany(sql_insert_distribucion, filas)
             logger.info(f"✅ Tabla de hechos DISTRIBUCIÓN poblada con 15 registros de ejemplo")
         else:
-            for index, row in distribucion_df.iterrows():
-                # Obtener fechas
-                try:
-                    fecha_salida = pd.to_datetime(row['fecha_distribucion'], errors='coerce').date()
-                    if fecha_salida is None:
-                        fecha_salida = date(2024, 1, 1)
-                except:
-                    fecha_salida = date(2024, 1, 1)
-
-                # Calcular fecha de llegada (agregar días de tránsito)
-                dias_transito = random.randint(1, 15)
-                fecha_llegada = fecha_salida + timedelta(days=dias_transito)
-
-                # Buscar IDs de tiempo
-                cursor = conn_distribucion.execute("""
-                    SELECT id_tiempo FROM DIM_TIEMPO WHERE fecha_completa = ?
-                """, (fecha_salida,))
-                tiempo_salida_result = cursor.fetchone()
-                id_tiempo_salida = tiempo_salida_result[0] if tiempo_salida_result else 1
-
-                cursor = conn_distribucion.execute("""
-                    SELECT id_tiempo FROM DIM_TIEMPO WHERE fecha_completa = ?
-                """, (fecha_llegada,))
-                tiempo_llegada_result = cursor.fetchone()
-                id_tiempo_llegada = tiempo_llegada_result[0] if tiempo_llegada_result else id_tiempo_salida + 1
-
-                # Asignar ruta según destino
-                if "internacional" in str(row.get('destino', '')).lower():
-                    id_ruta = 3  # Internacional
-                elif "arequipa" in str(row.get('destino', '')).lower():
-                    id_ruta = 2  # Nacional
-                else:
-                    id_ruta = 1  # Local
-
-                # Estado de envío aleatorio
-                id_estado_envio = random.choice([1, 2, 3, 4])
-
-                # Calcular métricas
-                cantidad_sacos = row.get('cantidad_sacos', random.randint(50, 500))
-                cantidad_toneladas = cantidad_sacos * 0.05  # 50kg por saco
-                costo_transporte = cantidad_toneladas * random.uniform(80, 200)
-                costo_total = costo_transporte * 1.15  # +15% costos adicionales
-                retraso_dias = random.randint(0, 3) if id_estado_envio != 3 else 0
-                entrega_completa = id_estado_envio == 3
-
-                conn_distribucion.execute("""
-                    INSERT INTO FACT_DISTRIBUCION (
-                        id_distribucion, id_tiempo_salida, id_tiempo_llegada, id_ruta, id_estado_envio,
-                        nro_guia_remision, cantidad_sacos, cantidad_toneladas, costo_transporte,
-                        costo_total_distribucion, dias_transito, retraso_dias, entrega_completa
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    index + 1, id_tiempo_salida, id_tiempo_llegada, id_ruta, id_estado_envio,
-                    f"GR{index+1:06d}", cantidad_sacos, cantidad_toneladas, costo_transporte,
-                    costo_total, dias_transito, retraso_dias, entrega_completa
-                ))
-
-            logger.info(f"✅ Tabla de hechos DISTRIBUCIÓN poblada con {len(distribucion_df)} registros")
+            def transformar(lote):
+                # Fechas de salida y llegada (agregar días de tránsito), resueltas por columna
+                salidas = [self.parse_fecha(row['fecha_distribucion']) for row in lote]
+                transitos = [random.randint(1, 15) for _ in lote]
+                llegadas = [f + timedelta(days=d) for f, d in zip(salidas, transitos)]
+                ids_salida, ids_llegada, dias_habiles = resolver_fechas(salidas, llegadas)
+
+                filas = []
+                for i, row in enumerate(lote):
+                    # Asignar ruta según destino
+                    destino = str(row.get('destino', '')).lower()
+                    if "internacional" in destino:
+                        id_ruta = 3  # Internacional
+                    elif "arequipa" in destino:
+                        id_ruta = 2  # Nacional
+                    else:
+                        id_ruta = 1  # Local
+
+                    # Estado de envío aleatorio
+                    id_estado_envio = random.choice([1, 2, 3, 4])
+
+                    # Calcular métricas
+                    cantidad_sacos = row.get('cantidad_sacos', random.randint(50, 500))
+                    cantidad_toneladas = cantidad_sacos * 0.05  # 50kg por saco
+                    costo_transporte = cantidad_toneladas * random.uniform(80, 200)
+                    costo_total = costo_transporte * 1.15  # +15% costos adicionales
+                    retraso_dias = random.randint(0, 3) if id_estado_envio != 3 else 0
+                    entrega_completa = id_estado_envio == 3
+
+                    id_distribucion = row['id_distribucion']
+                    filas.append((
+                        id_distribucion, ids_salida[i], ids_llegada[i], id_ruta, id_estado_envio,
+                        f"GR{id_distribucion:06d}", cantidad_sacos, cantidad_toneladas, costo_transporte,
+                        costo_total, transitos[i], dias_habiles[i], retraso_dias,
+                        retraso_dias == 0, entrega_completa
+                    ))
+                return filas
+
+            total = self.run_fact_pipeline(
+                conn_distribucion,
+                f"SELECT * FROM DISTRIBUCION WHERE {fecha_valida_sql('fecha_distribucion')} ORDER BY id_distribucion",
+                transformar,
+                sql_insert_distribucion
+            )
+
+            logger.info(f"✅ Tabla de hechos DISTRIBUCIÓN poblada con {total} registros")
 
         conn_distribucion.commit()
         logger.info("✅ Datamart de DISTRIBUCIÓN creado exitosamente")
@@ -946,9 +1277,7 @@ class DatamartCreator:
         """, turnos_ejemplo)
 
         # Poblar tabla de hechos PRODUCCION desde datos origen
-        produccion_df = pd.read_sql_query("SELECT * FROM PRODUCCION", self.source_conn)
-
-        if len(produccion_df) == 0:
+        if self.use_example_data("PRODUCCION", "FACT_PRODUCCION"):
             logger.info("📊 No hay datos en PRODUCCION, creando registros de ejemplo...")
             # Generar algunos registros de ejemplo
             for i in range(25):  # 25 registros de ejemplo
@@ -983,71 +1312,191 @@ class DatamartCreator:
                 ))
             logger.info(f"✅ Tabla de hechos PRODUCCIÓN poblada con 25 registros de ejemplo")
         else:
-            for index, row in produccion_df.iterrows():
-                # Obtener fecha de producción
-                try:
-                    fecha_produccion = pd.to_datetime(row['fecha'], errors='coerce').date()
-                    if fecha_produccion is None:
-                        fecha_produccion = date(2024, 1, 1)
-                except:
-                    fecha_produccion = date(2024, 1, 1)
-
-                # Buscar ID de tiempo correspondiente
-                cursor = conn_produccion.execute("""
-                    SELECT id_tiempo FROM DIM_TIEMPO WHERE fecha_completa = ?
-                """, (fecha_produccion,))
-                tiempo_result = cursor.fetchone()
-                id_tiempo = tiempo_result[0] if tiempo_result else 1
-
-                # Asignar línea de producción según tipo de producto
-                id_linea = random.choice([1, 2, 3])  # Rotación entre líneas
-                id_turno = random.choice([1, 2, 3])  # Turnos aleatorios
-
-                # Calcular métricas de producción
-                cantidad_producida = row.get('cantidad_producida_ton', random.uniform(15, 45))
-                cantidad_materia_prima = cantidad_producida * 1.08  # 8% de merma
-                sacos_producidos = int(cantidad_producida * 20)  # 20 sacos por tonelada
-                rendimiento = (cantidad_producida / cantidad_materia_prima) * 100
-                tiempo_produccion = random.uniform(6, 10)  # horas de producción
-                costo_produccion = cantidad_producida * random.uniform(800, 1200)
-                cumple_calidad = random.choice([True, True, True, False])  # 75% cumple
-                porcentaje_merma = ((cantidad_materia_prima - cantidad_producida) / cantidad_materia_prima) * 100
-
-                conn_produccion.execute("""
+            self.cover_source_dates(conn_produccion, "PRODUCCION", "fecha_produccion")
+
+            def transformar(lote):
+                filas = []
+                for row in lote:
+                    # Fecha de producción y su id de tiempo
+                    fecha_produccion = self.parse_fecha(row['fecha_produccion'])
+                    id_tiempo = tiempo_id(fecha_produccion)
+
+                    # Asignar línea de producción según tipo de producto
+                    id_linea = random.choice([1, 2, 3])  # Rotación entre líneas
+                    id_turno = random.choice([1, 2, 3])  # Turnos aleatorios
+
+                    # Calcular métricas de producción
+                    cantidad_producida = row.get('cantidad_producida_ton', random.uniform(15, 45))
+                    cantidad_materia_prima = cantidad_producida * 1.08  # 8% de merma
+                    sacos_producidos = int(cantidad_producida * 20)  # 20 sacos por tonelada
+                    rendimiento = (cantidad_producida / cantidad_materia_prima) * 100
+                    tiempo_produccion = random.uniform(6, 10)  # horas de producción
+                    costo_produccion = cantidad_producida * random.uniform(800, 1200)
+                    cumple_calidad = random.choice([True, True, True, False])  # 75% cumple
+                    porcentaje_merma = ((cantidad_materia_prima - cantidad_producida) / cantidad_materia_prima) * 100
+
+                    id_produccion = row['id_produccion']
+                    filas.append((
+                        id_produccion, id_tiempo, id_linea, id_turno, f"LOTE{id_produccion:05d}",
+                        cantidad_materia_prima, cantidad_producida, sacos_producidos,
+                        rendimiento, tiempo_produccion, costo_produccion,
+                        cumple_calidad, porcentaje_merma
+                    ))
+                return filas
+
+            total = self.run_fact_pipeline(
+                conn_produccion,
+                f"SELECT * FROM PRODUCCION WHERE {fecha_valida_sql('fecha_produccion')} ORDER BY id_produccion",
+                transformar, """
                     INSERT INTO FACT_PRODUCCION (
                         id_produccion, id_tiempo, id_linea_produccion, id_turno, lote_produccion,
                         cantidad_materia_prima_ton, cantidad_producto_terminado_ton, cantidad_sacos_producidos,
                         rendimiento_porcentaje, tiempo_produccion_horas, costo_total_produccion,
                         cumple_estandares_calidad, porcentaje_merma
                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    index + 1, id_tiempo, id_linea, id_turno, f"LOTE{index+1:05d}",
-                    cantidad_materia_prima, cantidad_producida, sacos_producidos,
-                    rendimiento, tiempo_produccion, costo_produccion,
-                    cumple_calidad, porcentaje_merma
-                ))
+                """, en_procesos=True)
 
-            logger.info(f"✅ Tabla de hechos PRODUCCIÓN poblada con {len(produccion_df)} registros")
+            logger.info(f"✅ Tabla de hechos PRODUCCIÓN poblada con {total} registros")
 
         conn_produccion.commit()
         logger.info("✅ Datamart de PRODUCCIÓN creado exitosamente")
 
+    def reconcile_facts(self):
+        """Conciliar conteos, sumas y huellas de cada hecho con la BD origen"""
+        logger.info("🧮 Conciliando tablas de hechos con la BD origen...")
+
+        for conn in self.datamart_connections.values():
+            conn.commit()
+        resultados = reconcile(self.source_conn, self.datamart_connections, omitir=self.hechos_ejemplo)
+        if not log_reconciliation(resultados):
+            fallidas = [r['tabla'] for r in resultados if r['estado'] == 'diferencia']
+            raise RuntimeError(f"Conciliación fallida en {', '.join(fallidas)}")
+
+    def build_bitmap_indexes(self):
+        """Construir índices bitmap de los atributos de baja cardinalidad de cada hecho"""
+        logger.info("🧷 Construyendo índices bitmap...")
+
+        for datamart_name, db_path in self.datamart_paths.items():
+            self.datamart_connections[datamart_name].commit()
+            destino = build_datamart_bitmaps(db_path, conectar=self.connect)
+            if destino:
+                logger.info(f"🧷 Índices bitmap de {datamart_name} guardados en {destino}")
+
+    def export_parquet(self):
+        """Exportar cada datamart a Parquet particionado por año/mes"""
+        modo = "incremental" if self.parquet_incremental else "completa"
+        logger.info(f"📦 Exportando datamarts a Parquet ({modo}) en {self.parquet_dir}...")
+
+        for datamart_name, db_path in self.datamart_paths.items():
+            self.datamart_connections[datamart_name].commit()
+            exporter = ParquetExporter(db_path, self.parquet_dir, conectar=self.connect)
+            resumen = exporter.export(incremental=self.parquet_incremental)
+            logger.info(
+                f"📦 {datamart_name}: {resumen['escritos']} archivos escritos, "
+                f"{resumen['omitidos']} sin cambios, {resumen['eliminados']} particiones eliminadas"
+            )
+
+    def apply_serving_profiles(self):
+        """Dejar cada datamart listo para lecturas concurrentes (WAL, page_size, ANALYZE)"""
+        logger.info("⚙️  Aplicando perfil de servicio a los datamarts...")
+
+        for datamart_name, db_path in self.datamart_paths.items():
+            self.datamart_connections[datamart_name].commit()
+            estado = apply_serving_profile(db_path, conectar=self.connect)
+            logger.info(
+                f"⚙️  {datamart_name}: journal_mode={estado['journal_mode']}, "
+                f"page_size={estado['page_size']}"
+            )
+
+    def write_pg_dumps(self):
+        """Escribir los dumps PostgreSQL (dbs/sql) directamente desde los datamarts"""
+        logger.info(f"🐘 Escribiendo dumps PostgreSQL ({self.dumps_formato}) en {self.dumps_dir}...")
+
+        for datamart_name, db_path in self.datamart_paths.items():
+            self.datamart_connections[datamart_name].commit()
+            resumen = export_pg_dump(db_path, self.dumps_dir, self.dumps_formato, conectar=self.connect)
+            logger.info(
+                f"🐘 {datamart_name}: {resumen['filas']} filas, {resumen['bytes'] / 1024:.1f} KB "
+                f"en {resumen['segundos']:.2f} s -> {resumen['archivo']}"
+            )
+
+    def write_compact_layouts(self):
+        """Escribir copias con layout compacto y comparar tamaño y velocidad de recorrido"""
+        logger.info(f"🗜️  Escribiendo layout compacto en {self.compacto_dir}...")
+
+        os.makedirs(self.compacto_dir, exist_ok=True)
+        for datamart_name, db_path in self.datamart_paths.items():
+            resumen = compact_datamart(db_path, os.path.join(self.compacto_dir, os.path.basename(db_path)),
+                                       conectar=self.connect)
+            logger.info(
+                f"🗜️  {datamart_name}: {resumen['tablas_compactadas']} tablas compactadas, "
+                f"{resumen['tablas_codigos']} tablas de códigos"
+            )
+
+        informe = compare_layouts(
+            os.path.dirname(os.path.abspath(self.datamart_paths['ventas'])), self.compacto_dir,
+            [os.path.basename(p) for p in self.datamart_paths.values()], repeticiones=3,
+            conectar=self.connect
+        )
+        ruta_informe = os.path.join(self.compacto_dir, "compact_report.json")
+        with open(ruta_informe, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+        for archivo, d in informe['datamarts'].items():
+            logger.info(
+                f"🗜️  {archivo}: {d['bytes_original'] / 1024:.1f} KB -> {d['bytes_compacto'] / 1024:.1f} KB "
+                f"({d['razon_tamaño']:.0%})"
+            )
+        logger.info(f"📄 Informe comparativo guardado en {ruta_informe}")
+
     def create_all_datamarts(self):
         """Crear todos los datamarts"""
         try:
             logger.info("🚀 Iniciando creación de datamarts separados...")
 
-            if not self.connect_databases():
-                return False
+            with self.stage("conexiones"):
+                if not self.connect_databases():
+                    return False
 
             # Crear dimensión tiempo común
-            self.create_dimension_tiempo()
+            with self.stage("dim_tiempo"):
+                self.create_dimension_tiempo()
 
             # Crear cada datamart
-            self.create_datamart_ventas()
-            self.create_datamart_inventarios()
-            self.create_datamart_distribucion()
-            self.create_datamart_produccion()
+            with self.stage("ventas"):
+                self.create_datamart_ventas()
+            with self.stage("inventarios"):
+                self.create_datamart_inventarios()
+            with self.stage("distribucion"):
+                self.create_datamart_distribucion()
+            with self.stage("produccion"):
+                self.create_datamart_produccion()
+
+            # Las tablas de hechos deben contener exactamente las filas origen
+            with self.stage("conciliacion"):
+                self.reconcile_facts()
+
+            # Índices bitmap junto a cada datamart
+            with self.stage("bitmaps"):
+                self.build_bitmap_indexes()
+
+            # Exportación columnar opcional
+            if self.parquet_dir:
+                with self.stage("parquet"):
+                    self.export_parquet()
+
+            # Perfil de servicio para los dashboards
+            with self.stage("perfil_servicio"):
+                self.apply_serving_profiles()
+
+            # Dumps PostgreSQL opcionales (los ejecuta deploy_to_aiven.py)
+            if self.dumps_dir:
+                with self.stage("dumps_sql"):
+                    self.write_pg_dumps()
+
+            # Copias con layout compacto opcionales
+            if self.compacto_dir:
+                with self.stage("layout_compacto"):
+                    self.write_compact_layouts()
 
             logger.info("🎉 ¡Todos los datamarts creados exitosamente!")
             return True
@@ -1063,9 +1512,54 @@ def main():
     print("🏭 CREADOR DE DATAMARTS - EMPRESA MOLINERA")
     print("=" * 60)
 
-    creator = DatamartCreator()
-
-    if creator.create_all_datamarts():
+    parser = argparse.ArgumentParser(description="Crear los datamarts de la empresa molinera")
+    parser.add_argument("--parquet", metavar="DIR", help="Exportar los datamarts a Parquet en DIR")
+    parser.add_argument("--parquet-completo", action="store_true",
+                        help="Reescribir todas las particiones Parquet (no incremental)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"Filas por lote en la carga de hechos (por defecto {BATCH_SIZE})")
+    parser.add_argument("--procesos", type=int, default=1,
+                        help="Procesos que transforman los lotes de hechos (la escritura sigue en una conexión)")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="Reconstruir también el historial SCD2 del datamart de ventas")
+    parser.add_argument("--compacto", metavar="DIR",
+                        help="Escribir también copias con layout compacto en DIR y comparar con el actual")
+    parser.add_argument("--dumps-sql", metavar="DIR", nargs="?", const=os.path.join("dbs", "sql"),
+                        help="Escribir dumps PostgreSQL de cada datamart en DIR (por defecto dbs/sql)")
+    parser.add_argument("--dumps-formato", choices=("insert", "copy"), default="insert",
+                        help="insert: INSERT multi-fila (deploy_to_aiven.py); copy: bloques COPY para psql")
+    parser.add_argument("--datos-ejemplo", action="store_true",
+                        help="Generar registros de ejemplo para los hechos cuya tabla origen esté vacía")
+    parser.add_argument("--profile", nargs="?", const="datamarts_profile.json", metavar="JSON",
+                        help="Perfilar cada etapa y escribir el informe (por defecto datamarts_profile.json)")
+    parser.add_argument("--cprofile", metavar="ARCHIVO",
+                        help="Con --profile, volcar cProfile de la etapa más lenta en ARCHIVO")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile or args.cprofile:
+        profiler = BuildProfiler("crear_datamarts.py", cprofile_path=args.cprofile)
+
+    creator = DatamartCreator(
+        parquet_dir=args.parquet,
+        parquet_incremental=not args.parquet_completo,
+        batch_size=args.batch_size,
+        full_refresh=args.full_refresh,
+        profiler=profiler,
+        datos_ejemplo=args.datos_ejemplo,
+        compacto_dir=args.compacto,
+        dumps_dir=args.dumps_sql,
+        dumps_formato=args.dumps_formato,
+        procesos=args.procesos
+    )
+
+    exito = creator.create_all_datamarts()
+    if profiler:
+        informe = profiler.write(args.profile or "datamarts_profile.json")
+        print()
+        print_report(informe)
+
+    if exito:
         print("\n✅ PROCESO COMPLETADO EXITOSAMENTE")
         print("\n📁 Archivos de datamarts creados:")
         for name, path in creator.datamart_paths.items():
@@ -1074,6 +1568,7 @@ def main():
                 print(f"   • {path} ({size:.1f} KB)")
     else:
         print("\n❌ PROCESO FALLIDO - Ver logs para detalles")
+    return 0 if exito else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
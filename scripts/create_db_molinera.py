@@ -11,20 +11,29 @@ import os
 from datetime import datetime, date, timedelta
 import random
 import logging
+import argparse
+from contextlib import nullcontext
+
+from build_profiler import BuildProfiler, print_report
+from sqlite_writer import SQLiteWriter
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class MolineraDatabaseCreator:
-    def __init__(self, db_path='empresa_molinera.db'):
+    def __init__(self, db_path='empresa_molinera.db', profiler=None):
         self.db_path = db_path
         self.conn = None
+        self.profiler = profiler
 
     def connect(self):
         """Conectar a la base de datos SQLite"""
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            if self.profiler:
+                self.conn = self.profiler.connect(self.db_path)
+            else:
+                self.conn = sqlite3.connect(self.db_path)
             self.conn.execute("PRAGMA foreign_keys = ON")
             logger.info(f"Conectado exitosamente a {self.db_path}")
             return True
@@ -32,6 +41,10 @@ class MolineraDatabaseCreator:
             logger.error(f"Error al conectar: {e}")
             return False
 
+    def stage(self, nombre):
+        """Etapa del proceso para el informe de perfilado"""
+        return self.profiler.stage(nombre) if self.profiler else nullcontext()
+
     def close(self):
         """Cerrar conexión"""
         if self.conn:
@@ -383,9 +396,20 @@ class MolineraDatabaseCreator:
             return False
 
     def populate_operational_data(self):
-        """Poblar tablas operativas desde los archivos CSV"""
+        """Poblar tablas operativas desde los archivos CSV
+
+        Las filas se escriben a través de un SQLiteWriter (una conexión dedicada
+        en su propio hilo): mientras se insertan las de un CSV se lee y transforma
+        el siguiente.
+        """
 
+        writer = SQLiteWriter(
+            self.db_path,
+            conectar=self.profiler.connect if self.profiler else sqlite3.connect,
+            pragmas=["foreign_keys = ON"]
+        )
         try:
+            writer.start()
             # Obtener mapeos de IDs
             productos_map = {}
             cursor = self.conn.cursor()
@@ -462,7 +486,7 @@ class MolineraDatabaseCreator:
                             'Entregado'
                         ))
 
-                self.conn.executemany("""
+                writer.put("""
                     INSERT INTO VENTAS (nro_pedido, fecha_venta, id_producto, id_cliente, id_incoterm,
                                       id_medio_transporte, precio_por_saco, cantidad_sacos, cantidad_toneladas,
                                       total_venta, moneda, tipo_cambio, estado_venta)
@@ -494,7 +518,7 @@ class MolineraDatabaseCreator:
                             row['Estado_Stock']
                         ))
 
-                self.conn.executemany("""
+                writer.put("""
                     INSERT INTO INVENTARIOS (fecha_registro, id_producto, id_almacen, stock_inicial_ton,
                                            entradas_ton, salidas_ton, stock_final_ton, stock_minimo_ton,
                                            stock_maximo_ton, costo_unitario, valor_total, estado_stock)
@@ -550,7 +574,7 @@ class MolineraDatabaseCreator:
                             fecha_vencimiento.strftime('%Y-%m-%d %H:%M:%S')
                         ))
 
-                self.conn.executemany("""
+                writer.put("""
                     INSERT INTO PRODUCCION (fecha_produccion, id_producto, id_almacen, cantidad_producida_ton,
                                           horas_produccion, costo_materia_prima, costo_mano_obra, costo_indirecto,
                                           costo_total, turno, estado_lote, numero_lote, fecha_vencimiento)
@@ -583,7 +607,7 @@ class MolineraDatabaseCreator:
                                 '2024-01-01', '2024-12-31', 'Exportación'
                             ))
 
-                self.conn.executemany("""
+                writer.put("""
                     INSERT INTO PRECIOS_PRODUCTO (id_producto, id_pais, precio_venta, moneda,
                                                 fecha_vigencia_inicio, fecha_vigencia_fin, tipo_cliente)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -593,7 +617,8 @@ class MolineraDatabaseCreator:
             if os.path.exists('dataset/DATA_DISTRIBUCION_HARINA_FINAL.csv'):
                 df_distribucion = pd.read_csv('dataset/DATA_DISTRIBUCION_HARINA_FINAL.csv')
 
-                # Obtener mapeo de ventas por pedido
+                # Obtener mapeo de ventas por pedido (las ventas deben estar ya escritas)
+                writer.flush()
                 ventas_map = {}
                 cursor.execute("SELECT id_venta, nro_pedido FROM VENTAS")
                 for row in cursor.fetchall():
@@ -661,7 +686,7 @@ class MolineraDatabaseCreator:
                         ))
                         contador_dist += 1
 
-                self.conn.executemany("""
+                writer.put("""
                     INSERT INTO DISTRIBUCION (fecha_distribucion, id_venta, id_almacen_origen, id_almacen_destino,
                                             id_canal, id_medio_transporte, cantidad_distribuida_ton, costo_transporte,
                                             tiempo_entrega_dias, estado_distribucion, numero_guia, fecha_salida,
@@ -669,11 +694,15 @@ class MolineraDatabaseCreator:
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, distribucion_data)
 
-            self.conn.commit()
+            writer.close()
+            estadisticas = writer.estadisticas
+            logger.info(f"Escritor: {estadisticas['filas']} filas en {estadisticas['lotes']} lotes y "
+                        f"{estadisticas['transacciones']} transacciones ({estadisticas['escritura_s']:.2f} s escribiendo)")
             logger.info("Datos operacionales poblados exitosamente")
             return True
 
         except Exception as e:
+            writer.close(abortar=True)
             logger.error(f"Error poblando datos operacionales: {e}")
             return False
 
@@ -796,8 +825,19 @@ def main():
     print("🏭 CREADOR DE BASE DE DATOS - EMPRESA MOLINERA")
     print("="*50)
 
+    parser = argparse.ArgumentParser(description="Crear la base de datos de la empresa molinera")
+    parser.add_argument("--profile", nargs="?", const="molinera_profile.json", metavar="JSON",
+                        help="Perfilar cada etapa y escribir el informe (por defecto molinera_profile.json)")
+    parser.add_argument("--cprofile", metavar="ARCHIVO",
+                        help="Con --profile, volcar cProfile de la etapa más lenta en ARCHIVO")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile or args.cprofile:
+        profiler = BuildProfiler("create_db_molinera.py", cprofile_path=args.cprofile)
+
     # Crear instancia del creador de BD
-    db_creator = MolineraDatabaseCreator()
+    db_creator = MolineraDatabaseCreator(profiler=profiler)
 
     # Conectar a la BD
     if not db_creator.connect():
@@ -807,31 +847,36 @@ def main():
     try:
         # Crear tablas
         print("\n1️⃣  Creando estructura de tablas...")
-        if not db_creator.create_tables():
-            print("❌ Error creando tablas")
-            return
+        with db_creator.stage("tablas"):
+            if not db_creator.create_tables():
+                print("❌ Error creando tablas")
+                return
 
         # Poblar datos maestros
         print("2️⃣  Poblando datos maestros...")
-        if not db_creator.populate_master_data():
-            print("❌ Error poblando datos maestros")
-            return
+        with db_creator.stage("datos_maestros"):
+            if not db_creator.populate_master_data():
+                print("❌ Error poblando datos maestros")
+                return
 
         # Poblar datos operacionales
         print("3️⃣  Poblando datos operacionales desde CSV...")
-        if not db_creator.populate_operational_data():
-            print("❌ Error poblando datos operacionales")
-            return
+        with db_creator.stage("datos_operacionales"):
+            if not db_creator.populate_operational_data():
+                print("❌ Error poblando datos operacionales")
+                return
 
         # Crear vistas
         print("4️⃣  Creando vistas de análisis...")
-        if not db_creator.create_views():
-            print("❌ Error creando vistas")
-            return
+        with db_creator.stage("vistas"):
+            if not db_creator.create_views():
+                print("❌ Error creando vistas")
+                return
 
         # Generar reporte
         print("5️⃣  Generando reporte resumen...")
-        db_creator.generate_summary_report()
+        with db_creator.stage("reporte"):
+            db_creator.generate_summary_report()
 
     except Exception as e:
         logger.error(f"Error en proceso principal: {e}")
@@ -839,6 +884,10 @@ def main():
     finally:
         # Cerrar conexión
         db_creator.close()
+        if profiler:
+            informe = profiler.write(args.profile or "molinera_profile.json")
+            print()
+            print_report(informe)
 
 if __name__ == "__main__":
     main()
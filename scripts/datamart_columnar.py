@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+MOTOR COLUMNAR EN MEMORIA - DATAMARTS EMPRESA MOLINERA
+Carga la tabla de hechos de un datamart como arreglos NumPy (uno por columna) y
+sus dimensiones como pequeños arreglos de búsqueda. Las consultas de filtro,
+agrupación y agregación se resuelven con máscaras y np.bincount sobre las
+claves foráneas, sin ejecutar JOINs en SQLite.
+
+Uso:
+    python3 scripts/datamart_columnar.py dbs/datamart_ventas.db \\
+        --medida total_venta --por DIM_TIEMPO.nombre_mes DIM_PRODUCTO.tipo_harina
+
+    python3 scripts/datamart_columnar.py dbs/datamart_ventas.db \\
+        --medida margen_bruto --por DIM_CANAL.canal_distribucion --filtro moneda=USD
+
+Las columnas se referencian como `DIM_X.atributo` (o `clave_foranea.atributo`
+cuando la misma dimensión cumple varios roles, p.ej. `id_tiempo_llegada.mes`)
+o directamente por su nombre si pertenecen a la tabla de hechos.
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from fact_partitions import list_partitions
+
+logger = logging.getLogger(__name__)
+
+# Por encima de este número de combinaciones de grupos se compactan las claves
+# con np.unique en lugar de reservar un arreglo denso para bincount.
+MAX_GRUPOS_DENSOS = 1 << 22
+
+Predicado = Union[object, Sequence[object], Callable[[np.ndarray], np.ndarray]]
+
+
+class ColumnaCodificada:
+    """Columna almacenada como códigos enteros más el arreglo de valores distintos"""
+
+    def __init__(self, serie: pd.Series):
+        codigos, valores = pd.factorize(serie, sort=True)
+        self.codigos = codigos.astype(np.int32)
+        self.valores = np.asarray(valores, dtype=object)
+
+    def mascara_valores(self, predicado: Predicado) -> np.ndarray:
+        """Evaluar el predicado sobre los valores distintos (no sobre las filas)"""
+        if callable(predicado):
+            return np.asarray(predicado(self.valores), dtype=bool)
+        if isinstance(predicado, (list, tuple, set, frozenset)):
+            return np.isin(self.valores, list(predicado))
+        return self.valores == predicado
+
+
+class DimensionArrays:
+    """Dimensión de un datamart cargada como arreglos de búsqueda"""
+
+    def __init__(self, nombre: str, clave: str, df: pd.DataFrame):
+        self.nombre = nombre
+        self.clave = clave
+        claves = df[clave].to_numpy(dtype=np.int64)
+        # posicion[clave - minimo] -> fila de la dimensión (-1 si no existe); las
+        # claves pueden ser negativas (DIM_TIEMPO antes de la fecha base)
+        self.minimo = int(claves.min()) if len(claves) else 0
+        self.posicion = np.full(int(claves.max()) - self.minimo + 2 if len(claves) else 1, -1, dtype=np.int32)
+        self.posicion[claves - self.minimo] = np.arange(len(claves), dtype=np.int32)
+        self.columnas = {
+            col: ColumnaCodificada(df[col]) for col in df.columns
+        }
+
+    def filas_para(self, claves_foraneas: np.ndarray) -> np.ndarray:
+        """Traducir un arreglo de claves foráneas a filas de la dimensión"""
+        desplazadas = claves_foraneas - self.minimo
+        fuera = (desplazadas < 0) | (desplazadas >= len(self.posicion))
+        filas = self.posicion[np.where(fuera, len(self.posicion) - 1, desplazadas)]
+        filas[fuera] = -1
+        return filas
+
+
+class ColumnarDatamart:
+    """Tabla de hechos y dimensiones de un datamart cargadas en memoria"""
+
+    def __init__(self, db_path: str, tabla_hechos: Optional[str] = None):
+        self.db_path = db_path
+        self.tabla_hechos = tabla_hechos
+        self.hechos: Dict[str, np.ndarray] = {}
+        self.hechos_texto: Dict[str, ColumnaCodificada] = {}
+        self.dimensiones: Dict[str, DimensionArrays] = {}
+        # clave foránea -> (dimensión, filas de la dimensión por cada fila de hechos)
+        self.enlaces: Dict[str, Tuple[DimensionArrays, np.ndarray]] = {}
+        self.num_filas = 0
+
+    def load(self):
+        """Cargar hechos y dimensiones (una sola vez) desde el archivo SQLite"""
+        inicio = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if self.tabla_hechos is None:
+                self.tabla_hechos = self._detectar_tabla_hechos(conn)
+
+            hechos_df = pd.read_sql_query(f'SELECT * FROM "{self.tabla_hechos}"', conn)
+            self.num_filas = len(hechos_df)
+            for col in hechos_df.columns:
+                serie = hechos_df[col]
+                if pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+                    self.hechos[col] = serie.to_numpy(dtype=np.float64 if serie.isna().any() else None)
+                else:
+                    self.hechos_texto[col] = ColumnaCodificada(serie)
+
+            for fk, dim_tabla, dim_clave in self._claves_foraneas(conn):
+                if dim_tabla not in self.dimensiones:
+                    dim_df = pd.read_sql_query(f'SELECT * FROM "{dim_tabla}"', conn)
+                    self.dimensiones[dim_tabla] = DimensionArrays(dim_tabla, dim_clave, dim_df)
+                dim = self.dimensiones[dim_tabla]
+                # Las claves NULL se marcan aparte: -1 puede ser una clave válida
+                valores = hechos_df[fk].to_numpy(dtype=np.float64)
+                filas = dim.filas_para(np.nan_to_num(valores, nan=0).astype(np.int64))
+                filas[np.isnan(valores)] = -1
+                self.enlaces[fk] = (dim, filas)
+        finally:
+            conn.close()
+
+        logger.info(
+            f"🧮 {self.tabla_hechos} cargada en memoria: {self.num_filas} filas, "
+            f"{len(self.dimensiones)} dimensiones ({time.perf_counter() - inicio:.3f}s)"
+        )
+        return self
+
+    def _detectar_tabla_hechos(self, conn) -> str:
+        tablas = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name LIKE 'FACT\\_%' ESCAPE '\\' "
+            "ORDER BY name"
+        )]
+        if not tablas:
+            raise ValueError(f"No se encontró tabla de hechos en {self.db_path}")
+        return tablas[0]
+
+    def _claves_foraneas(self, conn) -> List[Tuple[str, str, str]]:
+        # Las vistas de hechos particionados no declaran claves: se toman de una partición
+        particiones = list_partitions(conn, self.tabla_hechos)
+        origen = particiones[0]['particion'] if particiones else self.tabla_hechos
+        return [
+            (row[3], row[2], row[4])
+            for row in conn.execute(f'PRAGMA foreign_key_list("{origen}")')
+        ]
+
+    def _resolver(self, referencia: str) -> Tuple[ColumnaCodificada, Optional[np.ndarray]]:
+        """Devolver la columna codificada y las filas de dimensión para una referencia"""
+        if '.' not in referencia:
+            if referencia in self.hechos_texto:
+                return self.hechos_texto[referencia], None
+            if referencia in self.hechos:
+                if referencia not in self.hechos_texto:
+                    self.hechos_texto[referencia] = ColumnaCodificada(pd.Series(self.hechos[referencia]))
+                return self.hechos_texto[referencia], None
+            raise KeyError(f"Columna desconocida en {self.tabla_hechos}: {referencia}")
+
+        prefijo, atributo = referencia.split('.', 1)
+        if prefijo in self.enlaces:
+            dim, filas = self.enlaces[prefijo]
+        else:
+            candidatos = [(d, f) for d, f in self.enlaces.values() if d.nombre == prefijo]
+            if not candidatos:
+                raise KeyError(f"Dimensión desconocida: {prefijo}")
+            if len(candidatos) > 1:
+                raise KeyError(f"{prefijo} cumple varios roles; use la clave foránea como prefijo")
+            dim, filas = candidatos[0]
+        if atributo not in dim.columnas:
+            raise KeyError(f"Atributo desconocido: {referencia}")
+        return dim.columnas[atributo], filas
+
+    def _codigos_por_fila(self, referencia: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Códigos (uno por fila de hechos, -1 si no resuelve) y valores distintos"""
+        columna, filas = self._resolver(referencia)
+        if filas is None:
+            return columna.codigos, columna.valores
+        codigos = columna.codigos[filas]
+        codigos[filas < 0] = -1
+        return codigos, columna.valores
+
+    def mask(self, where: Optional[Dict[str, Predicado]] = None) -> np.ndarray:
+        """Construir la máscara de filas de hechos que cumplen todos los predicados"""
+        mascara = np.ones(self.num_filas, dtype=bool)
+        for referencia, predicado in (where or {}).items():
+            columna, filas = self._resolver(referencia)
+            aceptados = np.append(columna.mascara_valores(predicado), False)  # código -1 -> False
+            codigos = columna.codigos if filas is None else np.where(filas >= 0, columna.codigos[filas], -1)
+            mascara &= aceptados[codigos]
+        return mascara
+
+    def aggregate(self, medida: Optional[str], por: Sequence[str] = (),
+                  where: Optional[Dict[str, Predicado]] = None, agg: str = 'sum') -> pd.DataFrame:
+        """Agregar una medida de hechos agrupando por atributos de dimensión o de hechos
+
+        agg puede ser 'sum', 'count', 'mean', 'min' o 'max'. Con medida=None se cuentan filas.
+        """
+        mascara = self.mask(where)
+        if medida is not None and medida not in self.hechos:
+            raise KeyError(f"Medida desconocida en {self.tabla_hechos}: {medida}")
+
+        grupo = np.zeros(self.num_filas, dtype=np.int64)
+        tamaños = []
+        valores_por_clave = []
+        for referencia in por:
+            codigos, valores = self._codigos_por_fila(referencia)
+            mascara &= codigos >= 0
+            grupo = grupo * len(valores) + codigos
+            tamaños.append(len(valores))
+            valores_por_clave.append(valores)
+
+        grupo = grupo[mascara]
+        pesos = None if medida is None else self.hechos[medida][mascara]
+        if pesos is not None and np.isnan(pesos).any():
+            validos = ~np.isnan(pesos)
+            grupo, pesos = grupo[validos], pesos[validos]
+
+        total_grupos = int(np.prod(tamaños)) if tamaños else 1
+        if total_grupos > MAX_GRUPOS_DENSOS:
+            claves, grupo = np.unique(grupo, return_inverse=True)
+            total_grupos = len(claves)
+        else:
+            claves = None
+
+        conteo = np.bincount(grupo, minlength=total_grupos)
+        if agg == 'count' or medida is None:
+            resultado = conteo
+        elif agg in ('sum', 'mean'):
+            resultado = np.bincount(grupo, weights=pesos, minlength=total_grupos)
+            if agg == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    resultado = resultado / conteo
+        elif agg in ('min', 'max'):
+            ufunc = np.minimum if agg == 'min' else np.maximum
+            resultado = np.full(total_grupos, np.inf if agg == 'min' else -np.inf)
+            ufunc.at(resultado, grupo, pesos)
+        else:
+            raise ValueError(f"Agregación no soportada: {agg}")
+
+        presentes = np.nonzero(conteo)[0]
+        combinados = presentes if claves is None else claves[presentes]
+        columnas = {}
+        for referencia, tamaño, valores in reversed(list(zip(por, tamaños, valores_por_clave))):
+            columnas[referencia] = valores[combinados % tamaño]
+            combinados = combinados // tamaño
+        salida = pd.DataFrame({ref: columnas[ref] for ref in por})
+        salida[f"{agg}_{medida or 'filas'}"] = resultado[presentes]
+        return salida
+
+
+def parse_filtro(texto: str) -> Tuple[str, Predicado]:
+    """Interpretar filtros de línea de comandos: col=valor o col=v1,v2"""
+    columna, _, valor = texto.partition('=')
+    valores = [_convertir_valor(v) for v in valor.split(',')]
+    return columna, valores if len(valores) > 1 else valores[0]
+
+
+def _convertir_valor(valor: str):
+    for tipo in (int, float):
+        try:
+            return tipo(valor)
+        except ValueError:
+            pass
+    return valor
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Consultas columnares en memoria sobre un datamart')
+    parser.add_argument('db_path', help='Archivo SQLite del datamart (ej: dbs/datamart_ventas.db)')
+    parser.add_argument('--hechos', help='Tabla de hechos (por defecto la primera FACT_*)')
+    parser.add_argument('--medida', default=None, help='Medida a agregar (por defecto cuenta filas)')
+    parser.add_argument('--agg', default='sum', choices=['sum', 'count', 'mean', 'min', 'max'])
+    parser.add_argument('--por', nargs='*', default=[], help='Atributos de agrupación')
+    parser.add_argument('--filtro', action='append', default=[], help='Filtro col=valor[,valor...]')
+    parser.add_argument('--repeticiones', type=int, default=5, help='Repeticiones para medir latencia')
+    args = parser.parse_args()
+
+    datamart = ColumnarDatamart(args.db_path, args.hechos).load()
+    where = dict(parse_filtro(f) for f in args.filtro)
+
+    tiempos = []
+    for _ in range(max(1, args.repeticiones)):
+        inicio = time.perf_counter()
+        resultado = datamart.aggregate(args.medida, args.por, where, args.agg)
+        tiempos.append(time.perf_counter() - inicio)
+
+    with pd.option_context('display.max_rows', 200, 'display.width', 160):
+        print(resultado.to_string(index=False))
+    print(f"\n⏱️  Consulta: mejor {min(tiempos) * 1000:.2f} ms, mediana {np.median(tiempos) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
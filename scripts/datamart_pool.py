@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+PERFIL DE SERVICIO Y POOL DE CONEXIONES - DATAMARTS EMPRESA MOLINERA
+
+- apply_serving_profile(): se aplica al final de cada construcción. Fija el
+  page_size (VACUUM), deja el archivo en modo WAL para que muchos lectores no
+  se bloqueen entre sí y actualiza las estadísticas del planificador.
+- ReadOnlyConnectionPool: pool de conexiones de sólo lectura, seguro entre
+  hilos, que comparten los workers de los dashboards. Cada conexión se abre
+  con mmap_size y cache_size de servicio (son parámetros por conexión, no
+  quedan guardados en el archivo).
+
+Uso (medir lecturas concurrentes):
+    python3 scripts/datamart_pool.py bench --hilos 1 2 4 8 --segundos 5
+"""
+
+import argparse
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 16384
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+
+
+def apply_serving_profile(db_path: str, page_size: int = PAGE_SIZE,
+                          conectar: Callable[..., sqlite3.Connection] = sqlite3.connect):
+    """Reescribir el datamart con el page_size de servicio y activar WAL"""
+    conn = conectar(db_path, isolation_level=None)
+    try:
+        # El page_size sólo puede cambiarse fuera de WAL y se aplica con VACUUM
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+        modo = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {
+            'journal_mode': modo,
+            'page_size': conn.execute("PRAGMA page_size").fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+
+def open_read_only(db_path: str, mmap_size: int = MMAP_SIZE, cache_size_kib: int = CACHE_SIZE_KIB):
+    """Abrir una conexión de sólo lectura con los parámetros de servicio"""
+    uri = f"file:{os.path.abspath(db_path)}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute(f"PRAGMA cache_size = -{int(cache_size_kib)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class ReadOnlyConnectionPool:
+    """Pool acotado de conexiones de sólo lectura a un datamart
+
+    Las conexiones se crean bajo demanda hasta `size` y se reutilizan en orden
+    LIFO (la más reciente tiene la caché más caliente). Una conexión sólo la usa
+    un hilo a la vez; en modo WAL los lectores no se bloquean entre sí.
+    """
+
+    def __init__(self, db_path: str, size: int = 8, mmap_size: int = MMAP_SIZE,
+                 cache_size_kib: int = CACHE_SIZE_KIB):
+        self.db_path = db_path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self._libres = queue.LifoQueue()
+        self._creadas = 0
+        self._lock = threading.Lock()
+        self._cerrado = False
+
+    def _acquire(self, timeout: Optional[float]):
+        try:
+            return self._libres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._cerrado:
+                raise RuntimeError("Pool cerrado")
+            if self._creadas < self.size:
+                self._creadas += 1
+                crear = True
+            else:
+                crear = False
+        if crear:
+            try:
+                return open_read_only(self.db_path, self.mmap_size, self.cache_size_kib)
+            except Exception:
+                with self._lock:
+                    self._creadas -= 1
+                raise
+        try:
+            return self._libres.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Sin conexiones libres para {self.db_path}")
+
+    def _release(self, conn):
+        if self._cerrado:
+            conn.close()
+        else:
+            self._libres.put(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = 30.0):
+        conn = self._acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def execute(self, sql: str, params: Sequence = ()):
+        """Ejecutar una consulta y devolver (columnas, filas)"""
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            return [d[0] for d in cursor.description], cursor.fetchall()
+
+    def close(self):
+        with self._lock:
+            self._cerrado = True
+        while True:
+            try:
+                self._libres.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class DatamartPools:
+    """Un pool por datamart, creado bajo demanda"""
+
+    def __init__(self, rutas: Dict[str, str], size: int = 8):
+        self.rutas = rutas
+        self.size = size
+        self._pools: Dict[str, ReadOnlyConnectionPool] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, datamart: str) -> ReadOnlyConnectionPool:
+        with self._lock:
+            if datamart not in self._pools:
+                self._pools[datamart] = ReadOnlyConnectionPool(self.rutas[datamart], self.size)
+            return self._pools[datamart]
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+
+
+def measure_throughput(ejecutar, consultas: List[tuple], hilos: int, segundos: float) -> Dict:
+    """Lanzar `hilos` lectores durante `segundos` y medir consultas por segundo"""
+    fin = time.perf_counter() + segundos
+    conteos = [0] * hilos
+    errores = []
+
+    def lector(i):
+        n = 0
+        try:
+            while time.perf_counter() < fin:
+                datamart, sql = consultas[(i + n) % len(consultas)]
+                ejecutar(datamart, sql)
+                n += 1
+        except Exception as e:  # se informa al final
+            errores.append(e)
+        conteos[i] = n
+
+    trabajadores = [threading.Thread(target=lector, args=(i,)) for i in range(hilos)]
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    duracion = time.perf_counter() - inicio
+    return {'hilos': hilos, 'consultas': sum(conteos), 'qps': sum(conteos) / duracion, 'errores': len(errores)}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from datamart_queries import CONSULTAS, DATAMARTS, DBS_DIR
+
+    parser = argparse.ArgumentParser(description='Perfil de servicio y pool de lectura de los datamarts')
+    parser.add_argument('--dbs', default=DBS_DIR, help='Directorio con los archivos datamart_*.db')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    sub.add_parser('profile', help='Aplicar el perfil de servicio (WAL, page_size) a los datamarts')
+
+    p_bench = sub.add_parser('bench', help='Medir lecturas concurrentes: pool vs conexión por consulta')
+    p_bench.add_argument('--hilos', type=int, nargs='+', default=[1, 2, 4, 8])
+    p_bench.add_argument('--segundos', type=float, default=3.0)
+    args = parser.parse_args()
+
+    rutas = {nombre: os.path.join(args.dbs, archivo) for nombre, archivo in DATAMARTS.items()}
+
+    if args.comando == 'profile':
+        for nombre, ruta in rutas.items():
+            estado = apply_serving_profile(ruta)
+            logger.info(f"⚙️  {nombre}: journal_mode={estado['journal_mode']}, page_size={estado['page_size']}")
+        return 0
+
+    consultas = [(c['datamart'], c['sql']) for c in CONSULTAS.values()]
+
+    def por_consulta(datamart, sql):
+        conn = sqlite3.connect(rutas[datamart])
+        try:
+            conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    print(f"{'hilos':>5} {'conexión/consulta qps':>22} {'pool qps':>10}")
+    for hilos in args.hilos:
+        pools = DatamartPools(rutas, size=hilos)
+        sin_pool = measure_throughput(por_consulta, consultas, hilos, args.segundos)
+        con_pool = measure_throughput(lambda d, s: pools[d].execute(s), consultas, hilos, args.segundos)
+        pools.close()
+        print(f"{hilos:>5} {sin_pool['qps']:>22.1f} {con_pool['qps']:>10.1f}"
+              + (f"  ({con_pool['errores'] + sin_pool['errores']} errores)"
+                 if con_pool['errores'] + sin_pool['errores'] else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
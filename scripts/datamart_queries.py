@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+CONSULTAS KPI - DATAMARTS EMPRESA MOLINERA
+Catálogo de consultas analíticas con nombre sobre los datamarts y motores para
+ejecutarlas:
+
+- sqlite: el ejecutor por filas de SQLite sobre los archivos datamart_*.db
+- duckdb: motor columnar embebido (opcional, `pip install duckdb`) que lee los
+  mismos archivos SQLite directamente, o bien la exportación Parquet generada
+  con `crear_datamarts.py --parquet DIR`
+
+Uso:
+    python3 scripts/datamart_queries.py list
+    python3 scripts/datamart_queries.py run ventas_por_mes_producto --motor duckdb
+    python3 scripts/datamart_queries.py run margen_por_canal --desde 2024-04-01 --hasta 2024-06-30
+    python3 scripts/datamart_queries.py bench --repeticiones 5 --parquet parquet
+"""
+
+import argparse
+import logging
+import math
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from fact_partitions import pruned_source
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - dependencia opcional
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+DBS_DIR = os.path.join(os.path.dirname(__file__), '..', 'dbs')
+
+DATAMARTS = {
+    'ventas': 'datamart_ventas.db',
+    'inventarios': 'datamart_inventarios.db',
+    'distribucion': 'datamart_distribucion.db',
+    'produccion': 'datamart_produccion.db',
+}
+
+# Consultas KPI típicas. Todas las columnas van calificadas para que el mismo
+# SQL funcione en SQLite y en DuckDB.
+CONSULTAS = {
+    'ventas_por_mes_producto': {
+        'datamart': 'ventas',
+        'descripcion': 'Ventas y toneladas por mes y tipo de harina',
+        'sql': """
+            SELECT t.año, t.mes, t.nombre_mes, p.tipo_harina,
+                   COUNT(*) AS pedidos,
+                   SUM(f.cantidad_toneladas) AS toneladas,
+                   SUM(f.total_venta) AS total_venta
+            FROM FACT_VENTAS f
+            JOIN DIM_TIEMPO t ON t.id_tiempo = f.id_tiempo
+            JOIN DIM_PRODUCTO p ON p.id_producto = f.id_producto
+            GROUP BY t.año, t.mes, t.nombre_mes, p.tipo_harina
+            ORDER BY t.año, t.mes, p.tipo_harina
+        """,
+    },
+    'ventas_por_geografia': {
+        'datamart': 'ventas',
+        'descripcion': 'Ventas por país y zona comercial',
+        'sql': """
+            SELECT g.continente, g.zona_comercial, g.pais,
+                   COUNT(*) AS pedidos,
+                   SUM(f.total_venta) AS total_venta,
+                   AVG(f.precio_por_saco) AS precio_promedio_saco
+            FROM FACT_VENTAS f
+            JOIN DIM_GEOGRAFIA g ON g.id_geografia = f.id_geografia
+            GROUP BY g.continente, g.zona_comercial, g.pais
+            ORDER BY total_venta DESC, g.pais
+        """,
+    },
+    'margen_por_canal': {
+        'datamart': 'ventas',
+        'descripcion': 'Margen bruto y comisión por canal y moneda',
+        'sql': """
+            SELECT c.canal_distribucion, f.moneda,
+                   SUM(f.total_venta) AS total_venta,
+                   SUM(f.margen_bruto) AS margen_bruto,
+                   SUM(f.margen_bruto) / SUM(f.total_venta) * 100 AS margen_porcentaje,
+                   SUM(f.comision_venta) AS comision
+            FROM FACT_VENTAS f
+            JOIN DIM_CANAL c ON c.id_canal = f.id_canal
+            GROUP BY c.canal_distribucion, f.moneda
+            ORDER BY c.canal_distribucion, f.moneda
+        """,
+    },
+    'cobertura_stock_por_almacen': {
+        'datamart': 'inventarios',
+        'descripcion': 'Stock promedio y días de cobertura por almacén y producto',
+        'sql': """
+            SELECT a.nombre_almacen, p.nombre_producto,
+                   AVG(f.stock_final_ton) AS stock_promedio_ton,
+                   AVG(f.salidas_ton) AS salida_diaria_ton,
+                   AVG(f.stock_final_ton) / NULLIF(AVG(f.salidas_ton), 0) AS dias_cobertura,
+                   SUM(CASE WHEN f.stock_final_ton < f.stock_minimo_ton THEN 1 ELSE 0 END) AS dias_bajo_minimo
+            FROM FACT_INVENTARIO f
+            JOIN DIM_ALMACEN a ON a.id_almacen = f.id_almacen
+            JOIN DIM_PRODUCTO p ON p.id_producto = f.id_producto
+            GROUP BY a.nombre_almacen, p.nombre_producto
+            ORDER BY a.nombre_almacen, p.nombre_producto
+        """,
+    },
+    'stock_cierre_mensual': {
+        'datamart': 'inventarios',
+        'descripcion': 'Stock de apertura/cierre, movimientos y días bajo mínimo por mes y producto',
+        'sql': """
+            SELECT s.año, s.mes, p.nombre_producto,
+                   SUM(s.stock_apertura_ton) AS stock_apertura_ton,
+                   SUM(s.stock_cierre_ton) AS stock_cierre_ton,
+                   SUM(s.entradas_ton) AS entradas_ton,
+                   SUM(s.salidas_ton) AS salidas_ton,
+                   SUM(s.dias_bajo_minimo) AS dias_bajo_minimo,
+                   SUM(s.valor_cierre) AS valor_cierre
+            FROM FACT_INVENTARIO_MENSUAL s
+            JOIN DIM_PRODUCTO p ON p.id_producto = s.id_producto
+            GROUP BY s.año, s.mes, p.nombre_producto
+            ORDER BY s.año, s.mes, p.nombre_producto
+        """,
+    },
+    'envios_a_tiempo_por_ruta': {
+        'datamart': 'distribucion',
+        'descripcion': 'Envíos, entregas a tiempo y costo por ruta y mes de salida',
+        'sql': """
+            SELECT r.codigo_ruta, r.descripcion_ruta, t.año, t.mes,
+                   COUNT(*) AS envios,
+                   SUM(CASE WHEN f.retraso_dias = 0 THEN 1 ELSE 0 END) AS envios_a_tiempo,
+                   AVG(f.dias_transito) AS dias_transito_promedio,
+                   SUM(f.costo_total_distribucion) AS costo_total
+            FROM FACT_DISTRIBUCION f
+            JOIN DIM_RUTA r ON r.id_ruta = f.id_ruta
+            JOIN DIM_TIEMPO t ON t.id_tiempo = f.id_tiempo_salida
+            GROUP BY r.codigo_ruta, r.descripcion_ruta, t.año, t.mes
+            ORDER BY r.codigo_ruta, t.año, t.mes
+        """,
+    },
+    'rendimiento_por_linea_turno': {
+        'datamart': 'produccion',
+        'descripcion': 'Rendimiento, merma y costo por línea y turno',
+        'sql': """
+            SELECT l.nombre_linea, tu.nombre_turno,
+                   COUNT(*) AS lotes,
+                   SUM(f.cantidad_producto_terminado_ton) AS toneladas,
+                   AVG(f.rendimiento_porcentaje) AS rendimiento_promedio,
+                   AVG(f.porcentaje_merma) AS merma_promedio,
+                   SUM(f.costo_total_produccion) / SUM(f.cantidad_producto_terminado_ton) AS costo_por_tonelada
+            FROM FACT_PRODUCCION f
+            JOIN DIM_LINEA_PRODUCCION l ON l.id_linea = f.id_linea_produccion
+            JOIN DIM_TURNO tu ON tu.id_turno = f.id_turno
+            GROUP BY l.nombre_linea, tu.nombre_turno
+            ORDER BY l.nombre_linea, tu.nombre_turno
+        """,
+    },
+}
+
+
+# Tipos declarados en SQLite -> DuckDB (REAL de SQLite es de 8 bytes: DOUBLE)
+TIPOS_DUCKDB = {
+    'INTEGER': 'BIGINT',
+    'REAL': 'DOUBLE',
+    'TEXT': 'VARCHAR',
+    'BOOLEAN': 'BOOLEAN',
+    'DATE': 'DATE',
+    'DATETIME': 'TIMESTAMP',
+}
+
+
+# Tabla de hechos de las consultas del catálogo (siempre con alias f)
+PATRON_HECHOS = re.compile(r'\bFROM\s+(FACT_\w+)\s+f\b')
+
+
+def datamart_path(datamart: str, dbs_dir: str = DBS_DIR) -> str:
+    return os.path.join(dbs_dir, DATAMARTS[datamart])
+
+
+def prune_query(conn, sql: str, desde: Optional[str] = None,
+                hasta: Optional[str] = None) -> Tuple[str, List]:
+    """Restringir la tabla de hechos de `sql` a un rango de fechas
+
+    `FROM FACT_X f` se sustituye por una subconsulta sobre las particiones que
+    cubren [desde, hasta]; `conn` es una conexión sqlite3 al datamart (registro
+    de particiones y DIM_TIEMPO). Devuelve (sql, parámetros del rango).
+    """
+    coincidencia = PATRON_HECHOS.search(sql)
+    if coincidencia is None:
+        raise ValueError("La consulta no tiene una tabla de hechos con alias f")
+    fuente, parametros = pruned_source(conn, coincidencia.group(1), desde, hasta)
+    return sql[:coincidencia.start()] + f'FROM {fuente} f' + sql[coincidencia.end():], parametros
+
+
+Resultado = Tuple[List[str], List[tuple]]
+
+
+class SQLiteBackend:
+    """Ejecuta las consultas con sqlite3 sobre los archivos .db"""
+
+    nombre = 'sqlite'
+
+    def __init__(self, dbs_dir: str = DBS_DIR):
+        self.dbs_dir = dbs_dir
+        self.connections: Dict[str, sqlite3.Connection] = {}
+
+    def _conn(self, datamart: str):
+        if datamart not in self.connections:
+            uri = f"file:{os.path.abspath(datamart_path(datamart, self.dbs_dir))}?mode=ro"
+            self.connections[datamart] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return self.connections[datamart]
+
+    def run(self, datamart: str, sql: str, params: Sequence = ()) -> Resultado:
+        cursor = self._conn(datamart).execute(sql, params)
+        columnas = [d[0] for d in cursor.description]
+        return columnas, cursor.fetchall()
+
+    def registry(self, datamart: str):
+        """Conexión sqlite3 para leer el registro de particiones"""
+        return self._conn(datamart)
+
+    def close(self):
+        for conn in self.connections.values():
+            conn.close()
+        self.connections = {}
+
+
+class DuckDBBackend:
+    """Ejecuta el mismo SQL en DuckDB (columnar, embebido, en proceso)
+
+    fuente='sqlite' lee los archivos .db (extensión sqlite de DuckDB; si no está
+    disponible se cargan las tablas una vez en memoria). fuente='parquet' usa la
+    exportación de parquet_export.py.
+    """
+
+    nombre = 'duckdb'
+
+    def __init__(self, dbs_dir: str = DBS_DIR, fuente: str = 'sqlite', parquet_dir: Optional[str] = None):
+        if duckdb is None:
+            raise RuntimeError("El motor duckdb requiere el paquete duckdb (pip install duckdb)")
+        if fuente == 'parquet' and not parquet_dir:
+            raise ValueError("fuente='parquet' requiere parquet_dir")
+        self.dbs_dir = dbs_dir
+        self.fuente = fuente
+        self.parquet_dir = parquet_dir
+        self.connections = {}
+        self.registros: Dict[str, sqlite3.Connection] = {}
+
+    def _conn(self, datamart: str):
+        if datamart in self.connections:
+            return self.connections[datamart]
+        conn = duckdb.connect()
+        if self.fuente == 'parquet':
+            self._crear_vistas_parquet(conn, datamart)
+        else:
+            self._adjuntar_sqlite(conn, datamart)
+        self.connections[datamart] = conn
+        return conn
+
+    def _adjuntar_sqlite(self, conn, datamart: str):
+        ruta = os.path.abspath(datamart_path(datamart, self.dbs_dir))
+        try:
+            conn.execute("INSTALL sqlite; LOAD sqlite;")
+            conn.execute(f"ATTACH '{ruta}' AS dm (TYPE sqlite, READ_ONLY); USE dm;")
+        except duckdb.Error as e:
+            logger.warning(f"⚠️  Extensión sqlite de DuckDB no disponible ({e}); cargando {datamart} en memoria")
+            origen = sqlite3.connect(ruta)
+            try:
+                tablas = [r[0] for r in origen.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'"
+                )]
+                for tabla in tablas:
+                    self._cargar_tabla(conn, origen, tabla)
+                for (sql,) in origen.execute("SELECT sql FROM sqlite_master WHERE type = 'view'"):
+                    conn.execute(sql)
+            finally:
+                origen.close()
+
+    @staticmethod
+    def _cargar_tabla(conn, origen, tabla: str):
+        columnas = [(r[1], TIPOS_DUCKDB.get((r[2] or 'TEXT').upper(), 'VARCHAR'))
+                    for r in origen.execute(f'PRAGMA table_info("{tabla}")')]
+        definicion = ', '.join(f'"{c}" {tipo}' for c, tipo in columnas)
+        conn.execute(f'CREATE TABLE "{tabla}" ({definicion})')
+        filas_df = pd.read_sql_query(f'SELECT * FROM "{tabla}"', origen)
+        conn.register('filas_df', filas_df)
+        conn.execute(f'INSERT INTO "{tabla}" SELECT * FROM filas_df')
+        conn.unregister('filas_df')
+
+    def _crear_vistas_parquet(self, conn, datamart: str):
+        base = os.path.abspath(os.path.join(self.parquet_dir, DATAMARTS[datamart].rsplit('.db', 1)[0]))
+        if not os.path.isdir(base):
+            raise FileNotFoundError(f"No existe la exportación Parquet de {datamart}: {base}")
+        for entrada in sorted(os.listdir(base)):
+            ruta = os.path.join(base, entrada)
+            if entrada.endswith('.parquet'):
+                conn.execute(f"CREATE VIEW \"{entrada[:-8]}\" AS SELECT * FROM read_parquet('{ruta}')")
+            elif os.path.isdir(ruta):
+                # Las columnas de partición (año/mes) no forman parte de la tabla de hechos
+                conn.execute(
+                    f"CREATE VIEW \"{entrada}\" AS SELECT * FROM "
+                    f"read_parquet('{ruta}/**/*.parquet', hive_partitioning = false)"
+                )
+
+    def run(self, datamart: str, sql: str, params: Sequence = ()) -> Resultado:
+        cursor = self._conn(datamart).execute(sql, list(params))
+        columnas = [d[0] for d in cursor.description]
+        return columnas, cursor.fetchall()
+
+    def registry(self, datamart: str):
+        """Conexión sqlite3 al archivo .db para leer el registro de particiones"""
+        if self.fuente == 'parquet':
+            # La exportación Parquet no conserva las tablas de partición
+            raise ValueError("El filtro por fechas con poda de particiones requiere fuente='sqlite'")
+        if datamart not in self.registros:
+            uri = f"file:{os.path.abspath(datamart_path(datamart, self.dbs_dir))}?mode=ro"
+            self.registros[datamart] = sqlite3.connect(uri, uri=True)
+        return self.registros[datamart]
+
+    def close(self):
+        for conn in [*self.connections.values(), *self.registros.values()]:
+            conn.close()
+        self.connections = {}
+        self.registros = {}
+
+
+def run_query(backend, nombre: str, params: Sequence = (), desde: Optional[str] = None,
+              hasta: Optional[str] = None) -> Resultado:
+    """Ejecutar una consulta del catálogo con el motor indicado
+
+    Con `desde`/`hasta` (fechas ISO) sólo se leen las particiones de hechos
+    que cubren el rango.
+    """
+    consulta = CONSULTAS[nombre]
+    sql = consulta['sql']
+    if desde or hasta:
+        sql, parametros = prune_query(backend.registry(consulta['datamart']), sql, desde, hasta)
+        params = [*parametros, *params]
+    return backend.run(consulta['datamart'], sql, params)
+
+
+def _normalizar(valor):
+    if isinstance(valor, bool):
+        return int(valor)
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+
+def results_match(a: Resultado, b: Resultado, rel_tol: float = 1e-9) -> bool:
+    """Comparar resultados de dos motores (tolerancia relativa para sumas en coma flotante)"""
+    if len(a[1]) != len(b[1]):
+        return False
+    for fila_a, fila_b in zip(a[1], b[1]):
+        if len(fila_a) != len(fila_b):
+            return False
+        for va, vb in zip(map(_normalizar, fila_a), map(_normalizar, fila_b)):
+            if isinstance(va, (int, float)) and isinstance(vb, (int, float)) and va is not None:
+                if not math.isclose(va, vb, rel_tol=rel_tol, abs_tol=1e-9):
+                    return False
+            elif va != vb:
+                return False
+    return True
+
+
+def benchmark(backends: Sequence, nombres: Sequence[str], repeticiones: int = 5) -> List[Dict]:
+    """Medir cada consulta en cada motor y verificar que los resultados coinciden"""
+    resultados = []
+    for nombre in nombres:
+        referencia = None
+        fila = {'consulta': nombre}
+        for backend in backends:
+            run_query(backend, nombre)  # calentamiento (conexión, carga, caché)
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                resultado = run_query(backend, nombre)
+                tiempos.append(time.perf_counter() - inicio)
+            fila[f'{backend.nombre}_ms'] = statistics.median(tiempos) * 1000
+            if referencia is None:
+                referencia = resultado
+            else:
+                fila[f'{backend.nombre}_coincide'] = results_match(referencia, resultado)
+        resultados.append(fila)
+    return resultados
+
+
+def _crear_backend(nombre: str, args):
+    if nombre == 'sqlite':
+        return SQLiteBackend(args.dbs)
+    return DuckDBBackend(args.dbs, fuente='parquet' if args.parquet else 'sqlite', parquet_dir=args.parquet)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Consultas KPI sobre los datamarts')
+    parser.add_argument('--dbs', default=DBS_DIR, help='Directorio con los archivos datamart_*.db')
+    parser.add_argument('--parquet', help='Usar la exportación Parquet de este directorio (motor duckdb)')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    sub.add_parser('list', help='Listar las consultas disponibles')
+
+    p_run = sub.add_parser('run', help='Ejecutar una consulta')
+    p_run.add_argument('nombre', choices=sorted(CONSULTAS))
+    p_run.add_argument('--motor', default='sqlite', choices=['sqlite', 'duckdb'])
+    p_run.add_argument('--desde', help='Fecha inicial (YYYY-MM-DD) de los hechos a leer')
+    p_run.add_argument('--hasta', help='Fecha final (YYYY-MM-DD) de los hechos a leer')
+
+    p_bench = sub.add_parser('bench', help='Comparar SQLite y DuckDB en todas las consultas')
+    p_bench.add_argument('--repeticiones', type=int, default=5)
+    p_bench.add_argument('consultas', nargs='*', help='Consultas a medir (por defecto todas)')
+    args = parser.parse_args()
+
+    if args.comando == 'list':
+        for nombre, consulta in CONSULTAS.items():
+            print(f"{nombre:32} [{consulta['datamart']}] {consulta['descripcion']}")
+        return 0
+
+    if args.comando == 'run':
+        backend = _crear_backend(args.motor, args)
+        inicio = time.perf_counter()
+        columnas, filas = run_query(backend, args.nombre, desde=args.desde, hasta=args.hasta)
+        duracion = time.perf_counter() - inicio
+        print(' | '.join(columnas))
+        for fila in filas:
+            print(' | '.join('' if v is None else str(v) for v in fila))
+        print(f"\n⏱️  {len(filas)} filas en {duracion * 1000:.1f} ms ({args.motor})")
+        backend.close()
+        return 0
+
+    backends = [SQLiteBackend(args.dbs), _crear_backend('duckdb', args)]
+    resultados = benchmark(backends, args.consultas or list(CONSULTAS), args.repeticiones)
+    print(f"{'consulta':32} {'sqlite ms':>10} {'duckdb ms':>10} {'acel.':>7}  coincide")
+    todo_ok = True
+    for fila in resultados:
+        aceleracion = fila['sqlite_ms'] / fila['duckdb_ms'] if fila['duckdb_ms'] else float('inf')
+        todo_ok &= fila['duckdb_coincide']
+        print(f"{fila['consulta']:32} {fila['sqlite_ms']:10.2f} {fila['duckdb_ms']:10.2f} "
+              f"{aceleracion:6.1f}x  {'sí' if fila['duckdb_coincide'] else 'NO'}")
+    for backend in backends:
+        backend.close()
+    return 0 if todo_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+SERVICIO HTTP DE CONSULTAS KPI - DATAMARTS EMPRESA MOLINERA
+Servicio local basado en asyncio que expone las consultas KPI con nombre de
+datamart_queries.py para los widgets de los dashboards:
+
+    GET /kpi                       -> lista de consultas
+    GET /kpi/<nombre>              -> resultado en JSON
+    GET /kpi/<nombre>?formato=arrow -> resultado como stream columnar Arrow IPC
+    GET /salud                     -> estado del servicio
+
+El trabajo SQLite corre en un pool de hilos acotado (con el pool de conexiones
+de sólo lectura de datamart_pool.py) y las peticiones idénticas que llegan
+mientras otra está en curso se agrupan en una sola ejecución.
+
+Uso:
+    python3 scripts/datamart_service.py serve --puerto 8765 --hilos 4
+    python3 scripts/datamart_service.py loadgen --puerto 8765 --concurrencia 32 --peticiones 2000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - dependencia opcional
+    pa = None
+
+from datamart_pool import DatamartPools
+from datamart_queries import CONSULTAS, DATAMARTS, DBS_DIR
+
+logger = logging.getLogger(__name__)
+
+TIPO_ARROW = 'application/vnd.apache.arrow.stream'
+TIPO_JSON = 'application/json; charset=utf-8'
+
+ESTADOS_HTTP = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                406: 'Not Acceptable', 500: 'Internal Server Error'}
+
+
+def _arrow_stream(columnas: List[str], filas: List[tuple]) -> bytes:
+    tabla = pa.Table.from_arrays(
+        [pa.array([f[i] for f in filas]) for i in range(len(columnas))], names=columnas
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tabla.schema) as writer:
+        writer.write_table(tabla)
+    return sink.getvalue().to_pybytes()
+
+
+class KPIQueryService:
+    """Servidor HTTP asyncio sobre los datamarts"""
+
+    def __init__(self, dbs_dir: str = DBS_DIR, hilos: int = 4):
+        rutas = {nombre: os.path.join(dbs_dir, archivo) for nombre, archivo in DATAMARTS.items()}
+        self.pools = DatamartPools(rutas, size=hilos)
+        self.executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='kpi')
+        self.en_curso: Dict[str, asyncio.Future] = {}
+        self.estadisticas = {'peticiones': 0, 'ejecuciones': 0, 'agrupadas': 0, 'errores': 0}
+
+    def _ejecutar(self, nombre: str) -> Tuple[List[str], List[tuple]]:
+        consulta = CONSULTAS[nombre]
+        return self.pools[consulta['datamart']].execute(consulta['sql'])
+
+    async def run_query(self, nombre: str):
+        """Ejecutar una consulta, reutilizando una ejecución idéntica en curso"""
+        futuro = self.en_curso.get(nombre)
+        if futuro is not None:
+            self.estadisticas['agrupadas'] += 1
+            return await asyncio.shield(futuro)
+
+        loop = asyncio.get_running_loop()
+        futuro = loop.run_in_executor(self.executor, self._ejecutar, nombre)
+        self.en_curso[nombre] = futuro
+        self.estadisticas['ejecuciones'] += 1
+        try:
+            return await asyncio.shield(futuro)
+        finally:
+            if self.en_curso.get(nombre) is futuro:
+                del self.en_curso[nombre]
+
+    async def _responder(self, writer, estado: int, cuerpo: bytes, tipo: str, keep_alive: bool):
+        cabeceras = [
+            f"HTTP/1.1 {estado} {ESTADOS_HTTP.get(estado, '')}",
+            f"Content-Type: {tipo}",
+            f"Content-Length: {len(cuerpo)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(('\r\n'.join(cabeceras) + '\r\n\r\n').encode('latin-1') + cuerpo)
+        await writer.drain()
+
+    async def _json(self, writer, estado: int, datos, keep_alive: bool):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        await self._responder(writer, estado, cuerpo, TIPO_JSON, keep_alive)
+
+    async def _atender(self, metodo: str, destino: str, cabeceras: Dict[str, str], writer, keep_alive: bool):
+        self.estadisticas['peticiones'] += 1
+        if metodo != 'GET':
+            return await self._json(writer, 405, {'error': 'Sólo se admite GET'}, keep_alive)
+
+        url = urlsplit(destino)
+        partes = [p for p in url.path.split('/') if p]
+        if partes == ['salud']:
+            return await self._json(writer, 200, {'estado': 'ok', **self.estadisticas}, keep_alive)
+        if partes == ['kpi']:
+            return await self._json(writer, 200, {
+                nombre: {'datamart': c['datamart'], 'descripcion': c['descripcion']}
+                for nombre, c in CONSULTAS.items()
+            }, keep_alive)
+        if len(partes) != 2 or partes[0] != 'kpi' or partes[1] not in CONSULTAS:
+            return await self._json(writer, 404, {'error': f'Consulta desconocida: {url.path}'}, keep_alive)
+
+        formato = parse_qs(url.query).get('formato', [''])[0]
+        if not formato:
+            formato = 'arrow' if TIPO_ARROW in cabeceras.get('accept', '') else 'json'
+        if formato not in ('json', 'arrow'):
+            return await self._json(writer, 400, {'error': f'Formato no soportado: {formato}'}, keep_alive)
+        if formato == 'arrow' and pa is None:
+            return await self._json(writer, 406, {'error': 'pyarrow no está instalado'}, keep_alive)
+
+        nombre = partes[1]
+        try:
+            columnas, filas = await self.run_query(nombre)
+        except Exception as e:
+            self.estadisticas['errores'] += 1
+            logger.error(f"❌ Error ejecutando {nombre}: {e}")
+            return await self._json(writer, 500, {'error': str(e)}, keep_alive)
+
+        if formato == 'arrow':
+            cuerpo = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _arrow_stream, columnas, filas
+            )
+            return await self._responder(writer, 200, cuerpo, TIPO_ARROW, keep_alive)
+        return await self._json(writer, 200, {
+            'consulta': nombre, 'columnas': columnas, 'filas': [list(f) for f in filas]
+        }, keep_alive)
+
+    async def handle_connection(self, reader, writer):
+        """Atender peticiones HTTP/1.1 (con keep-alive) de una conexión"""
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, destino, version = linea.decode('latin-1').split()
+                except ValueError:
+                    await self._json(writer, 400, {'error': 'Petición mal formada'}, False)
+                    break
+                cabeceras = {}
+                while True:
+                    cabecera = await reader.readline()
+                    if cabecera in (b'\r\n', b'\n', b''):
+                        break
+                    clave, _, valor = cabecera.decode('latin-1').partition(':')
+                    cabeceras[clave.strip().lower()] = valor.strip()
+                if int(cabeceras.get('content-length', 0) or 0):
+                    await reader.readexactly(int(cabeceras['content-length']))
+
+                conexion = cabeceras.get('connection', '').lower()
+                keep_alive = conexion != 'close' if version == 'HTTP/1.1' else conexion == 'keep-alive'
+                await self._atender(metodo, destino, cabeceras, writer, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, puerto: int):
+        servidor = await asyncio.start_server(self.handle_connection, host, puerto)
+        logger.info(f"🌐 Servicio KPI escuchando en http://{host}:{puerto}/kpi")
+        async with servidor:
+            await servidor.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pools.close()
+
+
+async def _cliente(host: str, puerto: int, rutas: List[str], contador, latencias: List[float], errores: List[str]):
+    """Cliente keep-alive; si el servidor cierra la conexión, se anota el error y se reconecta"""
+    writer = None
+    try:
+        while True:
+            if writer is None:
+                try:
+                    reader, writer = await asyncio.open_connection(host, puerto)
+                except OSError as e:
+                    # Sin conexión posible este cliente termina; el resto sigue
+                    errores.append(f"{host}:{puerto}: no se pudo conectar ({e})")
+                    return
+            n = contador['siguiente']
+            if n >= contador['total']:
+                break
+            contador['siguiente'] += 1
+            ruta = rutas[n % len(rutas)]
+            inicio = time.perf_counter()
+            try:
+                writer.write(f"GET {ruta} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+                await writer.drain()
+                linea = (await reader.readline()).split()
+                if len(linea) < 2:
+                    raise ConnectionResetError('el servidor cerró la conexión')
+                estado = int(linea[1])
+                largo = 0
+                while True:
+                    cabecera = await reader.readline()
+                    if cabecera in (b'\r\n', b''):
+                        break
+                    if cabecera.lower().startswith(b'content-length:'):
+                        largo = int(cabecera.split(b':', 1)[1])
+                await reader.readexactly(largo)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                errores.append(f"{ruta}: {e or type(e).__name__}")
+                writer.close()
+                writer = None
+                continue
+            latencias.append(time.perf_counter() - inicio)
+            if estado != 200:
+                errores.append(f"{ruta}: HTTP {estado}")
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[indice]
+
+
+async def run_load(host: str, puerto: int, concurrencia: int, peticiones: int,
+                   formato: str = 'json', consultas: Optional[List[str]] = None) -> Dict:
+    """Generador de carga: `concurrencia` clientes keep-alive repartiéndose `peticiones`"""
+    nombres = consultas or list(CONSULTAS)
+    rutas = [f"/kpi/{n}?formato={formato}" for n in nombres]
+    contador = {'siguiente': 0, 'total': peticiones}
+    latencias: List[float] = []
+    errores: List[str] = []
+    inicio = time.perf_counter()
+    await asyncio.gather(*[
+        _cliente(host, puerto, rutas, contador, latencias, errores) for _ in range(concurrencia)
+    ])
+    duracion = time.perf_counter() - inicio
+    return {
+        'peticiones': len(latencias),
+        'errores': len(errores),
+        'segundos': duracion,
+        'rps': len(latencias) / duracion if duracion else 0.0,
+        'p50_ms': _percentil(latencias, 50) * 1000 if latencias else 0.0,
+        'p99_ms': _percentil(latencias, 99) * 1000 if latencias else 0.0,
+        'media_ms': statistics.mean(latencias) * 1000 if latencias else 0.0,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Servicio HTTP de consultas KPI sobre los datamarts')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_serve = sub.add_parser('serve', help='Levantar el servicio')
+    p_serve.add_argument('--dbs', default=DBS_DIR, help='Directorio con los archivos datamart_*.db')
+    p_serve.add_argument('--host', default='127.0.0.1')
+    p_serve.add_argument('--puerto', type=int, default=8765)
+    p_serve.add_argument('--hilos', type=int, default=4, help='Hilos para el trabajo SQLite')
+
+    p_load = sub.add_parser('loadgen', help='Generar carga contra una instancia local')
+    p_load.add_argument('--host', default='127.0.0.1')
+    p_load.add_argument('--puerto', type=int, default=8765)
+    p_load.add_argument('--concurrencia', type=int, default=16)
+    p_load.add_argument('--peticiones', type=int, default=1000)
+    p_load.add_argument('--formato', default='json', choices=['json', 'arrow'])
+    p_load.add_argument('consultas', nargs='*', help='Consultas a pedir (por defecto todas)')
+    args = parser.parse_args()
+
+    if args.comando == 'serve':
+        servicio = KPIQueryService(args.dbs, args.hilos)
+        try:
+            asyncio.run(servicio.serve(args.host, args.puerto))
+        except KeyboardInterrupt:
+            logger.info("🛑 Servicio detenido")
+        finally:
+            servicio.close()
+        return 0
+
+    resumen = asyncio.run(run_load(
+        args.host, args.puerto, args.concurrencia, args.peticiones, args.formato, args.consultas or None
+    ))
+    print(f"Peticiones: {resumen['peticiones']} ({resumen['errores']} errores) en {resumen['segundos']:.2f}s "
+          f"-> {resumen['rps']:.1f} req/s")
+    print(f"Latencia p50: {resumen['p50_ms']:.2f} ms | p99: {resumen['p99_ms']:.2f} ms | "
+          f"media: {resumen['media_ms']:.2f} ms")
+    return 0 if resumen['errores'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+TELEMETRÍA DE DESPLIEGUE - DATAMARTS EMPRESA MOLINERA
+Métricas por tabla de deploy_to_aiven.py y destino nulo para medir el
+despliegue sin una base PostgreSQL remota.
+
+- DeployMetrics: filas, bytes enviados, tiempo, filas/s y reintentos de cada
+  tabla; muestra el progreso a medida que terminan las tablas (los esquemas se
+  cargan en paralelo, así que es seguro entre hilos) y escribe un resumen JSON
+- NullPool / NullConnection: destino que acepta todo lo que enviaría psycopg2
+  (sentencias y flujos COPY) y lo descarta después de consumirlo. El flujo de
+  conversión (lectura SQLite, tipos, CSV, reescritura de dumps) se ejecuta
+  completo, de modo que el tiempo medido es el del lado cliente
+
+Uso:
+    python3 scripts/deploy_to_aiven.py --modo copy --destino-nulo --resumen deploy.json
+    python3 scripts/deploy_telemetry.py deploy.json
+    python3 scripts/deploy_telemetry.py deploy.json --base deploy_anterior.json
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Tamaño de lectura de psycopg2 en copy_expert
+COPY_READ_SIZE = 8192
+
+# Caída de filas/s respecto a la base que se considera regresión
+UMBRAL_REGRESION = 0.20
+
+
+class DeployMetrics:
+    """Métricas por tabla y por esquema de un despliegue"""
+
+    def __init__(self, modo: str = '', destino: str = '', stream=None):
+        self.modo = modo
+        self.destino = destino
+        self.stream = stream or sys.stdout
+        self.inicio = datetime.now()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.tablas: List[Dict] = []
+        self.esquemas: Dict[str, Dict] = {}
+        self._intentos: Dict[str, int] = {}
+
+    def begin_schema(self, schema: str, attempt: int = 1):
+        """Inicio (o reintento) de la carga de un esquema"""
+        with self._lock:
+            self._intentos[schema] = attempt
+            if attempt > 1:
+                # Las tablas del intento fallido se vuelven a cargar, salvo las ya confirmadas
+                self.tablas = [t for t in self.tablas if t['esquema'] != schema or t.get('confirmada')]
+
+    def table(self, schema: str, table: str, rows: Optional[int], nbytes: int, seconds: float,
+              detail: str = '', committed: bool = False) -> Dict:
+        """Registrar una tabla terminada e imprimir su línea de progreso"""
+        with self._lock:
+            registro = {
+                'esquema': schema,
+                'tabla': table,
+                'filas': rows,
+                'bytes': nbytes,
+                'segundos': round(seconds, 4),
+                'filas_s': round(rows / seconds, 1) if rows and seconds > 0 else None,
+                'mb_s': round(nbytes / 1048576 / seconds, 3) if seconds > 0 else None,
+                'reintentos': self._intentos.get(schema, 1) - 1,
+            }
+            if committed:
+                registro['confirmada'] = True
+            self.tablas.append(registro)
+            n = len(self.tablas)
+            filas = f'{rows} filas' if rows is not None else 'sentencias'
+            ritmo = f", {registro['filas_s']:.0f} filas/s" if registro['filas_s'] else ''
+            reintentos = f", reintento {registro['reintentos']}" if registro['reintentos'] else ''
+            print(f'  [{n:3d}] {schema}.{table}: {filas}, {nbytes / 1048576:.2f} MB en {seconds:.2f} s'
+                  f'{ritmo}{reintentos}{detail}', file=self.stream, flush=True)
+        return registro
+
+    def schema_done(self, schema: str, seconds: float, error: Optional[BaseException] = None,
+                    extra: Optional[Dict] = None):
+        with self._lock:
+            self.esquemas[schema] = {
+                'segundos': round(seconds, 3),
+                'reintentos': self._intentos.get(schema, 1) - 1,
+                'error': None if error is None else f'{type(error).__name__}: {error}',
+                **(extra or {}),
+            }
+
+    def summary(self) -> Dict:
+        with self._lock:
+            tablas = list(self.tablas)
+            esquemas = dict(self.esquemas)
+        segundos = time.perf_counter() - self._t0
+        filas = sum(t['filas'] or 0 for t in tablas)
+        nbytes = sum(t['bytes'] for t in tablas)
+        return {
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'modo': self.modo,
+            'destino': self.destino,
+            'total': {
+                'segundos': round(segundos, 3),
+                'tablas': len(tablas),
+                'filas': filas,
+                'bytes': nbytes,
+                'filas_s': round(filas / segundos, 1) if segundos > 0 else None,
+                'mb_s': round(nbytes / 1048576 / segundos, 3) if segundos > 0 else None,
+                'reintentos': sum(e['reintentos'] for e in esquemas.values()),
+            },
+            'esquemas': esquemas,
+            'tablas': tablas,
+        }
+
+    def write(self, path: str) -> Dict:
+        resumen = self.summary()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2)
+        return resumen
+
+
+class NullCursor:
+    """Cursor que consume sentencias y flujos COPY sin enviarlos a ningún servidor"""
+
+    def __init__(self, connection: 'NullConnection'):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        self.connection.statements += 1
+        self.connection.bytes += len(sql.encode('utf-8'))
+
+    def copy_expert(self, sql, stream, size=COPY_READ_SIZE):
+        self.execute(sql)
+        while True:
+            chunk = stream.read(size)
+            if not chunk:
+                break
+            self.connection.bytes += len(chunk.encode('utf-8'))
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NullConnection:
+    """Conexión del destino nulo: transacciones vacías, cuenta sentencias y bytes"""
+
+    def __init__(self):
+        self.autocommit = False
+        self.statements = 0
+        self.bytes = 0
+        self.commits = 0
+
+    def cursor(self):
+        return NullCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullPool:
+    """Sustituto de ThreadedConnectionPool para el destino nulo"""
+
+    def __init__(self, minconn, maxconn, dsn=None):
+        self.maxconn = maxconn
+
+    def getconn(self):
+        return NullConnection()
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+
+def compare_summaries(actual: Dict, base: Dict, umbral: float = UMBRAL_REGRESION) -> List[Dict]:
+    """Tablas cuyo ritmo (filas/s) cayó más de `umbral` respecto a un resumen base"""
+    previas = {(t['esquema'], t['tabla']): t for t in base.get('tablas', [])}
+    regresiones = []
+    for t in actual.get('tablas', []):
+        b = previas.get((t['esquema'], t['tabla']))
+        if not b or not b.get('filas_s') or not t.get('filas_s'):
+            continue
+        cambio = t['filas_s'] / b['filas_s'] - 1
+        if cambio < -umbral:
+            regresiones.append({'esquema': t['esquema'], 'tabla': t['tabla'],
+                                'filas_s': t['filas_s'], 'base_filas_s': b['filas_s'],
+                                'cambio': round(cambio, 3)})
+    return regresiones
+
+
+def print_summary(resumen: Dict):
+    total = resumen['total']
+    print(f"📦 Despliegue {resumen['modo']} -> {resumen['destino']} ({resumen['inicio']}): "
+          f"{total['tablas']} tablas, {total['filas']} filas, {total['bytes'] / 1048576:.2f} MB "
+          f"en {total['segundos']:.2f} s ({total['filas_s'] or 0:.0f} filas/s, "
+          f"{total['mb_s'] or 0:.2f} MB/s), {total['reintentos']} reintentos")
+    print(f"{'esquema.tabla':48} {'filas':>9} {'MB':>8} {'s':>8} {'filas/s':>10} {'reint':>5}")
+    for t in sorted(resumen['tablas'], key=lambda t: -t['segundos']):
+        print(f"{t['esquema'] + '.' + t['tabla']:48} {t['filas'] if t['filas'] is not None else '-':>9} "
+              f"{t['bytes'] / 1048576:8.2f} {t['segundos']:8.3f} {t['filas_s'] or 0:10.0f} {t['reintentos']:5d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mostrar (y comparar) resúmenes de despliegue')
+    parser.add_argument('resumen', help='JSON escrito con deploy_to_aiven.py --resumen')
+    parser.add_argument('--base', help='Resumen anterior con el que comparar filas/s por tabla')
+    parser.add_argument('--umbral', type=float, default=UMBRAL_REGRESION,
+                        help='Caída relativa de filas/s considerada regresión (por defecto 0.20)')
+    args = parser.parse_args()
+
+    with open(args.resumen, 'r', encoding='utf-8') as f:
+        resumen = json.load(f)
+    print_summary(resumen)
+    if not args.base:
+        return 0
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    regresiones = compare_summaries(resumen, base, args.umbral)
+    for r in regresiones:
+        print(f"🐢 {r['esquema']}.{r['tabla']}: {r['filas_s']:.0f} filas/s "
+              f"(base {r['base_filas_s']:.0f}, {r['cambio']:+.0%})")
+    if not regresiones:
+        print('✅ Sin regresiones de ritmo respecto a la base')
+    return 1 if regresiones else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
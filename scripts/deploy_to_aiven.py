@@ -5,21 +5,93 @@ deploy_to_aiven.py
 Conecta a una base PostgreSQL (Aiven) usando psycopg2, crea un esquema por cada archivo
 datamart (ej: datamart_ventas.db.sql -> esquema datamart_ventas) y ejecuta
 los scripts SQL `bi/dbs/sql/datamart_*.db.sql` dentro de su esquema correspondiente.
+Esos dumps se generan ya listos para PostgreSQL con `crear_datamarts.py --dumps-sql`
+(pg_dump_export.py); los dumps antiguos de SQLite se siguen adaptando al vuelo.
+
+Modo `copy`: lee directamente los archivos `dbs/datamart_*.db`, crea cada tabla con tipos
+mapeados desde `PRAGMA table_info` y la carga en streaming con COPY (CSV), sin generar ni
+parsear dumps SQL. Las vistas (p.ej. FACT_VENTAS sobre sus particiones) se recrean al final.
+Cada datamart se carga en una transacción: el esquema queda completo o no cambia.
+
+Por defecto (ambos modos) las tablas se crean sin clave primaria ni restricciones, se cargan, y
+después se crean claves primarias, UNIQUE, índices y claves foráneas (NOT VALID y luego
+VALIDATE), se ejecuta ANALYZE y se informa el tiempo de cada fase y el plan de una búsqueda
+por cada índice. --sin-diferir crea las claves antes de cargar, como antes.
+
+Los esquemas son independientes y se cargan en paralelo (--paralelo N conexiones de un pool).
+Con --todo-o-nada sólo se confirma si todos los esquemas cargaron bien.
+
+Con --incremental (modo copy) cada tabla se divide en particiones mensuales de su columna
+id_tiempo*; SQLite y PostgreSQL calculan en una sola pasada una huella por partición
+(filas y suma de md5 de la fila en texto canónico) y sólo se reenvían, con borrado e
+inserción, las particiones que difieren. Un redepliegue sin cambios no transfiere filas.
+
+Con --reanudar (modo copy) cada lote de filas se confirma por separado y la tabla
+public.deploy_checkpoint registra, por esquema y tabla, las filas ya confirmadas y las
+tablas terminadas. Si el despliegue se corta, la siguiente ejecución con --reanudar salta
+lo terminado y sigue desde el último lote confirmado (si el archivo .db cambió, empieza de cero).
+
+Cada tabla cargada muestra una línea de progreso con filas, MB enviados, tiempo, filas/s y
+reintentos; --resumen escribe esas métricas en JSON (deploy_telemetry.py las muestra y compara
+con un resumen anterior). Si se cae la conexión de un esquema se reintenta (--reintentos N) en
+una conexión nueva. --destino-nulo ejecuta todo el flujo de conversión contra un destino que
+descarta lo recibido, sin DATABASE_URL: mide el lado cliente del despliegue sin base remota.
 
 Uso (local):
     export DATABASE_URL='postgres://...'?sslmode=require
     python3 scripts/deploy_to_aiven.py
+    python3 scripts/deploy_to_aiven.py --modo copy --dbs dbs
+    python3 scripts/deploy_to_aiven.py --modo copy --paralelo 4 --todo-o-nada
+    python3 scripts/deploy_to_aiven.py --modo copy --incremental
+    python3 scripts/deploy_to_aiven.py --modo copy --reanudar
+    python3 scripts/deploy_to_aiven.py --modo copy --destino-nulo --resumen deploy.json
+
+Prueba contra un PostgreSQL local:
+    DATABASE_URL='postgresql://postgres@localhost:5432/postgres' python3 scripts/deploy_to_aiven.py --modo copy
 
 Nota: para seguridad no incluyas credenciales en el repo. Usa la variable de entorno DATABASE_URL
 """
+import argparse
+import functools
+import hashlib
+import itertools
 import os
 import glob
+import sqlite3
 import sys
+import time
+from datetime import date, timedelta
 import psycopg2
 import re
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.pool import ThreadedConnectionPool
+
+from deploy_telemetry import DeployMetrics, NullPool
+from pg_types import ORDEN_DIFERIDAS, TablePlan, base_type, deferred_ddl, quote_ident
+from sql_dump_stream import DumpRewriter, iter_batches, rewrite_dump
 
 SQL_GLOB = os.path.join(os.path.dirname(__file__), '..', 'dbs', 'sql', 'datamart_*.db.sql')
+DBS_DIR = os.path.join(os.path.dirname(__file__), '..', 'dbs')
 
+# Rows fetched from SQLite per batch while streaming a table into COPY
+COPY_BATCH_SIZE = 5000
+
+# Rows per committed batch in resumable mode (one COPY and one checkpoint update each)
+CHECKPOINT_ROWS = 100000
+CHECKPOINT_TABLE = 'public.deploy_checkpoint'
+
+# Attempts per schema when the connection drops (OperationalError/InterfaceError), and the
+# pause before each retry (multiplied by the attempt number)
+RETRIES = 2
+RETRY_BACKOFF = 2.0
+
+# Session settings for the post-load index builds (parallel btree builds in PostgreSQL 11+)
+MAINTENANCE_WORK_MEM = '256MB'
+PARALLEL_MAINTENANCE_WORKERS = 4
+
+# id_tiempo is the day number since this date (same convention as crear_datamarts.tiempo_id),
+# so monthly partitions are id_tiempo ranges on both sides
+TIEMPO_BASE = date(2023, 1, 1)
 
 def load_file(path):
     with open(path, 'r', encoding='utf-8') as f:
@@ -137,69 +209,706 @@ def schema_name_from_path(p):
     return s
 
 
-def main():
-    # Connection URL can come from env DATABASE_URL or hardcoded for convenience (not recommended)
-    dsn = os.environ.get('DATABASE_URL')
-    if not dsn:
-        print('Error: set DATABASE_URL environment variable', file=sys.stderr)
-        sys.exit(1)
+class CopyStream:
+    """File-like object that renders SQLite rows as CSV on demand for cursor.copy_expert.
+
+    Only one batch of rows is held in memory, so tables of any size are streamed.
+    `rows` and `bytes` (UTF-8 size of the CSV sent) count what has been read so far.
+    """
+
+    def __init__(self, sqlite_cursor, plan, batch_size=COPY_BATCH_SIZE, max_rows=None):
+        self.cursor = sqlite_cursor
+        self.plan = plan
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.rows = 0
+        self.bytes = 0
+        self._buffer = ''
+        self._done = False
+
+    def _fill(self):
+        size = self.batch_size
+        if self.max_rows is not None:
+            size = min(size, self.max_rows - self.rows)
+        batch = self.cursor.fetchmany(size) if size > 0 else []
+        if not batch:
+            self._done = True
+            return
+        self.rows += len(batch)
+        text = self.plan.format_rows(batch)
+        self.bytes += len(text.encode('utf-8'))
+        self._buffer += text
+
+    def read(self, size=-1):
+        while not self._done and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+def stream_rows(cur, sqlite_conn, plan, where='', params=()):
+    """COPY the rows of a SQLite table (optionally filtered) into the PostgreSQL table of the same name.
+
+    Returns (rows, bytes sent).
+    """
+    names = plan.column_list()
+    source = sqlite_conn.execute(f'SELECT {names} FROM {quote_ident(plan.table)} {where}', params)
+    stream = CopyStream(source, plan)
+    cur.copy_expert(f'COPY {quote_ident(plan.table)} ({names}) FROM STDIN WITH (FORMAT csv)', stream)
+    return stream.rows, stream.bytes
+
+
+def copy_table(cur, sqlite_conn, table, plan=None):
+    """Create `table` in the current schema and stream its rows with COPY. Returns (rows, bytes)."""
+    plan = plan or TablePlan.from_sqlite(sqlite_conn, table)
+    cur.execute(f'DROP TABLE IF EXISTS {quote_ident(table)} CASCADE;')
+    cur.execute(plan.ddl())
+    return stream_rows(cur, sqlite_conn, plan)
+
+
+def _month_range(month):
+    """id_tiempo range [first day, last day] of a YYYYMM bucket"""
+    year, m = divmod(month, 100)
+    first = date(year, m, 1)
+    last = date(year + m // 12, m % 12 + 1, 1) - timedelta(days=1)
+    return (first - TIEMPO_BASE).days + 1, (last - TIEMPO_BASE).days + 1
 
-    # Create list of files to execute
-    sql_files = sorted(glob.glob(SQL_GLOB))
-    if not sql_files:
-        print('No se encontraron archivos SQL en:', SQL_GLOB, file=sys.stderr)
-        sys.exit(1)
 
-    conn = None
+def time_column(columns):
+    """Column used to split a table into monthly partitions (id_tiempo, id_tiempo_salida...)"""
+    for name, ctype, _, _ in columns:
+        if name.startswith('id_tiempo') and ctype == 'BIGINT':
+            return name
+    return None
+
+
+def _sqlite_render(name, ctype):
+    c = quote_ident(name)
+    ctype = base_type(ctype)
+    if ctype == 'BOOLEAN':
+        return (f"CASE WHEN {c} IS NULL THEN NULL WHEN lower(CAST({c} AS TEXT)) "
+                f"IN ('1', 't', 'true', 'yes', 'si', 'sí') THEN 't' ELSE 'f' END")
+    if ctype in ('DOUBLE PRECISION', 'NUMERIC'):
+        return f"printf('%.6f', {c})"
+    if ctype == 'DATE':
+        return f"date({c})"
+    if ctype == 'TIMESTAMP':
+        return f"strftime('%Y-%m-%d %H:%M:%S', {c})"
+    return f"CAST({c} AS TEXT)"
+
+
+def _pg_render(name, ctype):
+    c = quote_ident(name)
+    ctype = base_type(ctype)
+    if ctype == 'BOOLEAN':
+        return f"CASE WHEN {c} THEN 't' WHEN NOT {c} THEN 'f' END"
+    if ctype in ('DOUBLE PRECISION', 'NUMERIC'):
+        return f"round({c}::numeric, 6)::text"
+    if ctype == 'DATE':
+        return f"to_char({c}, 'YYYY-MM-DD')"
+    if ctype == 'TIMESTAMP':
+        return f"to_char({c}, 'YYYY-MM-DD HH24:MI:SS')"
+    return f"{c}::text"
+
+
+def _row_text(columns, render):
+    """Canonical text of a row, identical in SQLite and PostgreSQL for the loaded values"""
+    return " || '|' || ".join(f"coalesce({render(name, ctype)}, '\\N')" for name, ctype, _, _ in columns)
+
+
+def _row_hash(text):
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def sqlite_fingerprints(sqlite_conn, table, columns):
+    """{month: (rows, hash)} of a SQLite table; one scan, order independent"""
+    sqlite_conn.create_function('deploy_row_hash', 1, _row_hash, deterministic=True)
+    tcol = time_column(columns)
+    # Explicit sign: '+-5 days' would be NULL in SQLite for keys before TIEMPO_BASE
+    # (printf would also turn a NULL key into '+0 days', hence the CASE)
+    c = quote_ident(tcol) if tcol else None
+    bucket = (f"CASE WHEN {c} IS NOT NULL THEN CAST(strftime('%Y%m', '{TIEMPO_BASE.isoformat()}', "
+              f"printf('%+d days', {c} - 1)) AS INTEGER) END") if tcol else '0'
+    return {
+        month: (rows, digest) for month, rows, digest in sqlite_conn.execute(
+            f'SELECT {bucket}, COUNT(*), SUM(deploy_row_hash({_row_text(columns, _sqlite_render)})) '
+            f'FROM {quote_ident(table)} GROUP BY 1'
+        )
+    }
+
+
+def pg_fingerprints(cur, table, columns):
+    """Same fingerprints computed by PostgreSQL on the deployed table (no rows are transferred)"""
+    tcol = time_column(columns)
+    bucket = (f"to_char(DATE '{TIEMPO_BASE.isoformat()}' + ({quote_ident(tcol)} - 1)::int, 'YYYYMM')::int"
+              if tcol else '0')
+    cur.execute(
+        f"SELECT {bucket}, COUNT(*), SUM(('x' || substr(md5({_row_text(columns, _pg_render)}), 1, 8))"
+        f"::bit(32)::bigint) FROM {quote_ident(table)} GROUP BY 1"
+    )
+    return {month: (rows, int(digest)) for month, rows, digest in cur.fetchall()}
+
+
+def pg_columns(cur, schema, table):
+    cur.execute(
+        'SELECT column_name FROM information_schema.columns '
+        'WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position',
+        (schema, table)
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def sync_table(cur, sqlite_conn, schema, table):
+    """Bring one table up to date, re-sending only the monthly partitions whose fingerprint differs.
+
+    Returns (changed partitions, rows sent, bytes sent); a missing or reshaped table is copied whole.
+    """
+    plan = TablePlan.from_sqlite(sqlite_conn, table)
+    columns = plan.columns
+    if pg_columns(cur, schema, table) != plan.names:
+        return (None, *copy_table(cur, sqlite_conn, table, plan))
+
+    local = sqlite_fingerprints(sqlite_conn, table, columns)
+    tcol = time_column(columns)
+    if tcol and None in local:
+        # The NULL bucket may only hold NULL keys: anything else would be deleted and never re-sent
+        nulls = sqlite_conn.execute(
+            f'SELECT COUNT(*) FROM {quote_ident(table)} WHERE {quote_ident(tcol)} IS NULL'
+        ).fetchone()[0]
+        if nulls != local[None][0]:
+            raise ValueError(f'{table}: {local[None][0] - nulls} filas con {tcol} no nulo sin mes calculable')
+    remote = pg_fingerprints(cur, table, columns)
+    changed = sorted((m for m in set(local) | set(remote) if local.get(m) != remote.get(m)),
+                     key=lambda m: (m is None, m))
+    sent = nbytes = 0
+    for month in changed:
+        # Delete-and-insert per partition (also removes rows deleted at the source)
+        if tcol is None:
+            where, params = '', ()
+        elif month is None:
+            where, params = f'WHERE {quote_ident(tcol)} IS NULL', ()
+        else:
+            where, params = f'WHERE {quote_ident(tcol)} BETWEEN ? AND ?', _month_range(month)
+        cur.execute(f'DELETE FROM {quote_ident(table)} {where.replace("?", "%s")}', params)
+        if month in local:
+            rows, size = stream_rows(cur, sqlite_conn, plan, where, params)
+            sent += rows
+            nbytes += size
+    return len(changed), sent, nbytes
+
+
+def sync_db_file(conn, path, metrics=None):
+    """Incremental variant of load_db_file: only differing partitions are sent (the caller commits)"""
+    metrics = metrics or DeployMetrics()
+    schema = schema_name_from_path(path)
+    sqlite_conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    cur = conn.cursor()
     try:
-        conn = psycopg2.connect(dsn)
-        conn.autocommit = False
-        cur = conn.cursor()
+        tables, views = sqlite_objects(sqlite_conn)
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS {quote_ident(schema)};')
+        cur.execute(f'SET search_path = {quote_ident(schema)}, public;')
+        total = 0
+        for table in tables:
+            start = time.perf_counter()
+            changed, rows, nbytes = sync_table(cur, sqlite_conn, schema, table)
+            total += rows
+            if changed is None:
+                detail = ' (copia completa)'
+            elif changed:
+                detail = f' ({changed} particiones distintas)'
+            else:
+                detail = ' (sin cambios)'
+            metrics.table(schema, table, rows, nbytes, time.perf_counter() - start, detail)
+        # Views are cheap to rebuild and may need new partitions
+        for name, sql in views:
+            cur.execute(f'DROP VIEW IF EXISTS {quote_ident(name)} CASCADE;')
+            cur.execute(re.sub(r'^CREATE VIEW IF NOT EXISTS', 'CREATE VIEW', sql.strip(), flags=re.I))
+        return {'schema': schema, 'tables': len(tables), 'views': len(views), 'rows': total}
+    finally:
+        cur.close()
+        sqlite_conn.close()
 
-        for path in sql_files:
-            schema = schema_name_from_path(path)
-            print(f'Creando esquema {schema} si no existe...')
-            cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}";')
 
-            print('Aplicando', path)
-            sql = load_file(path)
+def sqlite_objects(sqlite_conn):
+    """User tables and views (with their SQL) of a datamart file"""
+    tables = [r[0] for r in sqlite_conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name"
+    )]
+    views = sqlite_conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view' ORDER BY name").fetchall()
+    return tables, views
 
-            # Remove BEGIN TRANSACTION; to let psycopg2 manage the transaction
-            sql_clean = sql.replace('BEGIN TRANSACTION;', '')
 
-            # Detect boolean columns and transform INSERTs that use 0/1 into TRUE/FALSE where needed
-            bool_map = detect_boolean_columns(sql_clean)
-            if bool_map:
-                sql_clean = transform_inserts_for_booleans(sql_clean, bool_map)
+def build_deferred(cur, deferred):
+    """Create primary keys, unique constraints, indexes and foreign keys after the bulk load.
 
-            # Execute within the specific schema (set search_path)
-            wrapped = f'SET search_path = "{schema}", public;\n' + sql_clean
+    Keys and indexes are built once over the loaded data instead of being maintained row by
+    row. Foreign keys are added NOT VALID and then validated, each in its own savepoint: a
+    key that cannot be added or validated is reported instead of aborting the schema.
+    Returns one dict per statement with its outcome and time.
+    """
+    cur.execute(f"SET LOCAL maintenance_work_mem = '{MAINTENANCE_WORK_MEM}'")
+    cur.execute(f'SET LOCAL max_parallel_maintenance_workers = {PARALLEL_MAINTENANCE_WORKERS}')
+    report = []
+    for item in sorted(deferred, key=lambda d: ORDEN_DIFERIDAS.index(d['tipo'])):
+        start = time.perf_counter()
+        estado = 'ok'
+        if item['tipo'] != 'fk':
+            cur.execute(item['sql'])
+        else:
+            cur.execute('SAVEPOINT deploy_fk')
+            try:
+                cur.execute(item['sql'])
+                cur.execute('RELEASE SAVEPOINT deploy_fk')
+            except psycopg2.Error as e:
+                cur.execute('ROLLBACK TO SAVEPOINT deploy_fk')
+                estado = f'omitida: {str(e).strip().splitlines()[0]}'
+            if estado == 'ok':
+                cur.execute('SAVEPOINT deploy_fk')
+                try:
+                    cur.execute(f"ALTER TABLE {quote_ident(item['tabla'])} "
+                                f"VALIDATE CONSTRAINT {quote_ident(item['nombre'])}")
+                    cur.execute('RELEASE SAVEPOINT deploy_fk')
+                except psycopg2.Error as e:
+                    cur.execute('ROLLBACK TO SAVEPOINT deploy_fk')
+                    estado = f'NOT VALID: {str(e).strip().splitlines()[0]}'
+        report.append({**item, 'estado': estado, 'segundos': round(time.perf_counter() - start, 3)})
+    return report
+
+
+def analyze_tables(cur, tables):
+    for table in tables:
+        cur.execute(f'ANALYZE {quote_ident(table)}')
+
+
+def index_plans(cur, schema):
+    """Plan chosen after ANALYZE for an equality lookup on the leading column of every index"""
+    cur.execute(
+        'SELECT c.relname, i.relname, a.attname FROM pg_index x '
+        'JOIN pg_class i ON i.oid = x.indexrelid JOIN pg_class c ON c.oid = x.indrelid '
+        'JOIN pg_namespace n ON n.oid = c.relnamespace '
+        'JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = x.indkey[0] '
+        'WHERE n.nspname = %s ORDER BY 1, 2',
+        (schema,)
+    )
+    plans = []
+    for table, index, column in cur.fetchall():
+        t, c = quote_ident(table), quote_ident(column)
+        cur.execute(f'SELECT {c} FROM {t} WHERE {c} IS NOT NULL LIMIT 1')
+        row = cur.fetchone()
+        if row is None:
+            continue
+        cur.execute(f'EXPLAIN SELECT * FROM {t} WHERE {c} = %s', row)
+        plans.append({'tabla': table, 'indice': index, 'plan': cur.fetchone()[0].strip()})
+    return plans
 
+
+def finish_load(cur, schema, tables, deferred, load_seconds):
+    """Deferred DDL, ANALYZE and the post-load report shared by the copy and sql modes"""
+    start = time.perf_counter()
+    built = build_deferred(cur, deferred)
+    constraints_s = time.perf_counter() - start
+    start = time.perf_counter()
+    analyze_tables(cur, tables)
+    analyze_s = time.perf_counter() - start
+    plans = index_plans(cur, schema)
+
+    print(f'  {schema}: carga {load_seconds:.2f} s, {len(built)} claves/índices en {constraints_s:.2f} s, '
+          f'ANALYZE {analyze_s:.2f} s')
+    for item in built:
+        if item['estado'] != 'ok':
+            print(f"  {schema}.{item['nombre']}: {item['estado']}", file=sys.stderr)
+    for p in plans:
+        print(f"  {schema}.{p['tabla']} [{p['indice']}]: {p['plan']}")
+    return {
+        'load_s': round(load_seconds, 3),
+        'constraints_s': round(constraints_s, 3),
+        'analyze_s': round(analyze_s, 3),
+        'deferred': built,
+        'plans': plans,
+    }
+
+
+def load_db_file(conn, path, defer=True, metrics=None):
+    """Load one datamart .db file into its schema with COPY (the caller commits).
+
+    With `defer` tables are created bare, bulk loaded, and only then given their keys,
+    indexes and foreign keys, followed by ANALYZE and a report of the resulting plans.
+    """
+    metrics = metrics or DeployMetrics()
+    schema = schema_name_from_path(path)
+    sqlite_conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    cur = conn.cursor()
+    try:
+        tables, views = sqlite_objects(sqlite_conn)
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS {quote_ident(schema)};')
+        cur.execute(f'SET search_path = {quote_ident(schema)}, public;')
+        for name, _ in views:
+            cur.execute(f'DROP VIEW IF EXISTS {quote_ident(name)} CASCADE;')
+        total = 0
+        deferred = []
+        load_start = time.perf_counter()
+        for table in tables:
+            start = time.perf_counter()
+            plan = TablePlan.from_sqlite(sqlite_conn, table)
+            if defer:
+                deferred.extend(deferred_ddl(sqlite_conn, table, plan.columns))
+                cur.execute(f'DROP TABLE IF EXISTS {quote_ident(table)} CASCADE;')
+                cur.execute(plan.ddl(with_primary_key=False))
+                rows, nbytes = stream_rows(cur, sqlite_conn, plan)
+            else:
+                rows, nbytes = copy_table(cur, sqlite_conn, table, plan)
+            total += rows
+            metrics.table(schema, table, rows, nbytes, time.perf_counter() - start)
+        summary = {'schema': schema, 'tables': len(tables), 'views': len(views), 'rows': total}
+        if defer:
+            summary.update(finish_load(cur, schema, tables, deferred, time.perf_counter() - load_start))
+        for name, sql in views:
+            cur.execute(re.sub(r'^CREATE VIEW IF NOT EXISTS', 'CREATE VIEW', sql.strip(), flags=re.I))
+        return summary
+    finally:
+        cur.close()
+        sqlite_conn.close()
+
+def ensure_checkpoint_table(dsn):
+    """Create the checkpoint table once, before the schemas are loaded in parallel"""
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+                    schema_name TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    source_version TEXT NOT NULL,
+                    rows_done BIGINT NOT NULL DEFAULT 0,
+                    completed BOOLEAN NOT NULL DEFAULT FALSE,
+                    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+                    PRIMARY KEY (schema_name, table_name)
+                );""")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def source_version(path):
+    """Identity of a .db file for the checkpoints: a rebuilt file restarts the deploy"""
+    st = os.stat(path)
+    return f'{st.st_size}:{st.st_mtime_ns}'
+
+
+def read_checkpoints(cur, schema, version):
+    """{table: (rows_done, completed)} for `schema`; checkpoints of another file version are dropped"""
+    cur.execute(f'DELETE FROM {CHECKPOINT_TABLE} WHERE schema_name = %s AND source_version <> %s',
+                (schema, version))
+    cur.execute(f'SELECT table_name, rows_done, completed FROM {CHECKPOINT_TABLE} WHERE schema_name = %s',
+                (schema,))
+    return {table: (rows, done) for table, rows, done in cur.fetchall()}
+
+
+def save_checkpoint(cur, schema, table, version, rows_done, completed=False):
+    cur.execute(
+        f'INSERT INTO {CHECKPOINT_TABLE} (schema_name, table_name, source_version, rows_done, completed) '
+        f'VALUES (%s, %s, %s, %s, %s) ON CONFLICT (schema_name, table_name) DO UPDATE SET '
+        f'source_version = EXCLUDED.source_version, rows_done = EXCLUDED.rows_done, '
+        f'completed = EXCLUDED.completed, updated_at = now()',
+        (schema, table, version, rows_done, completed)
+    )
+
+
+def stable_order(plan):
+    """ORDER BY that gives the same row sequence on every run (primary key, else rowid)"""
+    pk = [name for name, _, _, pos in sorted(plan.columns, key=lambda c: c[3]) if pos]
+    return ', '.join(quote_ident(c) for c in pk) if pk else 'rowid'
+
+
+def resume_table(conn, cur, sqlite_conn, schema, table, version, checkpoint):
+    """Copy one table in committed batches starting after the last checkpointed batch.
+
+    Returns (rows already present, rows sent now, bytes sent now).
+    """
+    plan = TablePlan.from_sqlite(sqlite_conn, table)
+    offset = checkpoint[0] if checkpoint else 0
+    if offset:
+        # Resume only if the target still holds exactly the checkpointed rows
+        present = None
+        if pg_columns(cur, schema, table) == plan.names:
+            cur.execute(f'SELECT COUNT(*) FROM {quote_ident(table)}')
+            present = cur.fetchone()[0]
+        if present != offset:
+            offset = 0
+    if not offset:
+        cur.execute(f'DROP TABLE IF EXISTS {quote_ident(table)} CASCADE;')
+        cur.execute(plan.ddl())
+        save_checkpoint(cur, schema, table, version, 0)
+        conn.commit()
+
+    resumed = offset
+    nbytes = 0
+    names = plan.column_list()
+    source = sqlite_conn.execute(
+        f'SELECT {names} FROM {quote_ident(table)} ORDER BY {stable_order(plan)} LIMIT -1 OFFSET ?', (offset,)
+    )
+    copy_sql = f'COPY {quote_ident(table)} ({names}) FROM STDIN WITH (FORMAT csv)'
+    while True:
+        stream = CopyStream(source, plan, max_rows=CHECKPOINT_ROWS)
+        cur.copy_expert(copy_sql, stream)
+        offset += stream.rows
+        nbytes += stream.bytes
+        done = stream.rows < CHECKPOINT_ROWS
+        save_checkpoint(cur, schema, table, version, offset, completed=done)
+        conn.commit()
+        if done:
+            return resumed, offset - resumed, nbytes
+
+
+def resume_db_file(conn, path, metrics=None):
+    """Resumable variant of load_db_file: commits every batch and records it in the checkpoint table"""
+    metrics = metrics or DeployMetrics()
+    schema = schema_name_from_path(path)
+    version = source_version(path)
+    sqlite_conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    cur = conn.cursor()
+    try:
+        tables, views = sqlite_objects(sqlite_conn)
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS {quote_ident(schema)};')
+        cur.execute(f'SET search_path = {quote_ident(schema)}, public;')
+        checkpoints = read_checkpoints(cur, schema, version)
+        for name, _ in views:
+            cur.execute(f'DROP VIEW IF EXISTS {quote_ident(name)} CASCADE;')
+        conn.commit()
+        total = skipped = 0
+        for table in tables:
+            checkpoint = checkpoints.get(table)
+            if checkpoint and checkpoint[1]:
+                skipped += 1
+                print(f'  {schema}.{table}: terminada en un despliegue anterior ({checkpoint[0]} filas)')
+                continue
+            start = time.perf_counter()
+            resumed, rows, nbytes = resume_table(conn, cur, sqlite_conn, schema, table, version, checkpoint)
+            total += rows
+            detail = f', continuando tras {resumed} filas' if resumed else ''
+            # Already committed: kept in the metrics if a later table fails and the schema is retried
+            metrics.table(schema, table, rows, nbytes, time.perf_counter() - start, detail, committed=True)
+        for name, sql in views:
+            cur.execute(re.sub(r'^CREATE VIEW IF NOT EXISTS', 'CREATE VIEW', sql.strip(), flags=re.I))
+        return {'schema': schema, 'tables': len(tables), 'views': len(views), 'rows': total, 'skipped': skipped}
+    finally:
+        cur.close()
+        sqlite_conn.close()
+
+
+def apply_sql_file(conn, path, defer=True, metrics=None):
+    """Execute one datamart SQL dump inside its schema (the caller commits).
+
+    With `defer` the table constraints and CREATE INDEX statements of the dump are held
+    back and built after all the INSERTs, as in load_db_file.
+    """
+    metrics = metrics or DeployMetrics()
+    schema = schema_name_from_path(path)
+    cur = conn.cursor()
+    try:
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}";')
+        # Execute within the specific schema (set search_path)
+        cur.execute(f'SET search_path = "{schema}", public;')
+
+        # Stream the dump statement by statement: BEGIN/COMMIT are dropped so the
+        # caller owns the transaction, and 0/1 in BOOLEAN columns become FALSE/TRUE.
+        # Statements are sent in bounded batches instead of one huge execute, and each
+        # run of statements on the same table is measured as that table's load.
+        rewriter = DumpRewriter(diferir=defer)
+        load_start = time.perf_counter()
+        statements = rewrite_dump(path, reescritor=rewriter)
+        reported = {}
+        for table, group in itertools.groupby(statements, key=lambda _: rewriter.tabla):
+            start = time.perf_counter()
+            nbytes = 0
+            for batch in iter_batches(group):
+                cur.execute(batch)
+                nbytes += len(batch.encode('utf-8'))
+            if table is not None:
+                rows = rewriter.filas.get(table, 0) - reported.get(table, 0)
+                reported[table] = rewriter.filas.get(table, 0)
+                metrics.table(schema, table, rows, nbytes, time.perf_counter() - start)
+        summary = {'schema': schema, 'tables': len(rewriter.columnas), 'rows': sum(rewriter.filas.values())}
+        if defer:
+            summary.update(finish_load(cur, schema, list(rewriter.columnas), rewriter.diferidas,
+                                       time.perf_counter() - load_start))
+        return summary
+    finally:
+        cur.close()
+
+def deploy_schemas(dsn, paths, loader, workers=4, all_or_nothing=False, retries=RETRIES,
+                   metrics=None, pool_factory=ThreadedConnectionPool):
+    """Load every file into its own schema concurrently through a bounded connection pool.
+
+    Each schema runs in its own transaction on its own connection. By default each one
+    commits as soon as it finishes; with `all_or_nothing` every transaction is held open
+    until all schemas have loaded and is committed only if none failed (otherwise all are
+    rolled back). A schema whose connection drops is retried up to `retries` times on a
+    fresh connection. `pool_factory` replaces the psycopg2 pool (NullPool for a dry run).
+    Returns a list of (path, summary, error, seconds) in input order.
+    """
+    metrics = metrics or DeployMetrics()
+    # With all_or_nothing each schema keeps its connection until the end
+    size = len(paths) if all_or_nothing else max(1, min(workers, len(paths)))
+    pool = pool_factory(1, size, dsn)
+    held = {}
+    results = {}
+
+    def run(path):
+        schema = schema_name_from_path(path)
+        start = time.perf_counter()
+        for attempt in range(1, retries + 2):
+            metrics.begin_schema(schema, attempt)
+            conn = pool.getconn()
+            conn.autocommit = False
             try:
-                cur.execute(wrapped)
-                conn.commit()
-                print('OK:', path)
+                summary = loader(conn, path)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Broken connection: discard it and start the schema again on a new one
+                pool.putconn(conn, close=True)
+                if attempt > retries:
+                    metrics.schema_done(schema, time.perf_counter() - start, e)
+                    return path, None, e, time.perf_counter() - start
+                print(f'Reintento {attempt}/{retries}: {path} - {e}', file=sys.stderr)
+                time.sleep(RETRY_BACKOFF * attempt)
+                continue
             except Exception as e:
                 conn.rollback()
-                print('Error al aplicar', path, '-', str(e), file=sys.stderr)
-                print('Abortando.', file=sys.stderr)
-                cur.close()
-                conn.close()
-                sys.exit(2)
+                pool.putconn(conn)
+                metrics.schema_done(schema, time.perf_counter() - start, e)
+                return path, None, e, time.perf_counter() - start
+            break
+        if all_or_nothing:
+            held[path] = conn
+        else:
+            conn.commit()
+            pool.putconn(conn)
+        metrics.schema_done(schema, time.perf_counter() - start, extra={
+            k: v for k, v in summary.items() if k in ('rows', 'skipped', 'load_s', 'constraints_s', 'analyze_s')
+        })
+        return path, summary, None, time.perf_counter() - start
+
+    try:
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            for path, summary, error, seconds in executor.map(run, paths):
+                results[path] = (path, summary, error, seconds)
+                estado = 'OK' if error is None else f'Error - {error}'
+                print(f'{estado}: {path} ({seconds:.2f} s)', file=sys.stderr if error else sys.stdout)
+
+        if all_or_nothing:
+            failed = any(r[2] is not None for r in results.values())
+            for path, conn in held.items():
+                if failed:
+                    conn.rollback()
+                else:
+                    conn.commit()
+                pool.putconn(conn)
+            held.clear()
+            if failed:
+                print('Algún esquema falló: se revirtieron todos (todo o nada).', file=sys.stderr)
+    finally:
+        for conn in held.values():
+            conn.rollback()
+            pool.putconn(conn)
+        pool.closeall()
+    return [results[p] for p in paths]
 
-        cur.close()
-        conn.close()
-        print('Todos los scripts aplicados correctamente.')
 
+def main():
+    parser = argparse.ArgumentParser(description='Desplegar los datamarts en PostgreSQL (Aiven)')
+    parser.add_argument('--modo', choices=('sql', 'copy'), default='sql',
+                        help='sql: ejecutar dbs/sql/*.db.sql; copy: COPY directo desde dbs/*.db')
+    parser.add_argument('--dbs', default=DBS_DIR, help='Directorio con datamart_*.db (modo copy)')
+    parser.add_argument('--dsn', help='Cadena de conexión (por defecto la variable DATABASE_URL)')
+    parser.add_argument('--paralelo', type=int, default=4,
+                        help='Esquemas cargados a la vez (tamaño del pool de conexiones)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Modo copy: enviar sólo las particiones mensuales cuya huella difiere')
+    parser.add_argument('--todo-o-nada', action='store_true',
+                        help='Confirmar sólo si todos los esquemas cargaron; si no, revertir todos')
+    parser.add_argument('--reanudar', action='store_true',
+                        help='Modo copy: confirmar por lotes y continuar desde el último lote confirmado')
+    parser.add_argument('--sin-diferir', action='store_true',
+                        help='Crear claves e índices antes de cargar (por defecto se crean después, '
+                             'seguidos de ANALYZE)')
+    parser.add_argument('--reintentos', type=int, default=RETRIES,
+                        help='Reintentos de un esquema cuando se cae la conexión')
+    parser.add_argument('--destino-nulo', action='store_true',
+                        help='Ensayo: convertir y enviar todo a un destino que lo descarta, sin base de datos')
+    parser.add_argument('--resumen', metavar='JSON',
+                        help='Escribir las métricas por tabla (filas, bytes, tiempo, filas/s, reintentos)')
+    args = parser.parse_args()
+
+    # Connection URL can come from --dsn or env DATABASE_URL (never hardcode credentials)
+    dsn = args.dsn or os.environ.get('DATABASE_URL')
+    if not dsn and not args.destino_nulo:
+        print('Error: set DATABASE_URL environment variable', file=sys.stderr)
+        sys.exit(1)
+
+    # Create list of files to load
+    if (args.incremental or args.reanudar) and args.modo != 'copy':
+        print('Error: --incremental y --reanudar requieren --modo copy', file=sys.stderr)
+        sys.exit(1)
+    if args.reanudar and (args.incremental or args.todo_o_nada):
+        print('Error: --reanudar confirma por lotes; no se combina con --incremental ni --todo-o-nada',
+              file=sys.stderr)
+        sys.exit(1)
+    metrics = DeployMetrics(modo=args.modo + ('-incremental' if args.incremental else
+                                              '-reanudar' if args.reanudar else ''),
+                            destino='nulo' if args.destino_nulo else 'postgresql')
+    if args.modo == 'copy':
+        pattern = os.path.join(args.dbs, 'datamart_*.db')
+        if args.reanudar:
+            loader = functools.partial(resume_db_file, metrics=metrics)
+        elif args.incremental:
+            loader = functools.partial(sync_db_file, metrics=metrics)
+        else:
+            loader = functools.partial(load_db_file, defer=not args.sin_diferir, metrics=metrics)
+    else:
+        pattern = SQL_GLOB
+        loader = functools.partial(apply_sql_file, defer=not args.sin_diferir, metrics=metrics)
+    files = sorted(glob.glob(pattern))
+    if not files:
+        print('No se encontraron archivos en:', pattern, file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    try:
+        if args.reanudar and not args.destino_nulo:
+            ensure_checkpoint_table(dsn)
+        results = deploy_schemas(dsn, files, loader, workers=args.paralelo, all_or_nothing=args.todo_o_nada,
+                                 retries=args.reintentos, metrics=metrics,
+                                 pool_factory=NullPool if args.destino_nulo else ThreadedConnectionPool)
     except Exception as e:
         print('Fallo de conexión o ejecución:', str(e), file=sys.stderr)
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
         sys.exit(3)
 
+    elapsed = time.perf_counter() - start
+    slowest = max(r[3] for r in results)
+    total = metrics.summary()['total']
+    print(f'Tiempo total {elapsed:.2f} s (esquema más lento {slowest:.2f} s): {total["filas"]} filas, '
+          f'{total["bytes"] / 1048576:.2f} MB, {total["filas_s"] or 0:.0f} filas/s, '
+          f'{total["reintentos"]} reintentos')
+    if args.resumen:
+        metrics.write(args.resumen)
+        print(f'Resumen de métricas en {args.resumen}')
+    if any(r[2] is not None for r in results):
+        if args.reanudar:
+            print('Los lotes confirmados quedan registrados: vuelve a ejecutar con --reanudar para continuar.',
+                  file=sys.stderr)
+        print('Abortando.', file=sys.stderr)
+        sys.exit(2)
+    if args.destino_nulo:
+        print('Ensayo completo (destino nulo): no se escribió en ninguna base de datos.')
+    else:
+        print('Todos los datamarts cargados correctamente.')
+
 
 if __name__ == '__main__':
     main()
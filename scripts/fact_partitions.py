@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+PARTICIONADO DE HECHOS - DATAMARTS EMPRESA MOLINERA
+Las tablas de hechos que crecen con el histórico se guardan en una tabla física
+por periodo:
+
+    FACT_VENTAS_2024, FACT_VENTAS_2025, ...            (por año)
+    FACT_INVENTARIO_202401, FACT_INVENTARIO_202402...  (por año-mes)
+
+Una vista con el nombre original (FACT_VENTAS, FACT_INVENTARIO) une todas las
+particiones con UNION ALL, de modo que las consultas existentes no cambian. El
+registro PARTICIONES_FACT guarda el rango de id_tiempo y de fechas de cada
+partición; `pruned_source` lo usa para que una consulta con filtro de fechas
+lea sólo las particiones que lo cubren.
+
+Una partición cuyo periodo terminó antes de la fecha de carga pasa a ser de
+sólo lectura: queda marcada en el registro, unos triggers rechazan cualquier
+INSERT/UPDATE/DELETE y las siguientes construcciones la conservan tal cual.
+
+Uso (listar particiones de un datamart):
+    python3 scripts/fact_partitions.py dbs/datamart_ventas.db
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+REGISTRO = 'PARTICIONES_FACT'
+
+GRANULARIDADES = ('año', 'mes')
+
+SQL_REGISTRO = f"""
+CREATE TABLE IF NOT EXISTS {REGISTRO} (
+    particion TEXT PRIMARY KEY,
+    tabla TEXT NOT NULL,
+    periodo TEXT NOT NULL,
+    columna_tiempo TEXT NOT NULL,
+    id_tiempo_desde INTEGER NOT NULL,
+    id_tiempo_hasta INTEGER NOT NULL,
+    fecha_desde DATE NOT NULL,
+    fecha_hasta DATE NOT NULL,
+    filas INTEGER NOT NULL DEFAULT 0,
+    solo_lectura BOOLEAN NOT NULL DEFAULT 0
+)
+"""
+
+
+def _existe(conn, nombre: str) -> Optional[str]:
+    """Tipo del objeto ('table', 'view') o None si no existe"""
+    fila = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (nombre,)).fetchone()
+    return fila[0] if fila else None
+
+
+def list_partitions(conn, tabla: Optional[str] = None) -> List[Dict]:
+    """Entradas del registro (todas o las de una tabla lógica), por fecha"""
+    if _existe(conn, REGISTRO) is None:
+        return []
+    cursor = conn.execute(
+        f"SELECT * FROM {REGISTRO} WHERE ? IS NULL OR tabla = ? ORDER BY tabla, fecha_desde",
+        (tabla, tabla)
+    )
+    columnas = [d[0] for d in cursor.description]
+    return [dict(zip(columnas, fila)) for fila in cursor]
+
+
+def partition_names(conn) -> set:
+    """Nombres de todas las tablas físicas de partición del datamart"""
+    return {p['particion'] for p in list_partitions(conn)}
+
+
+def time_column(conn, tabla: str) -> Optional[str]:
+    """Columna de DIM_TIEMPO de una tabla de hechos (particionada o no)"""
+    particiones = list_partitions(conn, tabla)
+    if particiones:
+        return particiones[0]['columna_tiempo']
+    for fk in conn.execute(f'PRAGMA foreign_key_list("{tabla}")'):
+        if fk[2] == 'DIM_TIEMPO':
+            return fk[3]
+    return None
+
+
+def pruned_source(conn, tabla: str, desde: Optional[str] = None,
+                  hasta: Optional[str] = None) -> Tuple[str, List]:
+    """Subconsulta que lee `tabla` sólo en [desde, hasta] (fechas ISO inclusivas)
+
+    Devuelve (sql, parámetros). Con particiones sólo se incluyen las que se
+    solapan con el rango, y el filtro por id_tiempo se aplica únicamente a las
+    que quedan cortadas por sus extremos. Sin particiones se filtra la tabla.
+    """
+    desde = desde or '0000-01-01'
+    hasta = hasta or '9999-12-31'
+    columna = time_column(conn, tabla)
+    if columna is None:
+        raise ValueError(f"{tabla} no tiene clave de DIM_TIEMPO para filtrar por fechas")
+
+    id_desde, id_hasta = conn.execute(
+        "SELECT MIN(id_tiempo), MAX(id_tiempo) FROM DIM_TIEMPO WHERE fecha_completa BETWEEN ? AND ?",
+        (desde, hasta)
+    ).fetchone()
+    if id_desde is None:
+        return f'(SELECT * FROM "{tabla}" WHERE 0)', []
+
+    particiones = list_partitions(conn, tabla)
+    if not particiones:
+        return f'(SELECT * FROM "{tabla}" WHERE "{columna}" BETWEEN ? AND ?)', [id_desde, id_hasta]
+
+    partes = []
+    parametros = []
+    for p in particiones:
+        if p['fecha_hasta'] < desde or p['fecha_desde'] > hasta:
+            continue
+        if desde <= p['fecha_desde'] and p['fecha_hasta'] <= hasta:
+            partes.append(f'SELECT * FROM "{p["particion"]}"')
+        else:
+            partes.append(f'SELECT * FROM "{p["particion"]}" WHERE "{columna}" BETWEEN ? AND ?')
+            parametros.extend([id_desde, id_hasta])
+    if not partes:
+        return f'(SELECT * FROM "{particiones[0]["particion"]}" WHERE 0)', []
+    return '(' + ' UNION ALL '.join(partes) + ')', parametros
+
+
+class PartitionedFact:
+    """Tabla de hechos particionada por periodo de DIM_TIEMPO
+
+    `ddl` es el CREATE TABLE de la tabla de hechos con `{tabla}` en lugar del
+    nombre; cada partición se crea con él bajo demanda.
+    """
+
+    def __init__(self, conn, tabla: str, ddl: str, granularidad: str = 'año',
+                 columna_tiempo: str = 'id_tiempo', posicion_tiempo: int = 1):
+        if granularidad not in GRANULARIDADES:
+            raise ValueError(f"Granularidad no soportada: {granularidad}")
+        self.conn = conn
+        self.tabla = tabla
+        self.ddl = ddl
+        self.granularidad = granularidad
+        self.columna_tiempo = columna_tiempo
+        self.posicion_tiempo = posicion_tiempo
+        self.periodo_por_tiempo: Dict[int, str] = {}
+        self.rangos: Dict[str, Tuple[int, int, str, str]] = {}
+        self.cerradas = set()
+        self.corte: Optional[str] = None
+        self.omitidas = 0
+
+    def nombre_particion(self, periodo: str) -> str:
+        return f"{self.tabla}_{periodo}"
+
+    def prepare(self) -> Optional[str]:
+        """Preparar la carga: conservar particiones cerradas y descartar el resto
+
+        Devuelve la última fecha cubierta por particiones de sólo lectura (None
+        si no hay), para que el origen se lea sólo a partir de ella.
+        """
+        self.conn.execute(SQL_REGISTRO)
+        tipo = _existe(self.conn, self.tabla)
+        if tipo == 'view':
+            self.conn.execute(f'DROP VIEW "{self.tabla}"')
+        elif tipo == 'table':
+            # Esquema anterior sin particionar
+            self.conn.execute(f'DROP TABLE "{self.tabla}"')
+
+        for p in list_partitions(self.conn, self.tabla):
+            if p['solo_lectura']:
+                self.cerradas.add(p['periodo'])
+            else:
+                self.conn.execute(f'DROP TABLE IF EXISTS "{p["particion"]}"')
+                self.conn.execute(f"DELETE FROM {REGISTRO} WHERE particion = ?", (p['particion'],))
+
+        self.load_periods()
+        if self.cerradas:
+            self.corte = max(self.rangos[p][3] for p in self.cerradas if p in self.rangos)
+        return self.corte
+
+    def load_periods(self):
+        """Periodo y rango de cada id_tiempo de DIM_TIEMPO (repetir si la dimensión se extiende)"""
+        self.periodo_por_tiempo.clear()
+        self.rangos.clear()
+        expresion = "CAST(año AS TEXT)" if self.granularidad == 'año' else "printf('%04d%02d', año, mes)"
+        for id_tiempo, periodo, fecha in self.conn.execute(
+            f"SELECT id_tiempo, {expresion}, fecha_completa FROM DIM_TIEMPO ORDER BY id_tiempo"
+        ):
+            fecha = str(fecha)[:10]
+            self.periodo_por_tiempo[id_tiempo] = periodo
+            if periodo in self.rangos:
+                desde = self.rangos[periodo]
+                self.rangos[periodo] = (desde[0], id_tiempo, desde[2], fecha)
+            else:
+                self.rangos[periodo] = (id_tiempo, id_tiempo, fecha, fecha)
+
+    def _crear_particion(self, periodo: str):
+        nombre = self.nombre_particion(periodo)
+        self.conn.execute(self.ddl.format(tabla=nombre))
+        id_desde, id_hasta, fecha_desde, fecha_hasta = self.rangos[periodo]
+        self.conn.execute(f"""
+            INSERT OR REPLACE INTO {REGISTRO} (
+                particion, tabla, periodo, columna_tiempo, id_tiempo_desde,
+                id_tiempo_hasta, fecha_desde, fecha_hasta
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (nombre, self.tabla, periodo, self.columna_tiempo, id_desde, id_hasta, fecha_desde, fecha_hasta))
+
+    def insert(self, sql_insert: str, filas: Sequence[tuple]) -> int:
+        """Repartir las filas por partición (`sql_insert` usa `{tabla}`)
+
+        Las filas de particiones cerradas se omiten: ya están cargadas.
+        """
+        por_periodo = defaultdict(list)
+        for fila in filas:
+            por_periodo[self.periodo_por_tiempo[fila[self.posicion_tiempo]]].append(fila)
+
+        insertadas = 0
+        for periodo, grupo in por_periodo.items():
+            if periodo in self.cerradas:
+                self.omitidas += len(grupo)
+                continue
+            nombre = self.nombre_particion(periodo)
+            if _existe(self.conn, nombre) is None:
+                self._crear_particion(periodo)
+            self.conn.executemany(sql_insert.format(tabla=nombre), grupo)
+            insertadas += len(grupo)
+        return insertadas
+
+    def finalize(self, fecha_carga: date) -> Dict[str, int]:
+        """Actualizar conteos, cerrar particiones vencidas y recrear la vista"""
+        if not list_partitions(self.conn, self.tabla):
+            # Sin datos: una partición vacía mantiene válida la vista
+            self._crear_particion(max(self.rangos))
+
+        cerradas_ahora = 0
+        for p in list_partitions(self.conn, self.tabla):
+            if p['solo_lectura']:
+                continue
+            filas = self.conn.execute(f'SELECT COUNT(*) FROM "{p["particion"]}"').fetchone()[0]
+            solo_lectura = p['fecha_hasta'] < fecha_carga.isoformat()
+            self.conn.execute(
+                f"UPDATE {REGISTRO} SET filas = ?, solo_lectura = ? WHERE particion = ?",
+                (filas, solo_lectura, p['particion'])
+            )
+            if solo_lectura:
+                self._proteger(p['particion'])
+                cerradas_ahora += 1
+
+        particiones = list_partitions(self.conn, self.tabla)
+        self.conn.execute(
+            f'CREATE VIEW "{self.tabla}" AS '
+            + ' UNION ALL '.join(f'SELECT * FROM "{p["particion"]}"' for p in particiones)
+        )
+        return {
+            'particiones': len(particiones),
+            'solo_lectura': sum(1 for p in particiones if p['solo_lectura']),
+            'cerradas_ahora': cerradas_ahora,
+            'omitidas': self.omitidas,
+        }
+
+    def _proteger(self, particion: str):
+        for operacion in ('INSERT', 'UPDATE', 'DELETE'):
+            self.conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS "trg_{particion}_{operacion.lower()}_solo_lectura"
+                BEFORE {operacion} ON "{particion}"
+                BEGIN
+                    SELECT RAISE(ABORT, 'Partición {particion} de sólo lectura');
+                END
+            """)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Particiones de las tablas de hechos de un datamart')
+    parser.add_argument('db_path')
+    parser.add_argument('--tabla', help='Tabla lógica (por defecto todas)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    try:
+        particiones = list_partitions(conn, args.tabla)
+    finally:
+        conn.close()
+    if not particiones:
+        print("ℹ️  El datamart no tiene tablas de hechos particionadas")
+        return 0
+    print(f"{'partición':28} {'desde':>10} {'hasta':>10} {'filas':>8}  estado")
+    for p in particiones:
+        estado = 'sólo lectura' if p['solo_lectura'] else 'abierta'
+        print(f"{p['particion']:28} {p['fecha_desde']:>10} {p['fecha_hasta']:>10} {p['filas']:>8}  {estado}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+SNAPSHOT MENSUAL DE INVENTARIO - DATAMART INVENTARIOS
+Hecho de tipo snapshot periódico con grano mes x producto x almacén, derivado
+de las fotos diarias de FACT_INVENTARIO:
+
+    stock de apertura (primer día) y de cierre (último día), entradas y salidas
+    totales, stock final mínimo/máximo, días bajo stock_minimo y valor al cierre
+
+Se mantiene de forma incremental: CONTROL_SNAPSHOT guarda la mayor clave de
+fila (id_inventario) procesada (marca de agua) y cada actualización agrega sólo
+las filas diarias con clave posterior, fusionándolas con el mes ya existente
+mediante un upsert. La marca va sobre la clave de fila y no sobre id_tiempo
+para recoger también filas que llegan tarde con fechas ya procesadas (y fechas
+anteriores a 2023, cuyas claves de tiempo son <= 0). Una fila corregida en su
+sitio (misma clave) no se vuelve a agregar: para eso hay que reconstruir el
+datamart. Los reportes de fin de mes leen esta tabla pequeña en lugar de la
+diaria.
+
+Uso (actualizar tras cargar nuevas filas diarias):
+    python3 scripts/inventory_snapshot.py dbs/datamart_inventarios.db
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+TABLA_SNAPSHOT = 'FACT_INVENTARIO_MENSUAL'
+TABLA_CONTROL = 'CONTROL_SNAPSHOT'
+
+SQL_SNAPSHOT = f"""
+CREATE TABLE IF NOT EXISTS {TABLA_SNAPSHOT} (
+    id_mes INTEGER NOT NULL,
+    año INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    id_producto INTEGER NOT NULL,
+    id_almacen INTEGER NOT NULL,
+    id_tiempo_apertura INTEGER NOT NULL,
+    id_tiempo_cierre INTEGER NOT NULL,
+    stock_apertura_ton REAL,
+    stock_cierre_ton REAL,
+    entradas_ton REAL,
+    salidas_ton REAL,
+    stock_minimo_mes_ton REAL,
+    stock_maximo_mes_ton REAL,
+    dias_bajo_minimo INTEGER,
+    dias_registrados INTEGER,
+    valor_cierre REAL,
+    PRIMARY KEY (id_mes, id_producto, id_almacen),
+    FOREIGN KEY (id_tiempo_cierre) REFERENCES DIM_TIEMPO(id_tiempo),
+    FOREIGN KEY (id_tiempo_apertura) REFERENCES DIM_TIEMPO(id_tiempo),
+    FOREIGN KEY (id_producto) REFERENCES DIM_PRODUCTO(id_producto),
+    FOREIGN KEY (id_almacen) REFERENCES DIM_ALMACEN(id_almacen)
+)
+"""
+
+SQL_CONTROL = f"""
+CREATE TABLE IF NOT EXISTS {TABLA_CONTROL} (
+    tabla TEXT PRIMARY KEY,
+    ultima_clave INTEGER NOT NULL,
+    actualizado DATETIME NOT NULL
+)
+"""
+
+# Agregado mensual de las filas diarias nuevas, fusionado con el mes existente:
+# la apertura se queda con el día más antiguo y el cierre con el más reciente.
+SQL_UPSERT = f"""
+INSERT INTO {TABLA_SNAPSHOT} (
+    id_mes, año, mes, id_producto, id_almacen, id_tiempo_apertura, id_tiempo_cierre,
+    stock_apertura_ton, stock_cierre_ton, entradas_ton, salidas_ton,
+    stock_minimo_mes_ton, stock_maximo_mes_ton, dias_bajo_minimo, dias_registrados, valor_cierre
+)
+SELECT id_mes, año, mes, id_producto, id_almacen, MIN(id_tiempo), MAX(id_tiempo),
+       MAX(CASE WHEN primero = 1 THEN stock_inicial_ton END),
+       MAX(CASE WHEN ultimo = 1 THEN stock_final_ton END),
+       SUM(entradas_ton), SUM(salidas_ton),
+       MIN(stock_final_ton), MAX(stock_final_ton),
+       SUM(CASE WHEN stock_final_ton < stock_minimo_ton THEN 1 ELSE 0 END),
+       COUNT(*),
+       MAX(CASE WHEN ultimo = 1 THEN valor_total END)
+FROM (
+    SELECT t.año * 100 + t.mes AS id_mes, t.año, t.mes, f.*,
+           ROW_NUMBER() OVER (
+               PARTITION BY t.año, t.mes, f.id_producto, f.id_almacen
+               ORDER BY f.id_tiempo, f.id_inventario
+           ) AS primero,
+           ROW_NUMBER() OVER (
+               PARTITION BY t.año, t.mes, f.id_producto, f.id_almacen
+               ORDER BY f.id_tiempo DESC, f.id_inventario DESC
+           ) AS ultimo
+    FROM {{fuente}} f
+    JOIN DIM_TIEMPO t ON t.id_tiempo = f.id_tiempo
+    WHERE {{condicion}}
+)
+WHERE true
+GROUP BY id_mes, año, mes, id_producto, id_almacen
+ON CONFLICT (id_mes, id_producto, id_almacen) DO UPDATE SET
+    stock_apertura_ton = CASE WHEN excluded.id_tiempo_apertura < id_tiempo_apertura
+                              THEN excluded.stock_apertura_ton ELSE stock_apertura_ton END,
+    id_tiempo_apertura = MIN(id_tiempo_apertura, excluded.id_tiempo_apertura),
+    stock_cierre_ton = CASE WHEN excluded.id_tiempo_cierre >= id_tiempo_cierre
+                            THEN excluded.stock_cierre_ton ELSE stock_cierre_ton END,
+    valor_cierre = CASE WHEN excluded.id_tiempo_cierre >= id_tiempo_cierre
+                        THEN excluded.valor_cierre ELSE valor_cierre END,
+    id_tiempo_cierre = MAX(id_tiempo_cierre, excluded.id_tiempo_cierre),
+    entradas_ton = entradas_ton + excluded.entradas_ton,
+    salidas_ton = salidas_ton + excluded.salidas_ton,
+    stock_minimo_mes_ton = MIN(stock_minimo_mes_ton, excluded.stock_minimo_mes_ton),
+    stock_maximo_mes_ton = MAX(stock_maximo_mes_ton, excluded.stock_maximo_mes_ton),
+    dias_bajo_minimo = dias_bajo_minimo + excluded.dias_bajo_minimo,
+    dias_registrados = dias_registrados + excluded.dias_registrados
+"""
+
+
+def refresh_inventory_snapshot(conn, tabla_diaria: str = 'FACT_INVENTARIO',
+                               clave: str = 'id_inventario') -> Dict[str, int]:
+    """Agregar al snapshot mensual las filas diarias con `clave` posterior a la marca de agua"""
+    columnas = [r[1] for r in conn.execute(f"PRAGMA table_info({TABLA_CONTROL})")]
+    if columnas and 'ultima_clave' not in columnas:
+        # La marca anterior era un id_tiempo: el snapshot se recalcula completo
+        conn.execute(f"DROP TABLE {TABLA_CONTROL}")
+        conn.execute(f"DROP TABLE IF EXISTS {TABLA_SNAPSHOT}")
+    conn.execute(SQL_SNAPSHOT)
+    conn.execute(SQL_CONTROL)
+
+    fila = conn.execute(
+        f"SELECT ultima_clave FROM {TABLA_CONTROL} WHERE tabla = ?", (TABLA_SNAPSHOT,)
+    ).fetchone()
+    marca = fila[0] if fila else None
+
+    # Sin marca se agrega todo; con marca, la búsqueda por clave usa la clave
+    # primaria de cada partición
+    condicion, parametros = ('true', []) if marca is None else (f'f."{clave}" > ?', [marca])
+    fuente = f'"{tabla_diaria}"'
+
+    nuevas, nueva_marca = conn.execute(
+        f'SELECT COUNT(*), MAX("{clave}") FROM {fuente} f WHERE {condicion}', parametros
+    ).fetchone()
+    if not nuevas:
+        return {'filas_diarias': 0, 'meses_afectados': 0, 'marca_agua': marca}
+
+    antes = conn.total_changes
+    conn.execute(SQL_UPSERT.format(fuente=fuente, condicion=condicion), parametros)
+    meses_afectados = conn.total_changes - antes
+
+    conn.execute(f"""
+        INSERT INTO {TABLA_CONTROL} (tabla, ultima_clave, actualizado)
+        VALUES (?, ?, datetime('now'))
+        ON CONFLICT (tabla) DO UPDATE SET
+            ultima_clave = excluded.ultima_clave,
+            actualizado = excluded.actualizado
+    """, (TABLA_SNAPSHOT, nueva_marca))
+    return {'filas_diarias': nuevas, 'meses_afectados': meses_afectados, 'marca_agua': nueva_marca}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Actualizar el snapshot mensual de inventario')
+    parser.add_argument('db_path', help='Archivo datamart_inventarios.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    try:
+        resumen = refresh_inventory_snapshot(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(
+        f"📅 {TABLA_SNAPSHOT}: {resumen['filas_diarias']} filas diarias nuevas, "
+        f"{resumen['meses_afectados']} filas mensuales actualizadas (marca id_inventario={resumen['marca_agua']})"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+EXPORTACIÓN PARQUET - DATAMARTS EMPRESA MOLINERA
+Escribe cada datamart en formato columnar Parquet para herramientas de BI y
+notebooks:
+
+    <destino>/<datamart>/DIM_X.parquet                       (una por dimensión)
+    <destino>/<datamart>/FACT_X/año=2024/mes=3/part-0.parquet (particiones Hive)
+    <destino>/<datamart>/_manifest.json                       (huellas por partición)
+
+Las tablas de hechos se particionan por año/mes de DIM_TIEMPO. En modo
+incremental sólo se reescriben las particiones (y dimensiones) cuya huella
+cambió desde la última exportación; las particiones que ya no existen se
+eliminan. Las lecturas con `scan_table` aprovechan la poda de particiones y la
+proyección de columnas de pyarrow.
+
+Requiere pyarrow (opcional para el resto del proyecto).
+
+Uso:
+    python3 scripts/parquet_export.py dbs/datamart_ventas.db --destino parquet
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fact_partitions import partition_names
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dependencia opcional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = '_manifest.json'
+
+TIPOS_ARROW = {
+    'INTEGER': 'int64',
+    'REAL': 'float64',
+    'TEXT': 'string',
+    'BOOLEAN': 'bool_',
+    'DATE': 'date32',
+    'DATETIME': 'timestamp',
+}
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("La exportación Parquet requiere pyarrow (pip install pyarrow)")
+
+
+def _tipo_arrow(tipo_sqlite: str):
+    nombre = TIPOS_ARROW.get(tipo_sqlite.upper().split('(')[0].strip(), 'string')
+    if nombre == 'timestamp':
+        return pa.timestamp('s')
+    return getattr(pa, nombre)()
+
+
+def _columnas(conn, tabla: str) -> List[Tuple[str, str]]:
+    return [(r[1], r[2]) for r in conn.execute(f'PRAGMA table_info("{tabla}")')]
+
+
+def _tablas_exportables(conn) -> Tuple[List[str], List[str]]:
+    """Separar dimensiones y hechos (tablas o vistas FACT_*)"""
+    objetos = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+        "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name"
+    )]
+    # Las particiones físicas se exportan a través de la vista que las une
+    particiones = partition_names(conn)
+    hechos = [t for t in objetos if t.startswith('FACT_') and t not in particiones]
+    dimensiones = [t for t in objetos if t.startswith('DIM_')]
+    return dimensiones, hechos
+
+
+def _columna_tiempo(conn, tabla: str, columnas: Sequence[str]) -> Optional[str]:
+    for fk in conn.execute(f'PRAGMA foreign_key_list("{tabla}")'):
+        if fk[2] == 'DIM_TIEMPO':
+            return fk[3]
+    # Vistas de compatibilidad: no exponen claves foráneas
+    for col in columnas:
+        if col.startswith('id_tiempo'):
+            return col
+    return None
+
+
+def _tabla_arrow(nombres_tipos: Sequence[Tuple[str, str]], filas: Sequence[tuple]):
+    arrays = []
+    for i, (nombre, tipo) in enumerate(nombres_tipos):
+        valores = [f[i] for f in filas]
+        destino = _tipo_arrow(tipo)
+        if pa.types.is_date32(destino) or pa.types.is_timestamp(destino):
+            # SQLite guarda fechas como texto ISO; se convierten en Arrow
+            arrays.append(pa.array([None if v is None else str(v) for v in valores], pa.string()).cast(destino))
+        elif pa.types.is_boolean(destino):
+            arrays.append(pa.array([None if v is None else bool(v) for v in valores], destino))
+        else:
+            arrays.append(pa.array(valores, destino))
+    return pa.Table.from_arrays(arrays, names=[n for n, _ in nombres_tipos])
+
+
+def _huella(filas: Sequence[tuple]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for fila in filas:
+        h.update(repr(fila).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _escribir(tabla_arrow, destino: str):
+    """Escritura atómica: archivo temporal y os.replace"""
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = destino + '.tmp'
+    pq.write_table(tabla_arrow, temporal, compression='zstd')
+    os.replace(temporal, destino)
+
+
+class ParquetExporter:
+    """Exportador Parquet de un datamart SQLite, con soporte incremental"""
+
+    def __init__(self, db_path: str, destino: str, nombre: Optional[str] = None,
+                 conectar: Callable[..., sqlite3.Connection] = sqlite3.connect):
+        require_pyarrow()
+        self.db_path = db_path
+        self.conectar = conectar
+        self.nombre = nombre or os.path.basename(db_path).rsplit('.db', 1)[0]
+        self.directorio = os.path.join(destino, self.nombre)
+        self.manifest_path = os.path.join(self.directorio, MANIFEST)
+
+    def _leer_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def export(self, incremental: bool = True) -> Dict[str, int]:
+        """Exportar dimensiones y hechos; devuelve conteos de archivos escritos/omitidos"""
+        anterior = self._leer_manifest() if incremental else {}
+        nuevo = {}
+        resumen = {'escritos': 0, 'omitidos': 0, 'eliminados': 0}
+
+        conn = self.conectar(self.db_path)
+        try:
+            dimensiones, hechos = _tablas_exportables(conn)
+            for tabla in dimensiones:
+                nuevo[tabla] = self._exportar_dimension(conn, tabla, anterior.get(tabla), resumen)
+            for tabla in hechos:
+                nuevo[tabla] = self._exportar_hechos(conn, tabla, anterior.get(tabla, {}), resumen)
+        finally:
+            conn.close()
+
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(nuevo, f, ensure_ascii=False, indent=1, sort_keys=True)
+        return resumen
+
+    def _exportar_dimension(self, conn, tabla: str, previo: Optional[Dict], resumen: Dict) -> Dict:
+        columnas = _columnas(conn, tabla)
+        filas = conn.execute(f'SELECT * FROM "{tabla}" ORDER BY 1').fetchall()
+        entrada = {'filas': len(filas), 'huella': _huella(filas)}
+        destino = os.path.join(self.directorio, f'{tabla}.parquet')
+        if previo == entrada and os.path.exists(destino):
+            resumen['omitidos'] += 1
+            return entrada
+        _escribir(_tabla_arrow(columnas, filas), destino)
+        resumen['escritos'] += 1
+        return entrada
+
+    def _exportar_hechos(self, conn, tabla: str, previas: Dict, resumen: Dict) -> Dict:
+        columnas = _columnas(conn, tabla)
+        nombres = [c for c, _ in columnas]
+        col_tiempo = _columna_tiempo(conn, tabla, nombres)
+        raiz = os.path.join(self.directorio, tabla)
+        if col_tiempo is None:
+            raise ValueError(f"{tabla} no tiene clave de DIM_TIEMPO para particionar")
+
+        lista = ', '.join(f'f."{c}"' for c in nombres)
+        cursor = conn.execute(f'''
+            SELECT COALESCE(t.año, 0), COALESCE(t.mes, 0), {lista}
+            FROM "{tabla}" f
+            LEFT JOIN DIM_TIEMPO t ON t.id_tiempo = f."{col_tiempo}"
+            ORDER BY 1, 2, f."{nombres[0]}"
+        ''')
+
+        particiones = {}
+        for (año, mes), grupo in itertools.groupby(cursor, key=lambda r: (r[0], r[1])):
+            filas = [r[2:] for r in grupo]
+            clave = f'año={año}/mes={mes}'
+            entrada = {'filas': len(filas), 'huella': _huella(filas)}
+            particiones[clave] = entrada
+            destino = os.path.join(raiz, f'año={año}', f'mes={mes}', 'part-0.parquet')
+            if previas.get(clave) == entrada and os.path.exists(destino):
+                resumen['omitidos'] += 1
+                continue
+            _escribir(_tabla_arrow(columnas, filas), destino)
+            resumen['escritos'] += 1
+
+        # Particiones que ya no tienen filas
+        if os.path.isdir(raiz):
+            for dir_año in os.listdir(raiz):
+                ruta_año = os.path.join(raiz, dir_año)
+                if not os.path.isdir(ruta_año):
+                    continue
+                for dir_mes in os.listdir(ruta_año):
+                    if f'{dir_año}/{dir_mes}' not in particiones:
+                        shutil.rmtree(os.path.join(ruta_año, dir_mes))
+                        resumen['eliminados'] += 1
+                if not os.listdir(ruta_año):
+                    os.rmdir(ruta_año)
+        return particiones
+
+
+def scan_table(destino: str, datamart: str, tabla: str, columns: Optional[List[str]] = None,
+               filters: Optional[List[Tuple]] = None):
+    """Leer una tabla exportada con proyección de columnas y poda de particiones
+
+    filters usa la forma DNF de pyarrow, p.ej. [('año', '=', 2024), ('mes', 'in', [1, 2])].
+    """
+    require_pyarrow()
+    ruta = os.path.join(destino, datamart, tabla)
+    if os.path.isdir(ruta):
+        return pq.read_table(ruta, columns=columns, filters=filters, partitioning='hive')
+    return pq.read_table(ruta + '.parquet', columns=columns, filters=filters)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Exportar datamarts SQLite a Parquet particionado')
+    parser.add_argument('db_paths', nargs='+', help='Archivos datamart_*.db')
+    parser.add_argument('--destino', default='parquet', help='Directorio raíz de salida')
+    parser.add_argument('--completo', action='store_true', help='Reescribir todas las particiones')
+    args = parser.parse_args()
+
+    for db_path in args.db_paths:
+        resumen = ParquetExporter(db_path, args.destino).export(incremental=not args.completo)
+        logger.info(
+            f"📦 {db_path}: {resumen['escritos']} archivos escritos, "
+            f"{resumen['omitidos']} sin cambios, {resumen['eliminados']} particiones eliminadas"
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+DUMPS POSTGRESQL - DATAMARTS EMPRESA MOLINERA
+Genera `dbs/sql/datamart_*.db.sql` directamente desde los archivos SQLite de
+los datamarts, listos para PostgreSQL sin posprocesado:
+
+- DDL con los tipos de pg_types.py (BOOLEAN, DATE, TIMESTAMP, DOUBLE PRECISION)
+  y cada tabla creada sin claves ni índices
+- datos como INSERT multi-fila con literales ya convertidos (TRUE/FALSE,
+  fechas 'AAAA-MM-DD', sin 0/1 en columnas booleanas) o, con formato copy,
+  como bloques COPY ... FROM stdin (para psql)
+- claves primarias, UNIQUE, índices y claves foráneas después de los datos,
+  y las vistas (FACT_VENTAS sobre sus particiones) al final
+- todo dentro de BEGIN/COMMIT
+
+Las filas se leen por lotes y se escriben a medida que llegan: la memoria no
+depende del tamaño del datamart y el tiempo crece linealmente con las filas.
+El archivo se escribe en un temporal y se renombra al terminar.
+
+Uso:
+    python3 scripts/pg_dump_export.py dbs/datamart_*.db --destino dbs/sql
+    python3 scripts/pg_dump_export.py dbs/datamart_ventas.db --destino /tmp --formato copy
+    psql "$DATABASE_URL" -f dbs/sql/datamart_ventas.db.sql
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from pg_types import ORDEN_DIFERIDAS, TablePlan, deferred_ddl, quote_ident
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ('insert', 'copy')
+
+# Filas leídas de SQLite por lote y filas por sentencia INSERT
+TAMAÑO_LOTE = 5000
+FILAS_POR_INSERT = 500
+
+
+def dump_path(db_path: str, destino: str) -> str:
+    """datamart_ventas.db -> <destino>/datamart_ventas.db.sql (nombre que espera deploy_to_aiven.py)"""
+    return os.path.join(destino, os.path.basename(db_path) + '.sql')
+
+
+def _objetos(conn) -> Tuple[List[str], List[Tuple[str, str]]]:
+    tablas = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name"
+    )]
+    vistas = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view' ORDER BY name").fetchall()
+    return tablas, vistas
+
+
+def _escribir_datos(f, conn, plan: TablePlan, formato: str, filas_por_insert: int) -> int:
+    columnas = plan.column_list()
+    cursor = conn.execute(f'SELECT {columnas} FROM {quote_ident(plan.table)}')
+    filas = 0
+    if formato == 'copy':
+        f.write(f'COPY {quote_ident(plan.table)} ({columnas}) FROM stdin;\n')
+    while True:
+        lote = cursor.fetchmany(TAMAÑO_LOTE)
+        if not lote:
+            break
+        filas += len(lote)
+        if formato == 'copy':
+            f.write(plan.format_copy_rows(lote))
+            continue
+        for inicio in range(0, len(lote), filas_por_insert):
+            f.write(f'INSERT INTO {quote_ident(plan.table)} ({columnas}) VALUES\n')
+            f.write(plan.format_values(lote[inicio:inicio + filas_por_insert]))
+            f.write(';\n')
+    if formato == 'copy':
+        f.write('\\.\n')
+    return filas
+
+
+def export_pg_dump(db_path: str, destino: str, formato: str = 'insert',
+                   filas_por_insert: int = FILAS_POR_INSERT,
+                   conectar: Callable[..., sqlite3.Connection] = sqlite3.connect) -> Dict:
+    """Escribir el dump PostgreSQL de un datamart; devuelve un resumen"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de dump desconocido: {formato}")
+    inicio = time.perf_counter()
+    os.makedirs(destino, exist_ok=True)
+    ruta = dump_path(db_path, destino)
+    temporal = ruta + '.tmp'
+
+    conn = conectar(f'file:{os.path.abspath(db_path)}?mode=ro', uri=True)
+    try:
+        tablas, vistas = _objetos(conn)
+        filas = 0
+        diferidas = []
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(f'-- Dump PostgreSQL de {os.path.basename(db_path)} generado por crear_datamarts.py\n')
+            f.write("BEGIN;\nSET client_encoding = 'UTF8';\n")
+            for nombre, _ in vistas:
+                f.write(f'DROP VIEW IF EXISTS {quote_ident(nombre)} CASCADE;\n')
+            for tabla in tablas:
+                plan = TablePlan.from_sqlite(conn, tabla)
+                diferidas.extend(deferred_ddl(conn, tabla, plan.columns))
+                f.write(f'\nDROP TABLE IF EXISTS {quote_ident(tabla)} CASCADE;\n')
+                f.write(plan.ddl(with_primary_key=False) + '\n')
+                filas += _escribir_datos(f, conn, plan, formato, filas_por_insert)
+
+            # Claves e índices sobre los datos ya cargados
+            f.write('\n')
+            for d in sorted(diferidas, key=lambda d: ORDEN_DIFERIDAS.index(d['tipo'])):
+                f.write(d['sql'] + ';\n')
+                if d['tipo'] == 'fk':
+                    f.write(f"ALTER TABLE {quote_ident(d['tabla'])} VALIDATE CONSTRAINT {quote_ident(d['nombre'])};\n")
+            for _, sql in vistas:
+                f.write(re.sub(r'^CREATE\s+VIEW\s+IF\s+NOT\s+EXISTS', 'CREATE VIEW', sql.strip(), flags=re.I) + ';\n')
+            f.write('COMMIT;\n')
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    finally:
+        conn.close()
+
+    return {
+        'archivo': ruta,
+        'formato': formato,
+        'tablas': len(tablas),
+        'vistas': len(vistas),
+        'filas': filas,
+        'bytes': os.path.getsize(ruta),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Generar dumps PostgreSQL desde los datamarts SQLite')
+    parser.add_argument('dbs', nargs='+', help='Archivos datamart_*.db')
+    parser.add_argument('--destino', default=os.path.join('dbs', 'sql'), help='Directorio de los dumps')
+    parser.add_argument('--formato', choices=FORMATOS, default='insert',
+                        help='insert: INSERT multi-fila (lo ejecuta deploy_to_aiven.py); copy: bloques COPY para psql')
+    parser.add_argument('--filas-por-insert', type=int, default=FILAS_POR_INSERT)
+    args = parser.parse_args()
+
+    for db in args.dbs:
+        r = export_pg_dump(db, args.destino, args.formato, args.filas_por_insert)
+        logger.info(f"🐘 {r['archivo']}: {r['tablas']} tablas, {r['filas']} filas, "
+                    f"{r['bytes'] / 1024:.1f} KB en {r['segundos']:.2f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+MAPEO DE TIPOS SQLITE -> POSTGRESQL - DESPLIEGUE DE DATAMARTS
+Capa de tipos compartida por los modos de despliegue de deploy_to_aiven.py.
+Los tipos se leen del esquema de cada datamart (PRAGMA table_info) en lugar de
+buscar 'BOOLEAN' con expresiones regulares en el texto de los CREATE TABLE.
+
+Por cada tabla se arma una sola vez un TablePlan con:
+
+- el DDL de PostgreSQL (tipos mapeados, NOT NULL y clave primaria)
+- un conversor por columna que se aplica a lotes de filas en streaming:
+  BOOLEAN 0/1 -> t/f, DATE 'AAAA-MM-DD', DATETIME 'AAAA-MM-DD HH:MM:SS',
+  INTEGER sin decimales, REAL con todos sus dígitos (DOUBLE PRECISION) y
+  NUMERIC(p,s) redondeado a su escala
+- el conversor equivalente para literales SQL (reescritura de dumps)
+
+Los tipos declarados desconocidos siguen las reglas de afinidad de SQLite
+(INT -> entero, CHAR/CLOB/TEXT -> texto, REAL/FLOA/DOUB -> real).
+
+No depende de psycopg2: el plan se puede inspeccionar sin servidor.
+
+Uso:
+    python3 scripts/pg_types.py dbs/datamart_ventas.db
+    python3 scripts/pg_types.py dbs/datamart_ventas.db --tabla DIM_CLIENTE
+"""
+
+import argparse
+import math
+import re
+import sqlite3
+import sys
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Tipo declarado en SQLite -> tipo PostgreSQL
+PG_TYPES = {
+    'INTEGER': 'BIGINT',
+    'INT': 'BIGINT',
+    'BIGINT': 'BIGINT',
+    'SMALLINT': 'BIGINT',
+    'REAL': 'DOUBLE PRECISION',
+    'FLOAT': 'DOUBLE PRECISION',
+    'DOUBLE': 'DOUBLE PRECISION',
+    'NUMERIC': 'NUMERIC',
+    'DECIMAL': 'NUMERIC',
+    'TEXT': 'TEXT',
+    'VARCHAR': 'VARCHAR',
+    'CHAR': 'VARCHAR',
+    'BOOLEAN': 'BOOLEAN',
+    'DATE': 'DATE',
+    'DATETIME': 'TIMESTAMP',
+    'TIMESTAMP': 'TIMESTAMP',
+}
+
+VALORES_VERDADEROS = ('1', 't', 'true', 'yes', 'si', 'sí')
+
+_DECLARADO = re.compile(r'^\s*(?P<base>[A-Za-z][A-Za-z ]*?)\s*(?:\((?P<args>[^)]*)\))?\s*$')
+_FECHA = re.compile(r'^\d{4}-\d{2}-\d{2}')
+_FECHA_HORA = re.compile(r'^(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)')
+
+# (nombre, tipo PostgreSQL, NOT NULL, posición en la clave primaria o 0)
+Columna = Tuple[str, str, bool, int]
+Conversor = Callable[[object], str]
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _afinidad(base: str) -> str:
+    if 'INT' in base:
+        return 'BIGINT'
+    if any(t in base for t in ('CHAR', 'CLOB', 'TEXT')):
+        return 'TEXT'
+    if any(t in base for t in ('REAL', 'FLOA', 'DOUB')):
+        return 'DOUBLE PRECISION'
+    return 'TEXT'
+
+
+def pg_type(sqlite_type: Optional[str]) -> str:
+    """Tipo PostgreSQL de un tipo declarado en SQLite, conservando precisión y longitud"""
+    m = _DECLARADO.match(sqlite_type or '')
+    if not m:
+        return 'TEXT'
+    base = ' '.join(m.group('base').upper().split())
+    tipo = PG_TYPES.get(base) or PG_TYPES.get(base.split()[0]) or _afinidad(base)
+    args = [a.strip() for a in (m.group('args') or '').split(',') if a.strip()]
+    if tipo == 'NUMERIC' and args and all(a.isdigit() for a in args[:2]):
+        return f"NUMERIC({','.join(args[:2])})"
+    if tipo == 'VARCHAR':
+        return f'VARCHAR({args[0]})' if args and args[0].isdigit() else 'TEXT'
+    return tipo
+
+
+def base_type(tipo: str) -> str:
+    """Tipo PostgreSQL sin precisión ni longitud (NUMERIC(12,2) -> NUMERIC)"""
+    return tipo.split('(')[0]
+
+
+def numeric_scale(tipo: str) -> Optional[int]:
+    m = re.match(r'^NUMERIC\(\d+,(\d+)\)$', tipo)
+    return int(m.group(1)) if m else None
+
+
+def table_columns(sqlite_conn, table: str) -> List[Columna]:
+    """Columnas de una tabla SQLite como (nombre, tipo PostgreSQL, NOT NULL, posición PK)"""
+    return [
+        (name, pg_type(decl), bool(notnull), pk)
+        for _, name, decl, notnull, _, pk in sqlite_conn.execute(f'PRAGMA table_info({quote_ident(table)})')
+    ]
+
+
+def primary_key(columns: Sequence[Columna]) -> List[str]:
+    return [name for name, _, _, pos in sorted(columns, key=lambda c: c[3]) if pos]
+
+
+def _lista(nombres: Iterable[str]) -> str:
+    return ', '.join(quote_ident(n) for n in nombres)
+
+
+def create_table_sql(table: str, columns: Sequence[Columna], with_primary_key: bool = True) -> str:
+    """CREATE TABLE de PostgreSQL conservando NOT NULL y, si se pide, la clave primaria"""
+    defs = [
+        f'{quote_ident(name)} {ctype}' + (' NOT NULL' if notnull else '')
+        for name, ctype, notnull, _ in columns
+    ]
+    pk = primary_key(columns)
+    if pk and with_primary_key:
+        defs.append(f'PRIMARY KEY ({_lista(pk)})')
+    return f'CREATE TABLE {quote_ident(table)} (\n    ' + ',\n    '.join(defs) + '\n);'
+
+
+# Orden de construcción de lo diferido: las claves foráneas necesitan las
+# claves primarias/únicas de la tabla referenciada
+ORDEN_DIFERIDAS = ('pk', 'unique', 'check', 'index', 'fk')
+
+
+def _diferida(tipo: str, tabla: str, nombre: str, sql: str) -> Dict:
+    return {'tipo': tipo, 'tabla': tabla, 'nombre': nombre, 'sql': sql}
+
+
+def deferred_ddl(sqlite_conn, table: str, columns: Sequence[Columna]) -> List[Dict]:
+    """Clave primaria, restricciones UNIQUE, índices y claves foráneas de una tabla,
+    para crearlos después de la carga masiva
+
+    Las claves foráneas se crean NOT VALID (el llamador las valida después).
+    Los índices parciales o sobre expresiones no se trasladan.
+    """
+    t = quote_ident(table)
+    diferidas = []
+    pk = primary_key(columns)
+    if pk:
+        nombre = f'{table}_pkey'
+        diferidas.append(_diferida('pk', table, nombre, f'ALTER TABLE {t} ADD CONSTRAINT '
+                                                         f'{quote_ident(nombre)} PRIMARY KEY ({_lista(pk)})'))
+    for _, indice, unico, origen, parcial in sqlite_conn.execute(f'PRAGMA index_list({t})'):
+        if origen == 'pk' or parcial:
+            continue
+        cols = [c for _, _, c in sorted(sqlite_conn.execute(f'PRAGMA index_info({quote_ident(indice)})'))]
+        if None in cols:
+            continue
+        if origen == 'u':
+            nombre = f"{table}_{'_'.join(cols)}_key"
+            diferidas.append(_diferida('unique', table, nombre, f'ALTER TABLE {t} ADD CONSTRAINT '
+                                                                 f'{quote_ident(nombre)} UNIQUE ({_lista(cols)})'))
+        else:
+            diferidas.append(_diferida('index', table, indice, f"CREATE {'UNIQUE ' if unico else ''}INDEX "
+                                                                f'{quote_ident(indice)} ON {t} ({_lista(cols)})'))
+    claves: Dict[int, tuple] = {}
+    for fk_id, seq, ref, desde, hacia, *_ in sqlite_conn.execute(f'PRAGMA foreign_key_list({t})'):
+        claves.setdefault(fk_id, (ref, []))[1].append((seq, desde, hacia))
+    for fk_id, (ref, pares) in sorted(claves.items()):
+        pares.sort()
+        destino = f' ({_lista(h for _, _, h in pares)})' if all(h for _, _, h in pares) else ''
+        nombre = f'{table}_fk_{fk_id}'
+        diferidas.append(_diferida('fk', table, nombre, (
+            f'ALTER TABLE {t} ADD CONSTRAINT {quote_ident(nombre)} FOREIGN KEY ({_lista(d for _, d, _ in pares)}) '
+            f'REFERENCES {quote_ident(ref)}{destino} NOT VALID'
+        )))
+    return diferidas
+
+
+# Conversores a campo CSV (COPY ... FORMAT csv). NULL se emite aparte como
+# campo vacío sin comillas; los textos van siempre entre comillas.
+
+def _csv_text(value) -> str:
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _csv_bool(value) -> str:
+    if isinstance(value, str):
+        return 't' if value.strip().lower() in VALORES_VERDADEROS else 'f'
+    return 't' if value else 'f'
+
+
+def _csv_int(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return _csv_text(value) if isinstance(value, str) else str(value)
+
+
+def _csv_float(value) -> str:
+    # repr conserva todos los dígitos del double de SQLite
+    return _csv_text(value) if isinstance(value, str) else repr(float(value))
+
+
+def _csv_numeric(escala: Optional[int]) -> Conversor:
+    if escala is None:
+        return _csv_float
+    cuanto = Decimal(1).scaleb(-escala)
+
+    def conversor(value) -> str:
+        if isinstance(value, str):
+            return _csv_text(value)
+        return str(Decimal(repr(value) if isinstance(value, float) else value).quantize(cuanto, ROUND_HALF_UP))
+    conversor.__name__ = f'_csv_numeric_{escala}'
+    return conversor
+
+
+def _date_text(value) -> Optional[str]:
+    m = _FECHA.match(str(value))
+    return m.group() if m else None
+
+
+def _timestamp_text(value) -> Optional[str]:
+    texto = str(value)
+    m = _FECHA_HORA.match(texto)
+    if m:
+        return f'{m.group(1)} {m.group(2)}'
+    return f'{texto} 00:00:00' if _FECHA.fullmatch(texto) else None
+
+
+def _csv_date(value) -> str:
+    return _date_text(value) or _csv_text(value)
+
+
+def _csv_timestamp(value) -> str:
+    return _timestamp_text(value) or _csv_text(value)
+
+
+def csv_converter(tipo: str) -> Conversor:
+    base = base_type(tipo)
+    if base == 'NUMERIC':
+        return _csv_numeric(numeric_scale(tipo))
+    return {
+        'BIGINT': _csv_int,
+        'DOUBLE PRECISION': _csv_float,
+        'BOOLEAN': _csv_bool,
+        'DATE': _csv_date,
+        'TIMESTAMP': _csv_timestamp,
+    }.get(base, _csv_text)
+
+
+def csv_formatters(columns: Sequence[Columna]) -> List[Conversor]:
+    """Conversor CSV por columna"""
+    return [csv_converter(ctype) for _, ctype, _, _ in columns]
+
+
+# Conversores de valores SQLite a literales SQL de PostgreSQL y a campos de COPY
+# en formato texto (dumps generados por pg_dump_export.py)
+
+def _sql_text(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _copy_escape(texto: str) -> str:
+    return texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def sql_value_converter(tipo: str) -> Conversor:
+    """Valor Python (no NULL) -> literal SQL del tipo PostgreSQL `tipo`"""
+    base = base_type(tipo)
+    if base == 'BOOLEAN':
+        return lambda v: 'TRUE' if _csv_bool(v) == 't' else 'FALSE'
+    if base in ('BIGINT', 'DOUBLE PRECISION', 'NUMERIC'):
+        numero = csv_converter(tipo)
+
+        def conversor(v) -> str:
+            if isinstance(v, str):
+                return _sql_text(v)
+            if isinstance(v, float) and not math.isfinite(v):
+                return _sql_text(repr(v).replace('inf', 'Infinity').replace('nan', 'NaN'))
+            return numero(v)
+        return conversor
+    if base in ('DATE', 'TIMESTAMP'):
+        fecha = _date_text if base == 'DATE' else _timestamp_text
+        return lambda v: _sql_text(fecha(v) or v)
+    return _sql_text
+
+
+def copy_value_converter(tipo: str) -> Conversor:
+    """Valor Python (no NULL) -> campo de COPY ... FROM stdin (formato texto)"""
+    if base_type(tipo) in ('TEXT', 'VARCHAR'):
+        return lambda v: _copy_escape(str(v))
+    csv = csv_converter(tipo)
+
+    def conversor(v) -> str:
+        campo = csv(v)
+        return _copy_escape(str(v)) if campo.startswith('"') else campo
+    return conversor
+
+
+def _sql_bool(literal: str) -> str:
+    v = literal.strip()
+    if len(v) >= 2 and v[0] == v[-1] == "'":
+        v = v[1:-1]
+    if v.upper() == 'NULL':
+        return literal
+    if v.lower() in VALORES_VERDADEROS or v.upper() == 'TRUE':
+        return 'TRUE'
+    if v.lower() in ('0', 'f', 'false', 'no') or v.upper() == 'FALSE':
+        return 'FALSE'
+    return literal
+
+
+def sql_literal_converter(tipo: str) -> Optional[Callable[[str], str]]:
+    """Conversor de un literal SQL de SQLite a PostgreSQL, o None si se deja igual"""
+    return _sql_bool if base_type(tipo) == 'BOOLEAN' else None
+
+
+class TablePlan:
+    """DDL y conversores de una tabla, calculados una vez y aplicados por lotes"""
+
+    def __init__(self, table: str, columns: Sequence[Columna]):
+        self.table = table
+        self.columns = list(columns)
+        self.names = [c[0] for c in self.columns]
+        self.types = [c[1] for c in self.columns]
+        self.formatters = csv_formatters(self.columns)
+        self.literals = [sql_value_converter(c[1]) for c in self.columns]
+        self.copy_fields = [copy_value_converter(c[1]) for c in self.columns]
+
+    @classmethod
+    def from_sqlite(cls, sqlite_conn, table: str) -> 'TablePlan':
+        return cls(table, table_columns(sqlite_conn, table))
+
+    def ddl(self, with_primary_key: bool = True) -> str:
+        return create_table_sql(self.table, self.columns, with_primary_key)
+
+    def column_list(self) -> str:
+        return ', '.join(quote_ident(n) for n in self.names)
+
+    def format_rows(self, rows: Iterable[Sequence]) -> str:
+        """Lote de filas SQLite como texto CSV listo para COPY"""
+        formatters = self.formatters
+        return ''.join(
+            ','.join('' if v is None else fmt(v) for fmt, v in zip(formatters, row)) + '\n'
+            for row in rows
+        )
+
+    def format_values(self, rows: Iterable[Sequence]) -> str:
+        """Lote de filas como tuplas de VALUES de un INSERT multi-fila"""
+        literals = self.literals
+        return ',\n'.join(
+            '(' + ', '.join('NULL' if v is None else lit(v) for lit, v in zip(literals, row)) + ')'
+            for row in rows
+        )
+
+    def format_copy_rows(self, rows: Iterable[Sequence]) -> str:
+        """Lote de filas en el formato texto de COPY (tabuladores, \\N para NULL)"""
+        fields = self.copy_fields
+        return ''.join(
+            '\t'.join('\\N' if v is None else fmt(v) for fmt, v in zip(fields, row)) + '\n'
+            for row in rows
+        )
+
+    def describe(self) -> List[Dict]:
+        return [
+            {'columna': name, 'tipo': ctype, 'no_nulo': notnull, 'pk': pk,
+             'conversor': fmt.__name__}
+            for (name, ctype, notnull, pk), fmt in zip(self.columns, self.formatters)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mostrar el plan de tipos PostgreSQL de un datamart')
+    parser.add_argument('db', help='Archivo datamart_*.db')
+    parser.add_argument('--tabla', help='Mostrar sólo esta tabla')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    try:
+        tablas = [args.tabla] if args.tabla else [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name"
+        )]
+        for tabla in tablas:
+            plan = TablePlan.from_sqlite(conn, tabla)
+            print(plan.ddl())
+            for c in plan.describe():
+                print(f"  -- {c['columna']:28} {c['tipo']:18} {c['conversor']}")
+            print()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
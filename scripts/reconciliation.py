@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+CONCILIACIÓN ORIGEN / DATAMARTS - EMPRESA MOLINERA
+Comprueba tras cada construcción que las tablas de hechos contienen
+exactamente las filas de la BD origen:
+
+    VENTAS       -> FACT_VENTAS        (datamart_ventas.db)
+    INVENTARIOS  -> FACT_INVENTARIO    (datamart_inventarios.db)
+    DISTRIBUCION -> FACT_DISTRIBUCION  (datamart_distribucion.db)
+    PRODUCCION   -> FACT_PRODUCCION    (datamart_produccion.db)
+
+Por cada lado se ejecuta una sola consulta de agregación (un recorrido, sin
+ordenar ni traer filas a Python) que calcula:
+
+- número de filas y suma de la clave
+- suma en céntimos de cada medida que el cargador copia sin transformar
+- una huella independiente del orden: la suma de un hash polinómico por fila
+  de (clave, medidas), que detecta medidas asignadas a otra fila
+
+Las medidas calculadas con valores aleatorios en la carga no se comparan.
+Las filas origen sin fecha válida (nula o no ISO) no se cargan: se cuentan
+como rechazadas y quedan fuera de la comparación.
+Además, ninguna clave de tiempo del hecho puede faltar en DIM_TIEMPO: una
+fila huérfana desaparece en silencio de toda consulta que una ambas tablas.
+
+Uso:
+    python3 scripts/reconciliation.py empresa_molinera.db --dbs .
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Sequence
+
+from fact_partitions import time_column
+
+logger = logging.getLogger(__name__)
+
+# Módulo y multiplicador del hash por fila: cada paso queda por debajo de 2^62
+# y la suma de decenas de millones de filas cabe en un INTEGER de SQLite
+MODULO_HUELLA = 2147483647
+MULTIPLICADOR_HUELLA = 1000003
+
+# (tabla origen, clave origen, tabla de hechos, clave hecho, medidas origen -> hecho)
+RECONCILIACIONES = {
+    'FACT_VENTAS': {
+        'datamart': 'ventas',
+        'origen': 'VENTAS',
+        'clave_origen': 'id_venta',
+        'clave': 'id_venta',
+        'fecha_origen': 'fecha_venta',
+        'medidas': [
+            ('cantidad_sacos', 'cantidad_sacos'),
+            ('cantidad_toneladas', 'cantidad_toneladas'),
+            ('precio_por_saco', 'precio_por_saco'),
+            ('total_venta', 'total_venta'),
+        ],
+    },
+    'FACT_INVENTARIO': {
+        'datamart': 'inventarios',
+        'origen': 'INVENTARIOS',
+        'clave_origen': 'id_inventario',
+        'clave': 'id_inventario',
+        'fecha_origen': 'fecha_registro',
+        'medidas': [
+            ('stock_inicial_ton', 'stock_inicial_ton'),
+            ('entradas_ton', 'entradas_ton'),
+            ('salidas_ton', 'salidas_ton'),
+            ('stock_final_ton', 'stock_final_ton'),
+            ('costo_unitario', 'valor_unitario'),
+            ('valor_total', 'valor_total'),
+        ],
+    },
+    'FACT_DISTRIBUCION': {
+        'datamart': 'distribucion',
+        'origen': 'DISTRIBUCION',
+        'clave_origen': 'id_distribucion',
+        'clave': 'id_distribucion',
+        'fecha_origen': 'fecha_distribucion',
+        'medidas': [],
+    },
+    'FACT_PRODUCCION': {
+        'datamart': 'produccion',
+        'origen': 'PRODUCCION',
+        'clave_origen': 'id_produccion',
+        'clave': 'id_produccion',
+        'fecha_origen': 'fecha_produccion',
+        'medidas': [
+            ('cantidad_producida_ton', 'cantidad_producto_terminado_ton'),
+        ],
+    },
+}
+
+
+def fecha_valida_sql(columna: str) -> str:
+    """Condición SQL de fecha ISO válida (YYYY-MM-DD al inicio); falsa si es NULL
+
+    date() acepta días 29-31 en cualquier mes; con '+0 days' los normaliza
+    (2024-02-30 -> 2024-03-01) y la comparación los descarta.
+    """
+    return f"date(substr({columna}, 1, 10), '+0 days') = substr({columna}, 1, 10)"
+
+
+def _centimos(columna: str) -> str:
+    return f'CAST(ROUND(IFNULL("{columna}", 0) * 100) AS INTEGER)'
+
+
+def aggregate_sql(tabla: str, clave: str, medidas: Sequence[str], donde: str = '') -> str:
+    """Consulta de un solo recorrido con conteo, sumas y huella de la tabla"""
+    huella = f'("{clave}" % {MODULO_HUELLA})'
+    for medida in medidas:
+        huella = f'(({huella} * {MULTIPLICADOR_HUELLA} + {_centimos(medida)}) % {MODULO_HUELLA})'
+    columnas = [
+        'COUNT(*) AS filas',
+        f'IFNULL(SUM("{clave}"), 0) AS suma_clave',
+        *(f'IFNULL(SUM({_centimos(m)}), 0) AS "suma_{m}"' for m in medidas),
+        f'IFNULL(SUM({huella}), 0) AS huella',
+    ]
+    return f'SELECT {", ".join(columnas)} FROM "{tabla}"' + (f' WHERE {donde}' if donde else '')
+
+
+def _metricas(conn, tabla: str, clave: str, medidas: Sequence[str], donde: str = '') -> List:
+    return list(conn.execute(aggregate_sql(tabla, clave, medidas, donde)).fetchone())
+
+
+def time_key_columns(conn, tabla: str) -> List[str]:
+    """Columnas de `tabla` que referencian DIM_TIEMPO (también si es la vista de particiones)"""
+    columnas = [fk[3] for fk in conn.execute(f'PRAGMA foreign_key_list("{tabla}")') if fk[2] == 'DIM_TIEMPO']
+    if not columnas:
+        columna = time_column(conn, tabla)
+        columnas = [columna] if columna else []
+    return columnas
+
+
+def orphan_time_keys(conn, tabla: str) -> int:
+    """Filas de `tabla` con alguna clave de tiempo ausente de DIM_TIEMPO"""
+    condiciones = [
+        f'("{c}" IS NOT NULL AND NOT EXISTS (SELECT 1 FROM DIM_TIEMPO t WHERE t.id_tiempo = f."{c}"))'
+        for c in time_key_columns(conn, tabla)
+    ]
+    if not condiciones:
+        return 0
+    return conn.execute(f'SELECT COUNT(*) FROM "{tabla}" f WHERE {" OR ".join(condiciones)}').fetchone()[0]
+
+
+def reconcile(source_conn, conexiones: Dict[str, sqlite3.Connection],
+              omitir: Sequence[str] = ()) -> List[Dict]:
+    """Comparar cada tabla de hechos con su tabla origen
+
+    `conexiones` va de nombre de datamart a conexión; las tablas de `omitir`
+    (p.ej. pobladas con datos de ejemplo) se informan sin comparar.
+    """
+    resultados = []
+    for tabla, spec in RECONCILIACIONES.items():
+        resultado = {'tabla': tabla, 'origen': spec['origen'], 'datamart': spec['datamart']}
+        if tabla in omitir or spec['datamart'] not in conexiones:
+            resultado.update(estado='omitida', diferencias={})
+            resultados.append(resultado)
+            continue
+
+        inicio = time.perf_counter()
+        nombres = ['filas', 'suma_clave', *(f"suma_{m[1]}" for m in spec['medidas']), 'huella']
+        valida = fecha_valida_sql(spec['fecha_origen'])
+        origen = _metricas(source_conn, spec['origen'], spec['clave_origen'],
+                           [m[0] for m in spec['medidas']], valida)
+        rechazadas = source_conn.execute(
+            f"SELECT COUNT(*) FROM {spec['origen']} WHERE NOT IFNULL({valida}, 0)"
+        ).fetchone()[0]
+        destino = _metricas(conexiones[spec['datamart']], tabla, spec['clave'],
+                            [m[1] for m in spec['medidas']])
+        diferencias = {
+            nombre: {'origen': a, 'datamart': b}
+            for nombre, a, b in zip(nombres, origen, destino) if a != b
+        }
+        huerfanas = orphan_time_keys(conexiones[spec['datamart']], tabla)
+        if huerfanas:
+            diferencias['claves_tiempo_huerfanas'] = {'origen': 0, 'datamart': huerfanas}
+        resultado.update(
+            estado='diferencia' if diferencias else 'ok',
+            filas_origen=origen[0],
+            filas_datamart=destino[0],
+            rechazadas=rechazadas,
+            diferencias=diferencias,
+            segundos=round(time.perf_counter() - inicio, 3),
+        )
+        resultados.append(resultado)
+    return resultados
+
+
+def log_reconciliation(resultados: List[Dict]) -> bool:
+    """Registrar el resultado de la conciliación; True si no hay diferencias"""
+    correcto = True
+    for r in resultados:
+        if r.get('rechazadas'):
+            logger.warning(f"⚠️  {r['origen']}: {r['rechazadas']} filas con fecha nula o inválida "
+                           f"rechazadas (no se cargan en {r['tabla']})")
+        if r['estado'] == 'omitida':
+            logger.info(f"⏭️  {r['tabla']}: conciliación omitida")
+        elif r['estado'] == 'ok':
+            logger.info(f"✅ {r['tabla']}: {r['filas_datamart']} filas concilian con {r['origen']} "
+                        f"({r['segundos']:.3f} s)")
+        else:
+            correcto = False
+            detalle = ', '.join(
+                f"{nombre} {d['origen']} ≠ {d['datamart']}" for nombre, d in r['diferencias'].items()
+            )
+            logger.error(f"❌ {r['tabla']} no concilia con {r['origen']}: {detalle}")
+    return correcto
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Conciliar la BD origen con los datamarts')
+    parser.add_argument('source_db', help='BD origen (empresa_molinera.db)')
+    parser.add_argument('--dbs', default='.', help='Directorio con los archivos datamart_*.db')
+    args = parser.parse_args()
+
+    source_conn = sqlite3.connect(args.source_db)
+    conexiones = {}
+    try:
+        for spec in RECONCILIACIONES.values():
+            ruta = os.path.join(args.dbs, f"datamart_{spec['datamart']}.db")
+            if os.path.exists(ruta):
+                conexiones[spec['datamart']] = sqlite3.connect(f"file:{os.path.abspath(ruta)}?mode=ro", uri=True)
+        correcto = log_reconciliation(reconcile(source_conn, conexiones))
+    finally:
+        source_conn.close()
+        for conn in conexiones.values():
+            conn.close()
+    return 0 if correcto else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
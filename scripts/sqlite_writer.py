@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+ESCRITOR SQLITE CON COLA - EMPRESA MOLINERA
+SQLite admite un solo escritor por archivo. Este módulo separa la producción
+de filas (lectura de CSV, transformaciones) de su escritura:
+
+- SQLiteWriter: servicio de escritura con una única conexión dedicada en su
+  propio hilo. Los productores (uno o varios hilos) dejan lotes de filas en una
+  cola acotada; el escritor los inserta con executemany y confirma en
+  transacciones grandes (cada `filas_por_transaccion` filas y en flush/close).
+  Con la cola llena, put() bloquea al productor (contrapresión) en lugar de
+  acumular memoria, y ningún productor abre conexiones de escritura, así que
+  no hay errores "database is locked"
+- transform_in_processes(): aplica una transformación de lotes en procesos
+  (varios núcleos) y entrega los resultados en el orden de entrada, con un
+  número acotado de lotes en vuelo. El consumidor sigue siendo el único que
+  escribe
+
+Uso (medir el escritor con productores en procesos):
+    python3 scripts/sqlite_writer.py bench --filas 500000 --procesos 1 2 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Lotes que caben en la cola antes de bloquear a los productores
+COLA_LOTES = 16
+
+# Filas por transacción del escritor
+FILAS_POR_TRANSACCION = 100000
+
+_FIN = object()
+
+
+class SQLiteWriter:
+    """Único escritor de un archivo SQLite alimentado por una cola acotada
+
+    Se usa como context manager: al salir sin error se escribe y confirma lo
+    pendiente; si hubo una excepción, se descarta lo no confirmado. Un error del
+    escritor se relanza en el productor en su siguiente put(), flush() o close().
+    """
+
+    def __init__(self, db_path: str, conectar: Callable[..., sqlite3.Connection] = sqlite3.connect,
+                 tamaño_cola: int = COLA_LOTES, filas_por_transaccion: int = FILAS_POR_TRANSACCION,
+                 pragmas: Sequence[str] = ()):
+        self.db_path = db_path
+        self.conectar = conectar
+        self.filas_por_transaccion = filas_por_transaccion
+        self.pragmas = list(pragmas)
+        self._cola = queue.Queue(maxsize=tamaño_cola)
+        self._hilo: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self._abortar = False
+        self.estadisticas = {
+            'lotes': 0,
+            'filas': 0,
+            'transacciones': 0,
+            'espera_productores_s': 0.0,
+            'escritura_s': 0.0,
+        }
+
+    def start(self) -> 'SQLiteWriter':
+        listo = threading.Event()
+        self._hilo = threading.Thread(target=self._run, args=(listo,), name='sqlite-writer', daemon=True)
+        self._hilo.start()
+        listo.wait()
+        self._raise_error()
+        return self
+
+    def _run(self, listo: threading.Event):
+        try:
+            conn = self.conectar(self.db_path, check_same_thread=False)
+            for pragma in self.pragmas:
+                conn.execute(f"PRAGMA {pragma}")
+        except BaseException as e:
+            self._error = e
+            listo.set()
+            return
+        listo.set()
+        pendientes = 0
+        try:
+            while True:
+                item = self._cola.get()
+                try:
+                    if item is _FIN:
+                        break
+                    if isinstance(item, threading.Event):
+                        # flush(): confirmar lo escrito y avisar al productor
+                        if pendientes and self._error is None and not self._abortar:
+                            self._commit(conn)
+                        pendientes = 0
+                        item.set()
+                        continue
+                    if self._error is not None or self._abortar:
+                        continue
+                    sql, filas = item
+                    inicio = time.perf_counter()
+                    conn.executemany(sql, filas)
+                    self.estadisticas['escritura_s'] += time.perf_counter() - inicio
+                    self.estadisticas['lotes'] += 1
+                    self.estadisticas['filas'] += len(filas)
+                    pendientes += len(filas)
+                    if pendientes >= self.filas_por_transaccion:
+                        self._commit(conn)
+                        pendientes = 0
+                except Exception as e:
+                    # Se sigue vaciando la cola para no bloquear a los productores
+                    self._error = self._error or e
+                    conn.rollback()
+                    pendientes = 0
+                finally:
+                    self._cola.task_done()
+            if self._error is None and not self._abortar:
+                if pendientes:
+                    self._commit(conn)
+            else:
+                conn.rollback()
+        except Exception as e:
+            self._error = self._error or e
+        finally:
+            conn.close()
+
+    def _commit(self, conn):
+        inicio = time.perf_counter()
+        conn.commit()
+        self.estadisticas['escritura_s'] += time.perf_counter() - inicio
+        self.estadisticas['transacciones'] += 1
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, item):
+        inicio = time.perf_counter()
+        self._cola.put(item)
+        self.estadisticas['espera_productores_s'] += time.perf_counter() - inicio
+
+    def put(self, sql: str, filas: List[tuple]):
+        """Encolar un lote de filas para `sql` (bloquea mientras la cola esté llena)"""
+        self._raise_error()
+        if filas:
+            self._put((sql, filas))
+
+    def write_all(self, sql: str, lotes: Iterable[List[tuple]]) -> int:
+        """Encolar todos los lotes de un iterable; devuelve el número de filas"""
+        total = 0
+        for filas in lotes:
+            self.put(sql, filas)
+            total += len(filas)
+        return total
+
+    def flush(self):
+        """Esperar a que todo lo encolado esté escrito y confirmado"""
+        hecho = threading.Event()
+        self._put(hecho)
+        hecho.wait()
+        self._raise_error()
+
+    def close(self, abortar: bool = False):
+        if self._hilo is None:
+            return
+        self._abortar = self._abortar or abortar
+        self._put(_FIN)
+        self._hilo.join()
+        self._hilo = None
+        if not abortar:
+            self._raise_error()
+
+    def __enter__(self) -> 'SQLiteWriter':
+        return self.start()
+
+    def __exit__(self, tipo, valor, traza):
+        self.close(abortar=tipo is not None)
+
+
+# Transformación activa en los procesos hijos (heredada con fork, no se serializa)
+_TRANSFORMAR: Optional[Callable] = None
+
+
+def _transformar_lote(lote):
+    return _TRANSFORMAR(lote)
+
+
+def transform_in_processes(lotes: Iterable, transformar: Callable, procesos: int,
+                           en_vuelo: Optional[int] = None) -> Iterator:
+    """transformar(lote) de cada lote en `procesos` procesos, en el orden de entrada
+
+    La función no necesita ser serializable: los procesos se crean con fork y la
+    heredan (incluidos los mapas de claves que tenga en su closure). Sólo viajan
+    los lotes y sus resultados. A lo sumo `en_vuelo` lotes (por defecto
+    2 x procesos) se leen por adelantado. Sin fork disponible, o con un solo
+    proceso, se transforma en el propio proceso. La transformación no debe
+    escribir en conexiones SQLite: los hijos tienen copias de las del padre.
+    """
+    global _TRANSFORMAR
+    if procesos <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for lote in lotes:
+            yield transformar(lote)
+        return
+
+    en_vuelo = en_vuelo or 2 * procesos
+    _TRANSFORMAR = transformar
+    try:
+        # Cada hijo vuelve a sembrar random para no repetir la secuencia del padre
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=random.seed) as pool:
+            pendientes = deque()
+            for lote in lotes:
+                pendientes.append(pool.submit(_transformar_lote, lote))
+                if len(pendientes) >= en_vuelo:
+                    yield pendientes.popleft().result()
+            while pendientes:
+                yield pendientes.popleft().result()
+    finally:
+        _TRANSFORMAR = None
+
+
+def _lotes_sinteticos(filas: int, tamaño_lote: int) -> Iterator[List[int]]:
+    for inicio in range(0, filas, tamaño_lote):
+        yield list(range(inicio, min(filas, inicio + tamaño_lote)))
+
+
+def _transformacion_costosa(lote: List[int]) -> List[tuple]:
+    """Transformación de prueba con trabajo de CPU por fila comparable a un hecho"""
+    filas = []
+    for i in lote:
+        x = float(i)
+        for _ in range(200):
+            x = (x * 1.000001 + 3.0) % 1000003.0
+        filas.append((i, f'clave-{i % 97}', x, i % 3 == 0))
+    return filas
+
+
+def bench(filas: int, procesos: Sequence[int], tamaño_lote: int = 5000) -> List[Dict]:
+    """Tiempo de producir y escribir `filas` filas con distintos números de procesos"""
+    resultados = []
+    for n in procesos:
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'bench.db')
+            conn = sqlite3.connect(ruta)
+            conn.execute('CREATE TABLE T (id INTEGER PRIMARY KEY, clave TEXT, valor REAL, activo BOOLEAN)')
+            conn.close()
+            inicio = time.perf_counter()
+            with SQLiteWriter(ruta) as writer:
+                escritas = writer.write_all(
+                    'INSERT INTO T VALUES (?, ?, ?, ?)',
+                    transform_in_processes(_lotes_sinteticos(filas, tamaño_lote), _transformacion_costosa, n)
+                )
+            segundos = time.perf_counter() - inicio
+            conn = sqlite3.connect(ruta)
+            en_tabla = conn.execute('SELECT COUNT(*) FROM T').fetchone()[0]
+            conn.close()
+        resultados.append({
+            'procesos': n,
+            'filas': escritas,
+            'en_tabla': en_tabla,
+            'segundos': round(segundos, 3),
+            'filas_s': round(escritas / segundos),
+            **{k: round(v, 3) if isinstance(v, float) else v for k, v in writer.estadisticas.items()},
+        })
+    return resultados
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Escritor SQLite con cola y productores en procesos')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_bench = sub.add_parser('bench', help='Medir la ingesta con 1..N procesos productores')
+    p_bench.add_argument('--filas', type=int, default=500000)
+    p_bench.add_argument('--procesos', type=int, nargs='+', default=[1, 2, 4])
+    p_bench.add_argument('--tamaño-lote', type=int, default=5000)
+    args = parser.parse_args()
+
+    for r in bench(args.filas, args.procesos, args.tamaño_lote):
+        logger.info(f"⚙️  {r['procesos']} procesos: {r['filas']} filas en {r['segundos']:.2f} s "
+                    f"({r['filas_s']} filas/s), {r['transacciones']} transacciones, "
+                    f"escritura {r['escritura_s']:.2f} s, espera por cola llena {r['espera_productores_s']:.2f} s")
+        if r['en_tabla'] != r['filas']:
+            logger.error(f"❌ La tabla tiene {r['en_tabla']} filas, se esperaban {r['filas']}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())